@@ -0,0 +1,115 @@
+"""
+增量分析缓存
+
+按文件保存统计结果（计数器、长度草图、分桶、解析失败数），再次分析同一目录时：
+  - 大小和 mtime 都没变的文件直接复用缓存结果，不再读取
+  - 只在末尾追加了内容的文件，只分析新增的字节范围，再与缓存结果合并
+  - 其余情况（被截断、被改写、缓存无效）重新完整分析
+
+追加判定：文件变大，且旧长度末尾 TAIL_HASH_SIZE 字节的哈希与缓存一致，
+且旧内容以换行结尾（否则最后一行可能被续写，不能只分析新增部分）。
+压缩文件无法从中间开始读取，有任何变化都完整分析。
+
+缓存是一个 JSON 文件，默认放在数据目录下的 .analyze_cache.json（隐藏文件，
+不会被当成数据文件）。缓存格式或统计口径变化时递增 CACHE_VERSION，旧缓存自动失效。
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from data_common import is_compressed
+
+CACHE_VERSION = 1
+CACHE_FILENAME = ".analyze_cache.json"
+
+# 用于追加判定的尾部哈希长度
+TAIL_HASH_SIZE = 64 * 1024
+
+
+def tail_signature(filepath: Path, size: int) -> tuple[str, bool]:
+    """文件前 size 字节的尾部签名：(末尾 TAIL_HASH_SIZE 字节的哈希, 是否以换行结尾)"""
+    start = max(0, size - TAIL_HASH_SIZE)
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        tail = f.read(size - start)
+    if len(tail) != size - start:
+        raise OSError(f"文件在读取过程中被截断: {filepath}")
+    digest = hashlib.blake2b(tail, digest_size=16).hexdigest()
+    return digest, tail.endswith(b"\n")
+
+
+class AnalysisCache:
+    """按文件路径保存的统计结果缓存
+
+    每个条目: {"size", "mtime_ns", "tail_hash", "ends_with_newline", "result"}，
+    result 为 AnalysisResult.to_dict() 的输出，由调用方负责序列化。
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: dict[str, dict] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "AnalysisCache":
+        """读取缓存文件；不存在、损坏或版本不符时返回空缓存"""
+        cache = cls(path)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cache
+        if isinstance(data, dict) and data.get("version") == CACHE_VERSION:
+            cache.entries = data.get("files", {})
+        return cache
+
+    @staticmethod
+    def key(filepath: Path) -> str:
+        return str(filepath.resolve())
+
+    def lookup(self, filepath: Path, size: int, mtime_ns: int) -> tuple[dict | None, int]:
+        """查找可复用的结果，返回 (缓存结果, 需要继续分析的起始偏移)
+
+        - (result, size)：文件未变化，无需分析
+        - (result, old_size)：文件只有追加，从 old_size 开始分析新增部分
+        - (None, 0)：没有可用缓存，需要完整分析
+        """
+        entry = self.entries.get(self.key(filepath))
+        if entry is None:
+            return None, 0
+
+        old_size = entry["size"]
+        if size == old_size and mtime_ns == entry["mtime_ns"]:
+            return entry["result"], size
+        if size > old_size and entry["ends_with_newline"] and not is_compressed(filepath):
+            try:
+                digest, _ = tail_signature(filepath, old_size)
+            except OSError:
+                return None, 0
+            if digest == entry["tail_hash"]:
+                return entry["result"], old_size
+        return None, 0
+
+    def store(self, filepath: Path, size: int, mtime_ns: int, result: dict) -> None:
+        """记录文件前 size 字节的统计结果"""
+        digest, ends_with_newline = tail_signature(filepath, size)
+        self.entries[self.key(filepath)] = {
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "tail_hash": digest,
+            "ends_with_newline": ends_with_newline,
+            "result": result,
+        }
+
+    def retain(self, filepaths: list[Path]) -> None:
+        """只保留给定文件的条目（已删除的文件不再占用缓存）"""
+        keep = {self.key(fp) for fp in filepaths}
+        self.entries = {k: v for k, v in self.entries.items() if k in keep}
+
+    def save(self) -> None:
+        """原子写入缓存文件（先写临时文件再替换）"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "files": self.entries}, f)
+        os.replace(tmp_path, self.path)
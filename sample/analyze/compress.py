@@ -0,0 +1,364 @@
+"""
+离线编解码矩阵（--compress）
+
+对每条记录的整行和 bodies[0]（JSON 字节，与长度统计的定义一致）分别用多种编解码器
+压缩、解压并校验，统计：
+  - 压缩率 = 压缩后大小 / 原始大小（与 sdkTest 中 LZ4 日志的 ratio 定义一致，越小越好）
+  - 压缩率分布（LogSketch 估算百分位数），按长度分桶、按 content_type 分别统计
+  - 变小占比：压缩后比原始数据小的记录比例（对应日志中的 compress_ratio_<100%）
+  - 压缩 / 解压吞吐（按原始字节计算的单核 MB/s，整批计时，不含解析开销）
+
+编解码器写作 名称[:级别]：
+  lz4-block   LZ4 块格式，不带长度头（级别 0 为默认快速模式，>0 为 HC 级别）
+  lz4-frame   LZ4 帧格式（级别 0 为默认，>=3 为 HC）
+  zlib        标准库 zlib（默认级别 6）
+  zstd        Zstandard（默认级别 3）
+
+lz4 与 zstd 为可选依赖：uv run --extra compress main.py <目录> --compress
+"""
+
+import time
+import zlib
+from pathlib import Path
+
+from data_common import ProgressCallback, format_bytes, iter_batches, strip_lines
+from fields import extract_content_and_body
+from sketch import LogSketch
+
+try:
+    import lz4.block
+    import lz4.frame
+except ImportError:  # 可选依赖：uv run --extra compress main.py ...
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖：uv run --extra compress main.py ...
+    zstandard = None
+
+# 未指定 --codecs 时评估的编解码器（缺少依赖的会被跳过）
+DEFAULT_CODECS = ["lz4-block", "lz4-frame", "zlib:6", "zstd:3"]
+
+# 编解码器名称 -> 默认级别
+CODEC_LEVELS = {"lz4-block": 0, "lz4-frame": 0, "zlib": 6, "zstd": 3}
+
+# 压缩对象 -> 显示名称
+TARGETS = {"line": "整行", "body": "bodies[0]"}
+
+PARSE_ERROR_LABEL = "(解析失败)"
+
+
+class CodecError(Exception):
+    """编解码器名称有误或缺少依赖（由 main 打印后退出）"""
+
+
+class Codec:
+    """一个编解码器配置：compress(data) / decompress(data, 原始大小)"""
+
+    def __init__(self, spec: str) -> None:
+        name, sep, level_str = spec.strip().partition(":")
+        if name not in CODEC_LEVELS:
+            raise CodecError(f"未知编解码器: {name}（可选: {', '.join(CODEC_LEVELS)}）")
+        try:
+            level = int(level_str) if sep else CODEC_LEVELS[name]
+        except ValueError:
+            raise CodecError(f"编解码器级别必须是整数: {spec}") from None
+
+        self.name = name
+        self.level = level
+        self.label = name if name.startswith("lz4") and level == 0 else f"{name}:{level}"
+
+        if name.startswith("lz4") and lz4 is None:
+            raise CodecError(f"{name} 需要 lz4，请使用: uv run --extra compress main.py ...")
+        if name == "zstd" and zstandard is None:
+            raise CodecError("zstd 需要 zstandard，请使用: uv run --extra compress main.py ...")
+
+        if name == "lz4-block":
+            if level > 0:
+                self.compress = lambda d: lz4.block.compress(
+                    d, mode="high_compression", compression=level, store_size=False
+                )
+            else:
+                self.compress = lambda d: lz4.block.compress(d, store_size=False)
+            self.decompress = lambda c, n: lz4.block.decompress(c, uncompressed_size=n)
+        elif name == "lz4-frame":
+            self.compress = lambda d: lz4.frame.compress(d, compression_level=level)
+            self.decompress = lambda c, n: lz4.frame.decompress(c)
+        elif name == "zlib":
+            self.compress = lambda d: zlib.compress(d, level)
+            self.decompress = lambda c, n: zlib.decompress(c)
+        else:
+            compressor = zstandard.ZstdCompressor(level=level)
+            decompressor = zstandard.ZstdDecompressor()
+            self.compress = compressor.compress
+            self.decompress = lambda c, n: decompressor.decompress(c)
+
+
+def resolve_codecs(specs: list[str] | None) -> tuple[list[str], list[str]]:
+    """检查编解码器配置，返回 (可用的配置, 因缺少依赖而跳过的配置)
+
+    specs 为 None 时使用 DEFAULT_CODECS，缺少依赖的静默跳过；显式指定的缺依赖则报错。
+    """
+    if specs is not None:
+        # 去掉重复的配置（例如 zlib 与 zlib:6）
+        unique = {Codec(spec).label: spec for spec in specs}
+        return list(unique.values()), []
+    available, skipped = [], []
+    for spec in DEFAULT_CODECS:
+        try:
+            Codec(spec)
+        except CodecError:
+            skipped.append(spec)
+        else:
+            available.append(spec)
+    return available, skipped
+
+
+class RatioStats:
+    """一组记录的压缩结果：总大小、变小的记录数、压缩率分布
+
+    压缩率以万分之一为单位取整后放入草图（小于 65536 的整数走查表路径），
+    取整误差远小于草图本身 1% 的相对误差。
+    """
+
+    def __init__(self) -> None:
+        self.records = 0
+        self.original = 0
+        self.compressed = 0
+        self.shrunk = 0
+        self.sketch = LogSketch()
+
+    def add(self, original: int, compressed: int) -> None:
+        self.records += 1
+        self.original += original
+        self.compressed += compressed
+        if compressed < original:
+            self.shrunk += 1
+        self.sketch.add((compressed * 20000 + original) // (2 * original))
+
+    def merge(self, other: "RatioStats") -> None:
+        self.records += other.records
+        self.original += other.original
+        self.compressed += other.compressed
+        self.shrunk += other.shrunk
+        self.sketch.merge(other.sketch)
+
+    def total_ratio(self) -> float:
+        """按总字节计算的压缩率 (%)"""
+        return self.compressed / self.original * 100 if self.original else 0.0
+
+    def ratio_percentile(self, p: float) -> float:
+        """压缩率的第 p 百分位数 (%)"""
+        return self.sketch.quantile(p / 100) / 100
+
+
+def _merged(cells) -> RatioStats:
+    merged = RatioStats()
+    for cell in cells:
+        merged.merge(cell)
+    return merged
+
+
+class CodecStats:
+    """一个编解码器在一种压缩对象上的统计
+
+    每条记录只计入一个 (长度分桶, content_type) 单元格；总体、按桶、按 content_type
+    的结果在报告时由单元格合并得到。
+    """
+
+    def __init__(self) -> None:
+        self.cells: dict[tuple[str, str], RatioStats] = {}
+        self.compress_seconds = 0.0
+        self.decompress_seconds = 0.0
+        self.mismatches = 0
+
+    def add_batch(
+        self,
+        codec: Codec,
+        items: list[bytes],
+        content_types: list[str],
+        buckets: list[tuple[float, str]],
+    ) -> None:
+        """整批压缩、解压（分别计时）并校验往返结果"""
+        compress = codec.compress
+        decompress = codec.decompress
+        sizes = [len(d) for d in items]
+
+        t0 = time.perf_counter()
+        packed = [compress(d) for d in items]
+        t1 = time.perf_counter()
+        restored = [decompress(c, n) for c, n in zip(packed, sizes)]
+        t2 = time.perf_counter()
+        self.compress_seconds += t1 - t0
+        self.decompress_seconds += t2 - t1
+        if restored != items:
+            self.mismatches += sum(a != b for a, b in zip(restored, items))
+
+        cells = self.cells
+        for n, c, ct in zip(sizes, packed, content_types):
+            for boundary, label in buckets:
+                if n < boundary:
+                    break
+            cell = cells.get((label, ct))
+            if cell is None:
+                cell = cells[(label, ct)] = RatioStats()
+            cell.add(n, len(c))
+
+    def merge(self, other: "CodecStats") -> None:
+        for key, cell in other.cells.items():
+            self.cells.setdefault(key, RatioStats()).merge(cell)
+        self.compress_seconds += other.compress_seconds
+        self.decompress_seconds += other.decompress_seconds
+        self.mismatches += other.mismatches
+
+    def overall(self) -> RatioStats:
+        return _merged(self.cells.values())
+
+    def by_bucket(self) -> dict[str, RatioStats]:
+        groups: dict[str, list[RatioStats]] = {}
+        for (bucket, _), cell in self.cells.items():
+            groups.setdefault(bucket, []).append(cell)
+        return {bucket: _merged(cells) for bucket, cells in groups.items()}
+
+    def by_content_type(self) -> dict[str, RatioStats]:
+        """按 content_type 合并，键的顺序为首次出现顺序"""
+        groups: dict[str, list[RatioStats]] = {}
+        for (_, ct), cell in self.cells.items():
+            groups.setdefault(ct, []).append(cell)
+        return {ct: _merged(cells) for ct, cells in groups.items()}
+
+
+class CompressResult:
+    """一个分片（或整个目录）的编解码矩阵结果"""
+
+    def __init__(self, codec_labels: list[str]) -> None:
+        self.codec_labels = codec_labels
+        self.records = 0
+        self.parse_errors = 0
+        # (编解码器, 压缩对象) -> 统计
+        self.stats = {
+            (label, target): CodecStats() for label in codec_labels for target in TARGETS
+        }
+
+    def merge(self, other: "CompressResult") -> None:
+        self.records += other.records
+        self.parse_errors += other.parse_errors
+        for key, stats in other.stats.items():
+            self.stats[key].merge(stats)
+
+
+def evaluate_shard(
+    filepath: Path,
+    start: int,
+    end: int,
+    codec_specs: list[str],
+    buckets: list[tuple[float, str]],
+    progress: ProgressCallback | None = None,
+) -> CompressResult:
+    """对 [start, end) 范围内的每条记录跑一遍所有编解码器（分片规则同 analyze_shard）"""
+    codecs = [Codec(spec) for spec in codec_specs]
+    result = CompressResult([codec.label for codec in codecs])
+
+    for _, lines in iter_batches(filepath, start, end, progress):
+        items: dict[str, list[bytes]] = {target: [] for target in TARGETS}
+        content_types: dict[str, list[str]] = {target: [] for target in TARGETS}
+        for stripped in strip_lines(lines):
+            fields = extract_content_and_body(stripped)
+            if fields is None:
+                result.parse_errors += 1
+                ct, body = PARSE_ERROR_LABEL, None
+            else:
+                ct, body = fields
+            items["line"].append(stripped)
+            content_types["line"].append(ct)
+            if body:
+                items["body"].append(body)
+                content_types["body"].append(ct)
+        result.records += len(items["line"])
+
+        for codec in codecs:
+            for target, data in items.items():
+                if data:
+                    result.stats[(codec.label, target)].add_batch(
+                        codec, data, content_types[target], buckets
+                    )
+    return result
+
+
+def _mb_per_second(n_bytes: int, seconds: float) -> str:
+    if seconds <= 0:
+        return "-"
+    return f"{n_bytes / seconds / (1024 * 1024):.1f}"
+
+
+def _ratio_cell(stats: RatioStats | None) -> str:
+    """分组表格中的单元格：总压缩率 / P50"""
+    if stats is None or stats.records == 0:
+        return "-"
+    return f"{stats.total_ratio():.1f}%/{stats.ratio_percentile(50):.1f}%"
+
+
+def print_compress_report(
+    result: CompressResult,
+    buckets: list[tuple[float, str]],
+    percentiles: list[float],
+) -> None:
+    print("=" * 60)
+    print("  🗜️  编解码矩阵报告")
+    print("=" * 60)
+    print(f"\n  记录数: {result.records:,}    解析失败: {result.parse_errors}")
+    print("  压缩率 = 压缩后 / 原始（越小越好）；吞吐为单核 MB/s（按原始字节计）")
+
+    labels = result.codec_labels
+    for target, target_name in TARGETS.items():
+        codec_stats = [result.stats[(label, target)] for label in labels]
+        overall = [stats.overall() for stats in codec_stats]
+        by_bucket = [stats.by_bucket() for stats in codec_stats]
+        by_content_type = [stats.by_content_type() for stats in codec_stats]
+
+        # 总览
+        print(f"\n{'── ' + target_name + ' 总览 ──':─^56}")
+        pct_header = "".join(f" {'P' + format(p, 'g'):>7}" for p in percentiles)
+        print(
+            f"  {'编解码器':<12} {'原始大小':>10} {'压缩后':>10} {'总压缩率':>8}{pct_header}"
+            f" {'变小占比':>8} {'压缩MB/s':>9} {'解压MB/s':>9}"
+        )
+        for label, stats, o in zip(labels, codec_stats, overall):
+            if o.records == 0:
+                continue
+            pct_cells = "".join(f" {o.ratio_percentile(p):>6.1f}%" for p in percentiles)
+            print(
+                f"  {label:<12} {format_bytes(o.original):>10} {format_bytes(o.compressed):>10}"
+                f" {o.total_ratio():>7.1f}%{pct_cells} {o.shrunk / o.records * 100:>7.1f}%"
+                f" {_mb_per_second(o.original, stats.compress_seconds):>9}"
+                f" {_mb_per_second(o.original, stats.decompress_seconds):>9}"
+            )
+            if stats.mismatches:
+                print(f"  ⚠️  {label}: {stats.mismatches} 条记录解压后与原始数据不一致")
+
+        # 按长度分桶
+        print(f"\n{'── ' + target_name + ' 按长度分桶（总压缩率/P50）──':─^48}")
+        header = "".join(f" {label:>16}" for label in labels)
+        print(f"  {'桶':<12} {'数量':>8}{header}")
+        for _, bucket in buckets:
+            per_codec = [groups.get(bucket) for groups in by_bucket]
+            count = next((s.records for s in per_codec if s is not None), 0)
+            if count == 0:
+                continue
+            cells = "".join(f" {_ratio_cell(s):>16}" for s in per_codec)
+            print(f"  {bucket:<12} {count:>8,}{cells}")
+
+        # 按 content_type
+        print(f"\n{'── ' + target_name + ' 按 content_type（总压缩率/P50）──':─^44}")
+        print(f"  {'content_type':<30} {'数量':>8}{header}")
+        first = by_content_type[0] if labels else {}
+        for ct, ct_stats in sorted(first.items(), key=lambda kv: -kv[1].records):
+            cells = "".join(f" {_ratio_cell(groups.get(ct)):>16}" for groups in by_content_type)
+            print(f"  {str(ct)[:30]:<30} {ct_stats.records:>8,}{cells}")
+
+    print()
+    print("  注: 百分位数为草图估计值，相对误差 ≤ 1%")
+    print()
+    print("=" * 60)
+    print("  分析完成 ✅")
+    print("=" * 60)
@@ -0,0 +1,39 @@
+"""
+记录字段提取：content_type / chat_type / bodies[0].type / bodies[0] 字节长度
+
+整行解析与 bodies[0] 长度的实现在公共模块 data_common.records 中（sampler 的分片清单使用同一定义）。
+"""
+
+from data_common import body_bytes, body_json_bytes, loads_record
+
+# (content_type, chat_type, bodies[0].type, bodies[0] 字节长度)
+RecordFields = tuple[str, str, str, int]
+
+
+def extract_content_and_body(line: bytes) -> tuple[str, bytes | None] | None:
+    """提取 content_type 和 bodies[0] 的 JSON 字节（没有 body 时为 None），解析失败返回 None"""
+    try:
+        record = loads_record(line)
+    except ValueError:
+        return None
+    bodies = record.get("payload", {}).get("bodies", [])
+    body = body_json_bytes(bodies[0]) if bodies else None
+    return record.get("content_type", "unknown"), body
+
+
+def extract_fields(line: bytes) -> RecordFields | None:
+    """从一行（已去除首尾空白）中提取统计字段，JSON 解析失败返回 None"""
+    try:
+        record = loads_record(line)
+    except ValueError:
+        return None
+
+    ct = record.get("content_type", "unknown")
+    chat_t = record.get("chat_type", "unknown")
+
+    payload = record.get("payload", {})
+    bodies = payload.get("bodies", [])
+    if bodies:
+        body = bodies[0]
+        return ct, chat_t, body.get("type", "unknown"), body_bytes(body)
+    return ct, chat_t, "(empty)", 0
@@ -0,0 +1,145 @@
+"""
+逐条记录的列式特征索引
+
+分析时（--build-index）为每条有效行记录一行特征，按列存成定长二进制数组：
+
+    file_id       uint32  文件序号（对应 meta.json 中的 files 列表）
+    offset        uint64  行首在文件中的字节偏移
+    line_len      uint32  整行字节长度（去除首尾空白后）
+    body_len      uint32  bodies[0] 字节长度（解析失败为 0）
+    content_type  uint16  取值编号（对应 meta.json 中的 vocab）
+    chat_type     uint16
+    body_type     uint16
+
+每列一个 <列名>.bin 文件，内容就是连续的定长整数（字节序见 meta.json），可以直接 mmap（numpy.memmap）
+后做向量化查询，无需再扫描原始 JSON。meta.json 记录列类型、取值表和建索引时的文件状态。
+
+写索引只用标准库 array，查询（query.py）需要 numpy。
+"""
+
+import json
+import sys
+from array import array
+from pathlib import Path
+
+from fields import RecordFields
+
+INDEX_VERSION = 1
+INDEX_DIRNAME = ".analyze_index"
+META_FILENAME = "meta.json"
+
+# 列名 -> array 类型码
+COLUMNS = {
+    "file_id": "I",
+    "offset": "Q",
+    "line_len": "I",
+    "body_len": "I",
+    "content_type": "H",
+    "chat_type": "H",
+    "body_type": "H",
+}
+
+# 需要编号的分类字段（顺序与 RecordFields 前三项一致）
+CATEGORY_FIELDS = ("content_type", "chat_type", "body_type")
+
+# 解析失败的行在分类列中的编号
+PARSE_ERROR_ID = 0xFFFF
+
+
+def _dtype(typecode: str) -> str:
+    """array 类型码对应的 numpy dtype 字符串，例如 'I' -> '<u4'"""
+    order = "<" if sys.byteorder == "little" else ">"
+    return f"{order}u{array(typecode).itemsize}"
+
+
+class RecordIndex:
+    """按列收集记录特征；分类字段在本地编号，合并时统一重新编号"""
+
+    def __init__(self) -> None:
+        self.columns = {name: array(code) for name, code in COLUMNS.items()}
+        # 字段 -> {取值: 编号}，编号按首次出现顺序分配
+        self.vocabs: dict[str, dict] = {field: {} for field in CATEGORY_FIELDS}
+
+    def __len__(self) -> int:
+        return len(self.columns["offset"])
+
+    def _intern(self, field: str, value) -> int:
+        vocab = self.vocabs[field]
+        idx = vocab.get(value)
+        if idx is None:
+            idx = len(vocab)
+            if idx >= PARSE_ERROR_ID:
+                raise ValueError(f"{field} 取值种类过多（超过 {PARSE_ERROR_ID} 种）")
+            vocab[value] = idx
+        return idx
+
+    def append(
+        self, file_id: int, offset: int, line_len: int, fields: RecordFields | None
+    ) -> None:
+        c = self.columns
+        c["file_id"].append(file_id)
+        c["offset"].append(offset)
+        c["line_len"].append(line_len)
+        if fields is None:
+            c["body_len"].append(0)
+            c["content_type"].append(PARSE_ERROR_ID)
+            c["chat_type"].append(PARSE_ERROR_ID)
+            c["body_type"].append(PARSE_ERROR_ID)
+            return
+        ct, chat_t, body_type, body_bytes = fields
+        c["body_len"].append(body_bytes)
+        c["content_type"].append(self._intern("content_type", ct))
+        c["chat_type"].append(self._intern("chat_type", chat_t))
+        c["body_type"].append(self._intern("body_type", body_type))
+
+    def truncate(self, n: int) -> None:
+        """丢弃第 n 行之后的记录（文件读取失败时回滚）
+
+        取值表不回滚：多出的编号不会被引用，只是在查询结果中计数为 0 而被忽略。
+        """
+        for col in self.columns.values():
+            del col[n:]
+
+    def extend(self, other: "RecordIndex") -> None:
+        """追加另一个分片的记录，分类编号映射到本索引的取值表"""
+        for name in ("file_id", "offset", "line_len", "body_len"):
+            self.columns[name].extend(other.columns[name])
+        for field in CATEGORY_FIELDS:
+            mapping = {
+                local_id: self._intern(field, value)
+                for value, local_id in other.vocabs[field].items()
+            }
+            col = other.columns[field]
+            if all(k == v for k, v in mapping.items()):
+                self.columns[field].extend(col)
+            else:
+                mapping[PARSE_ERROR_ID] = PARSE_ERROR_ID
+                self.columns[field].extend(array("H", map(mapping.__getitem__, col)))
+
+    def write(self, index_dir: Path, data_files: list[Path], file_stats: dict) -> None:
+        """写入索引目录：各列 .bin 文件，最后写 meta.json（没有 meta.json 的目录视为不完整）"""
+        index_dir.mkdir(parents=True, exist_ok=True)
+        meta_path = index_dir / META_FILENAME
+        meta_path.unlink(missing_ok=True)
+
+        for name, col in self.columns.items():
+            with open(index_dir / f"{name}.bin", "wb") as f:
+                col.tofile(f)
+
+        meta = {
+            "version": INDEX_VERSION,
+            "records": len(self),
+            "parse_error_id": PARSE_ERROR_ID,
+            "columns": {name: _dtype(code) for name, code in COLUMNS.items()},
+            "vocab": {field: list(vocab) for field, vocab in self.vocabs.items()},
+            "files": [
+                {
+                    "name": fp.name,
+                    "size": file_stats[fp].st_size,
+                    "mtime_ns": file_stats[fp].st_mtime_ns,
+                }
+                for fp in data_files
+            ],
+        }
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
@@ -6,47 +6,80 @@ IM 数据分析工具
 每行一条 JSON 记录，用于了解数据分布，为后续抽样提供依据。
 
 用法:
-    uv run main.py <数据文件夹路径>
+    uv run main.py <数据文件夹路径> [选项]
+
+示例:
+    uv run main.py ../../sdkTest/tmp
+    uv run main.py ../../sdkTest/tmp --workers 8
+    uv run main.py ../../sdkTest/tmp --sample 10000
+    uv run main.py ../sampler/output --manifest
 """
 
-import json
-import math
 import os
+import random
 import sys
-import time
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
 from pathlib import Path
 
+from cache import CACHE_FILENAME, AnalysisCache
+from compress import (
+    Codec,
+    CodecError,
+    CompressResult,
+    evaluate_shard,
+    print_compress_report,
+    resolve_codecs,
+)
+from data_common import (
+    BUCKET_BOUNDARIES,
+    JSON_BACKEND,
+    LINE_INDEX_DIRNAME,
+    LineIndex,
+    LineIndexError,
+    MANIFEST_FILENAME,
+    ManifestError,
+    Metrics,
+    Profiler,
+    ProgressCallback,
+    SelectionError,
+    Throttle,
+    find_selection,
+    format_bytes,
+    get_data_files,
+    is_compressed,
+    iter_batches,
+    load_manifest,
+    load_selection,
+    missing_packages,
+    strip_line,
+    strip_lines,
+)
+from fields import RecordFields, extract_fields
+from index import INDEX_DIRNAME, RecordIndex
+from query import QueryError, parse_where, run_query
+from sketch import LogSketch
+
 
-# ── 长度分桶定义 ──
-BUCKET_BOUNDARIES = [
-    (200, "<200B"),
-    (500, "200-500B"),
-    (1024, "500B-1KB"),
-    (5120, "1-5KB"),
-    (float("inf"), ">5KB"),
-]
+# 报告中默认输出的百分位数（可通过 --percentiles 修改）
+DEFAULT_PERCENTILES = [50.0, 90.0, 99.0]
 
-# 用于近似百分位数的细粒度分桶（以字节为单位的对数分桶）
-HIST_BOUNDARIES: list[int] = []
-_v = 1
-while _v <= 100_000_000:  # 最大 ~100MB 每行
-    HIST_BOUNDARIES.append(_v)
-    # 按 ~1.5 倍递增，覆盖从 1B 到 100MB
-    _v = max(_v + 1, int(_v * 1.5))
-HIST_BOUNDARIES.append(int(1e18))  # 哨兵
+# 并行模式下每个分片的最小字节数（太小的分片调度开销大于收益）
+MIN_SHARD_SIZE = 8 * 1024 * 1024
+# 每个 worker 平均分到的分片数，多切几片便于负载均衡
+SHARDS_PER_WORKER = 4
 
 
 class StreamingStats:
-    """流式统计：不保存全量数据，使用分桶近似百分位数"""
+    """流式统计：不保存全量数据，使用 LogSketch 估算百分位数（相对误差有保证）"""
 
     def __init__(self) -> None:
         self.count = 0
         self.total = 0
         self.min_val = float("inf")
         self.max_val = 0
-        # 对数分桶直方图
-        self.hist: list[int] = [0] * len(HIST_BOUNDARIES)
+        self.sketch = LogSketch()
 
     def add(self, value: int) -> None:
         self.count += 1
@@ -55,155 +88,434 @@ class StreamingStats:
             self.min_val = value
         if value > self.max_val:
             self.max_val = value
-        # 放入直方图桶
-        for i, boundary in enumerate(HIST_BOUNDARIES):
-            if value < boundary:
-                self.hist[i] += 1
-                break
+        self.sketch.add(value)
+
+    def merge(self, other: "StreamingStats") -> None:
+        """合并另一个 StreamingStats（用于并行分片结果汇总）"""
+        self.count += other.count
+        self.total += other.total
+        if other.min_val < self.min_val:
+            self.min_val = other.min_val
+        if other.max_val > self.max_val:
+            self.max_val = other.max_val
+        self.sketch.merge(other.sketch)
 
     def avg(self) -> float:
         return self.total / self.count if self.count else 0
 
     def percentile(self, p: float) -> float:
-        """从直方图近似计算第 p 百分位数 (0-100)"""
+        """第 p 百分位数 (0-100)，相对误差不超过 sketch.relative_accuracy"""
         if self.count == 0:
             return 0.0
-        target = self.count * p / 100.0
-        cumulative = 0
-        for i, c in enumerate(self.hist):
-            cumulative += c
-            if cumulative >= target:
-                # 返回该桶的上界作为近似值
-                return float(HIST_BOUNDARIES[i])
-        return float(self.max_val)
-
-
-def format_bytes(n: float) -> str:
-    """格式化字节数为可读字符串"""
-    if n < 1024:
-        return f"{n:.0f} B"
-    elif n < 1024 * 1024:
-        return f"{n / 1024:.1f} KB"
-    else:
-        return f"{n / (1024 * 1024):.2f} MB"
+        estimate = self.sketch.quantile(p / 100.0)
+        # 草图代表值可能略超出真实范围，用精确的 min/max 截断
+        return float(min(max(estimate, self.min_val), self.max_val))
 
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min_val if self.count else None,
+            "max": self.max_val,
+            "sketch": self.sketch.to_dict(),
+        }
 
-def get_data_files(dir_path: Path) -> list[Path]:
-    """获取文件夹下所有数据文件（排除隐藏文件）"""
-    files = []
-    for entry in sorted(dir_path.iterdir()):
-        if entry.is_file() and not entry.name.startswith("."):
-            files.append(entry)
-    return files
+    @classmethod
+    def from_dict(cls, data: dict) -> "StreamingStats":
+        stats = cls()
+        stats.count = data["count"]
+        stats.total = data["total"]
+        stats.min_val = data["min"] if data["min"] is not None else float("inf")
+        stats.max_val = data["max"]
+        stats.sketch = LogSketch.from_dict(data["sketch"])
+        return stats
 
 
-def analyze_directory(dirpath: str) -> None:
-    dir_path = Path(dirpath)
-    if not dir_path.exists():
-        print(f"❌ 路径不存在: {dirpath}")
-        sys.exit(1)
-    if not dir_path.is_dir():
-        print(f"❌ 不是文件夹: {dirpath}")
-        sys.exit(1)
+class AnalysisResult:
+    """一个分片（或整个目录）的统计结果，可与其他分片结果合并"""
 
-    data_files = get_data_files(dir_path)
-    if not data_files:
-        print(f"❌ 文件夹中没有数据文件: {dirpath}")
-        sys.exit(1)
+    def __init__(self) -> None:
+        self.total_lines = 0
+        self.parse_errors = 0
+        self.body_type_counter: Counter[str] = Counter()
+        self.content_type_counter: Counter[str] = Counter()
+        self.chat_type_counter: Counter[str] = Counter()
+        self.bucket_counts: Counter[str] = Counter()
+        self.line_stats = StreamingStats()
+        self.body_stats = StreamingStats()
 
-    # 计算总文件大小（用于进度显示）
-    total_file_size = sum(f.stat().st_size for f in data_files)
+    def add_line(self, line: bytes) -> RecordFields | None:
+        """统计一行（已去除首尾空白的非空行），返回提取出的字段（解析失败为 None）"""
+        self.total_lines += 1
+        line_bytes = len(line)
 
-    # 统计容器
-    total_lines = 0
-    parse_errors = 0
-    body_type_counter: Counter[str] = Counter()
-    content_type_counter: Counter[str] = Counter()
-    chat_type_counter: Counter[str] = Counter()
-    bucket_counts: Counter[str] = Counter()
-    line_stats = StreamingStats()
-    body_stats = StreamingStats()
+        # 流式统计
+        self.line_stats.add(line_bytes)
 
-    print(f"📂 分析目录: {dirpath}")
-    print(f"📄 数据文件: {len(data_files)} 个")
-    print(f"📦 总大小: {format_bytes(total_file_size)}")
-    print()
+        # 行长度分桶
+        for boundary, label in BUCKET_BOUNDARIES:
+            if line_bytes < boundary:
+                self.bucket_counts[label] += 1
+                break
+
+        fields = extract_fields(line)
+        if fields is None:
+            self.parse_errors += 1
+            return None
+
+        ct, chat_t, body_type, body_bytes = fields
+        self.content_type_counter[ct] += 1
+        self.chat_type_counter[chat_t] += 1
+        self.body_type_counter[body_type] += 1
+        self.body_stats.add(body_bytes)
+        return fields
+
+    def merge(self, other: "AnalysisResult") -> None:
+        """合并另一个分片的结果
+
+        按分片顺序依次合并时，Counter 中键的插入顺序与串行遍历一致，
+        因此 most_common() 对同频项的排序也与串行结果相同。
+        """
+        self.total_lines += other.total_lines
+        self.parse_errors += other.parse_errors
+        self.body_type_counter.update(other.body_type_counter)
+        self.content_type_counter.update(other.content_type_counter)
+        self.chat_type_counter.update(other.chat_type_counter)
+        self.bucket_counts.update(other.bucket_counts)
+        self.line_stats.merge(other.line_stats)
+        self.body_stats.merge(other.body_stats)
+
+    def to_dict(self) -> dict:
+        """输出纯 JSON 结构（用于增量缓存）
+
+        计数器保存为 [键, 数量] 列表，保留键的类型和插入顺序。
+        """
+        return {
+            "total_lines": self.total_lines,
+            "parse_errors": self.parse_errors,
+            "body_type": list(self.body_type_counter.items()),
+            "content_type": list(self.content_type_counter.items()),
+            "chat_type": list(self.chat_type_counter.items()),
+            "buckets": list(self.bucket_counts.items()),
+            "line_stats": self.line_stats.to_dict(),
+            "body_stats": self.body_stats.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AnalysisResult":
+        result = cls()
+        result.total_lines = data["total_lines"]
+        result.parse_errors = data["parse_errors"]
+        result.body_type_counter = Counter(dict(data["body_type"]))
+        result.content_type_counter = Counter(dict(data["content_type"]))
+        result.chat_type_counter = Counter(dict(data["chat_type"]))
+        result.bucket_counts = Counter(dict(data["buckets"]))
+        result.line_stats = StreamingStats.from_dict(data["line_stats"])
+        result.body_stats = StreamingStats.from_dict(data["body_stats"])
+        return result
+
+
+# (文件, 起始偏移, 结束偏移)
+ByteRange = tuple[Path, int, int]
+
+
+def plan_shards(ranges: list[ByteRange], workers: int) -> list[ByteRange]:
+    """将待分析的字节范围切成若干分片
+
+    分片大小约为 总字节数 / (workers * SHARDS_PER_WORKER)，且不小于 MIN_SHARD_SIZE；
+    小范围整体作为一个分片。分片边界不必落在换行处，由 analyze_shard 对齐。
+    压缩文件无法从中间读取，整个文件作为一个分片。
+    """
+    total_size = sum(end - start for _, start, end in ranges)
+    shard_size = max(MIN_SHARD_SIZE, total_size // max(1, workers * SHARDS_PER_WORKER))
+
+    shards = []
+    for fp, range_start, range_end in ranges:
+        if is_compressed(fp):
+            shards.append((fp, range_start, range_end))
+            continue
+        start = range_start
+        while True:
+            end = min(start + shard_size, range_end)
+            # 末尾不足半个分片的部分并入当前分片，避免产生碎片
+            if range_end - end < shard_size // 2:
+                end = range_end
+            shards.append((fp, start, end))
+            if end >= range_end:
+                break
+            start = end
+    return shards
+
+
+def analyze_shard(
+    filepath: Path,
+    start: int,
+    end: int,
+    result: AnalysisResult | None = None,
+    progress: ProgressCallback | None = None,
+    index: RecordIndex | None = None,
+    file_id: int = 0,
+    metrics: Metrics | None = None,
+) -> AnalysisResult:
+    """统计文件中 [start, end) 字节范围内的所有行（分片规则见 data_common.reader）
+
+    result 为 None 时新建一个结果；progress(当前文件偏移) 最多每秒调用一次。
+    index 不为 None 时，同时把每条记录的特征追加到索引中（file_id 为文件序号）。
+    metrics 不为 None 时按批计时：取下一批计入 read，处理一批（解析与计数）计入 parse。
+    """
+    if result is None:
+        result = AnalysisResult()
+    add_line = result.add_line
+    batches = iter_batches(filepath, start, end, progress)
+    if metrics is not None:
+        batches = metrics.timed("read", batches, body="parse")
+
+    if index is None:
+        for _, lines in batches:
+            for stripped in strip_lines(lines):
+                add_line(stripped)
+        return result
+
+    # 建索引时需要每行的偏移，逐行累加
+    append = index.append
+    for offset, lines in batches:
+        for line in lines:
+            stripped = strip_line(line)
+            if stripped:
+                append(file_id, offset, len(stripped), add_line(stripped))
+            offset += len(line) + 1
+    return result
 
-    bytes_read = 0
-    last_progress_time = time.time()
 
-    for file_idx, filepath in enumerate(data_files):
+def analyze_shard_indexed(
+    filepath: Path, start: int, end: int, file_id: int
+) -> tuple[AnalysisResult, RecordIndex]:
+    """analyze_shard 的建索引版本（供进程池调用）"""
+    index = RecordIndex()
+    result = analyze_shard(filepath, start, end, index=index, file_id=file_id)
+    return result, index
+
+
+def run_serial(
+    ranges: list[ByteRange],
+    total_bytes: int,
+    index: RecordIndex | None = None,
+    file_ids: dict[Path, int] | None = None,
+    metrics: Metrics | None = None,
+) -> dict[Path, AnalysisResult]:
+    """单进程逐个范围统计，返回每个文件的结果（无法读取的文件不在其中）
+
+    index 不为 None 时同时建索引，file_ids 为 文件 -> 文件序号。
+    """
+    results: dict[Path, AnalysisResult] = {}
+    failed_files: set[Path] = set()
+    bytes_done = 0
+    lines_done = 0
+
+    for idx, (filepath, start, end) in enumerate(ranges):
+        if filepath in failed_files:
+            continue
+        file_result = AnalysisResult()
+
+        def on_progress(offset: int) -> None:
+            done = bytes_done + offset - start
+            pct = done / total_bytes * 100 if total_bytes else 0
+            print(
+                f"\r  ⏳ 进度: {pct:.1f}% | "
+                f"文件 {idx + 1}/{len(ranges)} | "
+                f"已处理 {lines_done + file_result.total_lines:,} 行",
+                end="",
+                flush=True,
+            )
+
+        index_rows = len(index) if index is not None else 0
         try:
-            f = open(filepath, "r", encoding="utf-8")
-        except (OSError, FileNotFoundError):
+            analyze_shard(
+                filepath,
+                start,
+                end,
+                file_result,
+                on_progress,
+                index,
+                file_ids[filepath] if file_ids is not None else 0,
+                metrics,
+            )
+        except OSError:
             print(f"  ⚠️  无法打开文件: {filepath.name}，跳过")
+            if index is not None:
+                index.truncate(index_rows)
+            # 同一文件的多段（选择清单）与并行模式一致：有一段失败就整体跳过
+            failed_files.add(filepath)
+            results.pop(filepath, None)
             continue
+        results.setdefault(filepath, AnalysisResult()).merge(file_result)
+        bytes_done += end - start
+        lines_done += file_result.total_lines
 
-        with f:
-            for raw_line in f:
-                stripped = raw_line.strip()
-                if not stripped:
-                    continue
+    return results
 
-                total_lines += 1
-                line_bytes = len(stripped.encode("utf-8"))
-                bytes_read += line_bytes + 1  # +1 换行符
 
-                # 流式统计
-                line_stats.add(line_bytes)
+def run_parallel(
+    ranges: list[ByteRange],
+    total_bytes: int,
+    workers: int,
+    index: RecordIndex | None = None,
+    file_ids: dict[Path, int] | None = None,
+) -> dict[Path, AnalysisResult]:
+    """多进程按字节范围分片统计，每个文件的分片按顺序合并，与串行结果一致
 
-                # 行长度分桶
-                for boundary, label in BUCKET_BOUNDARIES:
-                    if line_bytes < boundary:
-                        bucket_counts[label] += 1
-                        break
+    index 不为 None 时各分片分别建索引，最后按分片顺序追加到 index 中。
+    """
+    shards = plan_shards(ranges, workers)
+    print(f"🧵 并行模式: {workers} 个进程，{len(shards)} 个分片\n")
 
-                # 解析 JSON
+    shard_results: list[AnalysisResult | None] = [None] * len(shards)
+    shard_indexes: list[RecordIndex | None] = [None] * len(shards)
+    failed_files: set[Path] = set()
+    bytes_done = 0
+    lines_done = 0
+    throttle = Throttle()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if index is None:
+            futures = {
+                pool.submit(analyze_shard, fp, start, end): idx
+                for idx, (fp, start, end) in enumerate(shards)
+            }
+        else:
+            futures = {
+                pool.submit(analyze_shard_indexed, fp, start, end, file_ids[fp]): idx
+                for idx, (fp, start, end) in enumerate(shards)
+            }
+        for done_count, future in enumerate(as_completed(futures), 1):
+            idx = futures[future]
+            fp, start, end = shards[idx]
+            try:
+                if index is None:
+                    shard_results[idx] = future.result()
+                else:
+                    shard_results[idx], shard_indexes[idx] = future.result()
+            except OSError:
+                if fp not in failed_files:
+                    failed_files.add(fp)
+                    print(f"\r  ⚠️  无法打开文件: {fp.name}，跳过")
+                continue
+
+            bytes_done += end - start
+            lines_done += shard_results[idx].total_lines
+            if throttle.ready():
+                pct = bytes_done / total_bytes * 100 if total_bytes else 0
+                print(
+                    f"\r  ⏳ 进度: {pct:.1f}% | "
+                    f"分片 {done_count}/{len(shards)} | "
+                    f"已处理 {lines_done:,} 行",
+                    end="",
+                    flush=True,
+                )
+
+    # 某个文件只要有分片失败，就整体跳过，与串行模式行为一致
+    results: dict[Path, AnalysisResult] = {}
+    for (fp, _, _), shard_result, shard_index in zip(shards, shard_results, shard_indexes):
+        if shard_result is not None and fp not in failed_files:
+            results.setdefault(fp, AnalysisResult()).merge(shard_result)
+            if index is not None:
+                index.extend(shard_index)
+    return results
+
+
+def run_compress(
+    data_files: list[Path],
+    workers: int,
+    codec_specs: list[str],
+    percentiles: list[float],
+    metrics: Metrics | None = None,
+) -> None:
+    """--compress 模式：对所有记录跑编解码矩阵，分片并行，结果按分片顺序合并"""
+    ranges = [(fp, 0, fp.stat().st_size) for fp in data_files]
+    total_bytes = sum(end for _, _, end in ranges)
+    shards = plan_shards(ranges, workers) if workers > 1 else ranges
+    print(f"🗜️  编解码器: {', '.join(codec_specs)}")
+    if workers > 1:
+        print(f"🧵 并行模式: {workers} 个进程，{len(shards)} 个分片")
+    print()
+
+    shard_results: list[CompressResult | None] = [None] * len(shards)
+    failed_files: set[Path] = set()
+    bytes_done = 0
+    records_done = 0
+    throttle = Throttle()
+
+    def show_progress(done: int) -> None:
+        pct = done / total_bytes * 100 if total_bytes else 0
+        print(f"\r  ⏳ 进度: {pct:.1f}% | 已处理 {records_done:,} 行", end="", flush=True)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(evaluate_shard, fp, start, end, codec_specs, BUCKET_BOUNDARIES): idx
+                for idx, (fp, start, end) in enumerate(shards)
+            }
+            for future in as_completed(futures):
+                idx = futures[future]
+                fp, start, end = shards[idx]
                 try:
-                    record = json.loads(stripped)
-                except json.JSONDecodeError:
-                    parse_errors += 1
+                    shard_results[idx] = future.result()
+                except OSError:
+                    if fp not in failed_files:
+                        failed_files.add(fp)
+                        print(f"\r  ⚠️  无法打开文件: {fp.name}，跳过")
                     continue
+                bytes_done += end - start
+                records_done += shard_results[idx].records
+                if throttle.ready():
+                    show_progress(bytes_done)
+    else:
+        for idx, (fp, start, end) in enumerate(shards):
 
-                # content_type
-                ct = record.get("content_type", "unknown")
-                content_type_counter[ct] += 1
-
-                # chat_type
-                chat_t = record.get("chat_type", "unknown")
-                chat_type_counter[chat_t] += 1
-
-                # payload.bodies[0]
-                payload = record.get("payload", {})
-                bodies = payload.get("bodies", [])
-                if bodies:
-                    body = bodies[0]
-                    body_type = body.get("type", "unknown")
-                    body_type_counter[body_type] += 1
-                    body_json = json.dumps(body, ensure_ascii=False)
-                    body_bytes = len(body_json.encode("utf-8"))
-                    body_stats.add(body_bytes)
-                else:
-                    body_type_counter["(empty)"] += 1
-                    body_stats.add(0)
-
-                # 进度显示（每秒最多更新一次）
-                now = time.time()
-                if now - last_progress_time >= 1.0:
-                    pct = bytes_read / total_file_size * 100 if total_file_size else 0
-                    print(
-                        f"\r  ⏳ 进度: {pct:.1f}% | "
-                        f"文件 {file_idx + 1}/{len(data_files)} | "
-                        f"已处理 {total_lines:,} 行",
-                        end="",
-                        flush=True,
-                    )
-                    last_progress_time = now
+            def on_progress(offset: int) -> None:
+                show_progress(bytes_done + offset - start)
+
+            try:
+                shard_results[idx] = evaluate_shard(
+                    fp, start, end, codec_specs, BUCKET_BOUNDARIES, on_progress
+                )
+            except OSError:
+                print(f"  ⚠️  无法打开文件: {fp.name}，跳过")
+                continue
+            bytes_done += end - start
+            records_done += shard_results[idx].records
+
+    result = CompressResult([Codec(spec).label for spec in codec_specs])
+    for (fp, _, _), shard_result in zip(shards, shard_results):
+        if shard_result is not None and fp not in failed_files:
+            result.merge(shard_result)
+
+    if metrics is not None:
+        metrics.add(records_done, bytes_done)
 
     # 清除进度行
     print(f"\r{' ' * 80}\r", end="")
+    print_compress_report(result, BUCKET_BOUNDARIES, percentiles)
+
+
+def format_percentile_label(p: float) -> str:
+    """百分位标签，例如 50 -> P50:，99.9 -> P99.9:"""
+    return f"P{p:g}:"
+
+
+def print_report(
+    result: AnalysisResult,
+    data_files: list[Path],
+    total_file_size: int,
+    percentiles: list[float],
+    population: int | None = None,
+) -> None:
+    """population 不为 None 时 result 是从 population 条记录中抽样得到的估计"""
+    total_lines = result.total_lines
+    line_stats = result.line_stats
+    body_stats = result.body_stats
+    bucket_counts = result.bucket_counts
 
-    # ── 输出报告 ──
     print("=" * 60)
     print("  📊 数据分析报告")
     print("=" * 60)
@@ -211,11 +523,21 @@ def analyze_directory(dirpath: str) -> None:
     # 基本信息
     print(f"\n{'── 基本信息 ──':─^56}")
     print(f"  数据文件数:         {len(data_files)}")
-    print(f"  总记录数 (有效行):  {total_lines:,}")
-    print(f"  解析失败:           {parse_errors}")
+    if population is not None:
+        print(f"  总记录数 (有效行):  {population:,}（行偏移索引）")
+        print(f"  抽样记录数:         {total_lines:,}（以下分布与长度统计为抽样估计）")
+    else:
+        print(f"  总记录数 (有效行):  {total_lines:,}")
+    print(f"  解析失败:           {result.parse_errors}")
     print(f"  总文件大小:         {format_bytes(total_file_size)}")
-    if total_lines > 0:
-        avg_line = total_file_size / total_lines
+    has_compressed = any(is_compressed(fp) for fp in data_files)
+    if has_compressed:
+        print(f"  解压后大小:         {format_bytes(line_stats.total)}（有效行合计）")
+    if population:
+        print(f"  平均行大小:         {format_bytes(total_file_size / population)}")
+    elif total_lines > 0:
+        # 压缩文件的磁盘大小与行长度无关，改用解压后的行长度
+        avg_line = line_stats.avg() if has_compressed else total_file_size / total_lines
         print(f"  平均行大小:         {format_bytes(avg_line)}")
 
     # 各文件信息
@@ -231,7 +553,7 @@ def analyze_directory(dirpath: str) -> None:
     print(f"\n{'── bodies[0].type 分布 ──':─^50}")
     print(f"  {'类型':<20} {'数量':>8} {'占比':>10}")
     print(f"  {'─' * 20} {'─' * 8} {'─' * 10}")
-    for t, count in body_type_counter.most_common():
+    for t, count in result.body_type_counter.most_common():
         pct = count / total_lines * 100 if total_lines else 0
         print(f"  {t:<20} {count:>8,} {pct:>9.1f}%")
 
@@ -239,7 +561,7 @@ def analyze_directory(dirpath: str) -> None:
     print(f"\n{'── content_type 分布 ──':─^50}")
     print(f"  {'类型':<35} {'数量':>8} {'占比':>10}")
     print(f"  {'─' * 35} {'─' * 8} {'─' * 10}")
-    for t, count in content_type_counter.most_common():
+    for t, count in result.content_type_counter.most_common():
         pct = count / total_lines * 100 if total_lines else 0
         print(f"  {t:<35} {count:>8,} {pct:>9.1f}%")
 
@@ -247,7 +569,7 @@ def analyze_directory(dirpath: str) -> None:
     print(f"\n{'── chat_type 分布 ──':─^50}")
     print(f"  {'类型':<20} {'数量':>8} {'占比':>10}")
     print(f"  {'─' * 20} {'─' * 8} {'─' * 10}")
-    for t, count in chat_type_counter.most_common():
+    for t, count in result.chat_type_counter.most_common():
         pct = count / total_lines * 100 if total_lines else 0
         print(f"  {t:<20} {count:>8,} {pct:>9.1f}%")
 
@@ -257,17 +579,21 @@ def analyze_directory(dirpath: str) -> None:
         print(f"  Min:   {format_bytes(line_stats.min_val)}")
         print(f"  Max:   {format_bytes(line_stats.max_val)}")
         print(f"  Avg:   {format_bytes(line_stats.avg())}")
-        print(f"  P50:   {format_bytes(line_stats.percentile(50))}")
-        print(f"  P90:   {format_bytes(line_stats.percentile(90))}")
-        print(f"  P99:   {format_bytes(line_stats.percentile(99))}")
+        for p in percentiles:
+            label = format_percentile_label(p)
+            print(f"  {label:<7}{format_bytes(line_stats.percentile(p))}")
 
         print(f"\n{'── bodies[0] 长度统计 (bytes) ──':─^44}")
         print(f"  Min:   {format_bytes(body_stats.min_val)}")
         print(f"  Max:   {format_bytes(body_stats.max_val)}")
         print(f"  Avg:   {format_bytes(body_stats.avg())}")
-        print(f"  P50:   {format_bytes(body_stats.percentile(50))}")
-        print(f"  P90:   {format_bytes(body_stats.percentile(90))}")
-        print(f"  P99:   {format_bytes(body_stats.percentile(99))}")
+        for p in percentiles:
+            label = format_percentile_label(p)
+            print(f"  {label:<7}{format_bytes(body_stats.percentile(p))}")
+
+    if line_stats.count > 0:
+        accuracy = line_stats.sketch.relative_accuracy * 100
+        print(f"\n  注: 百分位数为草图估计值，相对误差 ≤ {accuracy:g}%")
 
     # 长度分桶
     print(f"\n{'── 行长度分桶 ──':─^52}")
@@ -287,13 +613,509 @@ def analyze_directory(dirpath: str) -> None:
     print("=" * 60)
 
 
+def load_data_files(dirpath: str) -> list[Path]:
+    """检查数据文件夹并列出其中的数据文件，出错时直接退出"""
+    dir_path = Path(dirpath)
+    if not dir_path.exists():
+        print(f"❌ 路径不存在: {dirpath}")
+        sys.exit(1)
+    if find_selection(dir_path) is not None:
+        print("❌ 选择清单（filter --lazy）只支持完整分析，不能与 --manifest / --sample / --compress 同时使用")
+        sys.exit(1)
+    if not dir_path.is_dir():
+        print(f"❌ 不是文件夹: {dirpath}")
+        sys.exit(1)
+
+    data_files = get_data_files(dir_path)
+    if not data_files:
+        print(f"❌ 文件夹中没有数据文件: {dirpath}")
+        sys.exit(1)
+    missing = missing_packages(data_files)
+    if missing:
+        print(f"❌ 读取压缩文件需要 {', '.join(missing)}，请使用: uv run --extra compressed main.py ...")
+        sys.exit(1)
+    return data_files
+
+
+def load_selection_ranges(dirpath: str) -> list[ByteRange] | None:
+    """输入为选择清单（清单文件或含有 selection.json 的文件夹）时返回其中各段的字节范围，否则为 None"""
+    selection_path = find_selection(Path(dirpath))
+    if selection_path is None:
+        return None
+    try:
+        ranges, _ = load_selection(selection_path)
+    except SelectionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if not ranges:
+        print(f"❌ 选择清单中没有分片: {selection_path}")
+        sys.exit(1)
+    missing = missing_packages(list(dict.fromkeys(fp for fp, _, _ in ranges)))
+    if missing:
+        print(f"❌ 读取压缩文件需要 {', '.join(missing)}，请使用: uv run --extra compressed main.py ...")
+        sys.exit(1)
+    return ranges
+
+
+def analyze_directory(
+    dirpath: str,
+    workers: int = 1,
+    percentiles: list[float] | None = None,
+    cache_path: Path | None = None,
+    index_dir: Path | None = None,
+    metrics: Metrics | None = None,
+) -> None:
+    """分析目录；cache_path 为 None 时不使用增量缓存，index_dir 不为 None 时同时建索引
+
+    dirpath 为选择清单（filter --lazy）时只流式读取其中列出的各段，不使用缓存、不建索引。
+    """
+    if metrics is None:
+        metrics = Metrics("analyze", enabled=False)
+    selection = load_selection_ranges(dirpath)
+    if selection is not None:
+        data_files = list(dict.fromkeys(fp for fp, _, _ in selection))
+        if index_dir is not None:
+            print("⚠️  选择清单不能建立索引，忽略 --build-index")
+        # 缓存与索引按整个文件记录，选择的可能只是文件中的一段
+        cache_path = index_dir = None
+    else:
+        data_files = load_data_files(dirpath)
+
+    # 记录分析开始时的文件状态：结果与缓存都以此为准，分析过程中的追加留给下次
+    file_stats = {fp: fp.stat() for fp in data_files}
+    if selection is not None:
+        total_file_size = sum(end - start for _, start, end in selection)
+    else:
+        total_file_size = sum(st.st_size for st in file_stats.values())
+
+    print(f"📂 分析目录: {dirpath}")
+    if selection is not None:
+        print(f"📝 选择清单: {len(selection)} 段，来自 {len(data_files)} 个文件（只读取选中的范围，不使用缓存）")
+    print(f"📄 数据文件: {len(data_files)} 个")
+    print(f"📦 总大小: {format_bytes(total_file_size)}")
+    print(f"🧩 JSON 解析: {JSON_BACKEND}")
+
+    # 查缓存，确定每个文件需要分析的字节范围
+    with metrics.phase("cache"):
+        cache = AnalysisCache.load(cache_path) if cache_path is not None else None
+        cached: dict[Path, AnalysisResult] = {}
+        ranges: list[ByteRange] = list(selection) if selection is not None else []
+        reused = appended = 0
+        for fp in data_files if selection is None else ():
+            size = file_stats[fp].st_size
+            start = 0
+            # 建索引需要每条记录，不能复用缓存
+            if cache is not None and index_dir is None:
+                cached_result, start = cache.lookup(fp, size, file_stats[fp].st_mtime_ns)
+                if cached_result is not None:
+                    cached[fp] = AnalysisResult.from_dict(cached_result)
+                    if start == size:
+                        reused += 1
+                    else:
+                        appended += 1
+            if start < size or fp not in cached:
+                ranges.append((fp, start, size))
+    total_bytes = sum(end - start for _, start, end in ranges)
+
+    if index_dir is not None:
+        print(f"🗂️  建立索引: {index_dir}（完整分析所有文件）")
+    elif cache is not None:
+        print(
+            f"💾 增量缓存: 复用 {reused} 个，追加 {appended} 个，"
+            f"完整分析 {len(ranges) - appended} 个（需读取 {format_bytes(total_bytes)}）"
+        )
+    print()
+
+    index = RecordIndex() if index_dir is not None else None
+    file_ids = {fp: i for i, fp in enumerate(data_files)}
+    if not ranges:
+        fresh: dict[Path, AnalysisResult] = {}
+    elif workers > 1:
+        with metrics.phase("shards"):
+            fresh = run_parallel(ranges, total_bytes, workers, index, file_ids)
+    else:
+        fresh = run_serial(ranges, total_bytes, index, file_ids, metrics)
+    metrics.add(sum(r.total_lines for r in fresh.values()), total_bytes)
+
+    # 清除进度行
+    print(f"\r{' ' * 80}\r", end="")
+
+    # 按文件顺序合并（缓存部分在前、新增部分在后），与一次性完整分析的结果一致
+    with metrics.phase("merge"):
+        result = AnalysisResult()
+        pending = {fp for fp, _, _ in ranges}
+        for fp in data_files:
+            if fp in pending and fp not in fresh:
+                continue  # 读取失败，整个文件跳过
+            file_result = cached.get(fp) or AnalysisResult()
+            if fp in fresh:
+                file_result.merge(fresh[fp])
+            result.merge(file_result)
+            if cache is not None:
+                st = file_stats[fp]
+                try:
+                    cache.store(fp, st.st_size, st.st_mtime_ns, file_result.to_dict())
+                except OSError:
+                    pass  # 文件已被删除或截断，下次重新分析
+
+        if cache is not None:
+            cache.retain(data_files)
+            try:
+                cache.save()
+            except OSError as e:
+                print(f"⚠️  无法写入缓存文件 {cache.path}: {e}")
+
+    if index is not None:
+        try:
+            with metrics.phase("index"):
+                index.write(index_dir, data_files, file_stats)
+        except OSError as e:
+            print(f"❌ 无法写入索引 {index_dir}: {e}")
+            sys.exit(1)
+        print(f"🗂️  索引已写入: {index_dir}（{len(index):,} 条记录）\n")
+
+    with metrics.phase("report"):
+        print_report(result, data_files, total_file_size, percentiles or DEFAULT_PERCENTILES)
+
+
+def estimate_directory(
+    dirpath: str,
+    sample_size: int,
+    seed: int | None,
+    percentiles: list[float],
+    line_index_dir: Path,
+    metrics: Metrics,
+) -> None:
+    """抽样估计：借助行偏移索引随机读取 sample_size 条记录，不扫描全部数据"""
+    data_files = load_data_files(dirpath)
+    total_file_size = sum(fp.stat().st_size for fp in data_files)
+
+    print(f"📂 分析目录: {dirpath}")
+    print(f"📄 数据文件: {len(data_files)} 个")
+    print(f"📦 总大小: {format_bytes(total_file_size)}")
+    print(f"🧩 JSON 解析: {JSON_BACKEND}")
+
+    try:
+        line_index = LineIndex.load(data_files, line_index_dir)
+    except LineIndexError as e:
+        print(f"❌ {e}")
+        print(f"   先建立索引: cd ../sampler && uv run main.py index {dirpath}")
+        sys.exit(1)
+
+    with line_index:
+        population = len(line_index)
+        sample_size = min(sample_size, population)
+        print(f"🎲 抽样估计: {sample_size:,} / {population:,} 条记录\n")
+
+        # 记录号排序后读取，磁盘访问近似顺序
+        records = sorted(random.Random(seed).sample(range(population), sample_size))
+        result = AnalysisResult()
+        add_line = result.add_line
+        throttle = Throttle()
+        with metrics.phase("sample"):
+            for i, stripped in enumerate(line_index.read_records(records)):
+                if stripped:
+                    add_line(stripped)
+                if i & 0x3FF == 0 and throttle.ready():
+                    print(f"\r  ⏳ 进度: {i / sample_size * 100:.1f}%", end="", flush=True)
+        metrics.add(result.total_lines, result.line_stats.total)
+
+    # 清除进度行
+    print(f"\r{' ' * 80}\r", end="")
+    with metrics.phase("report"):
+        print_report(result, data_files, total_file_size, percentiles, population)
+
+
+def summarize_manifest(dirpath: str, metrics: Metrics) -> None:
+    """分片清单报告：直接汇总 sampler 写出的 manifest.json，不读取分片内容"""
+    data_files = load_data_files(dirpath)
+    try:
+        with metrics.phase("manifest"):
+            entries = load_manifest(Path(dirpath), data_files)
+    except ManifestError as e:
+        print(f"❌ {e}")
+        print("   分片文件夹需由 sampler 切割生成且未被修改，或去掉 --manifest 完整分析")
+        sys.exit(1)
+
+    total_lines = sum(e["lines"] for e in entries.values())
+    total_size = sum(e["bytes"] for e in entries.values())
+    # 内容统计由 sampler --manifest-stats 生成，默认的清单中只有记录数、大小和校验和
+    content = all("content_types" in e for e in entries.values())
+    parse_errors = sum(e["parse_errors"] for e in entries.values()) if content else None
+    content_types: Counter[str] = Counter()
+    buckets: Counter[str] = Counter()
+    body_types: Counter[str] | None = None
+    body_mins: list[int] = []
+    body_maxes: list[int] = []
+    if content:
+        for entry in entries.values():
+            content_types.update(entry["content_types"])
+            buckets.update(entry["buckets"])
+        # body_types 为后加的字段，旧清单中没有
+        if all("body_types" in e for e in entries.values()):
+            body_types = Counter()
+            for entry in entries.values():
+                body_types.update(entry["body_types"])
+        body_mins = [e["body_min"] for e in entries.values() if e["body_min"] is not None]
+        body_maxes = [e["body_max"] for e in entries.values() if e["body_max"] is not None]
+    metrics.add(total_lines, total_size)
+
+    print(f"📂 分析目录: {dirpath}")
+    print(f"🧾 分片清单: {MANIFEST_FILENAME}（不读取分片内容）\n")
+    print("=" * 60)
+    print("  📊 分片清单报告")
+    print("=" * 60)
+
+    print(f"\n{'── 基本信息 ──':─^56}")
+    print(f"  分片数:             {len(data_files)}")
+    print(f"  总记录数 (有效行):  {total_lines:,}")
+    if parse_errors is not None:
+        print(f"  解析失败:           {parse_errors}")
+    print(f"  总文件大小:         {format_bytes(total_size)}")
+    if total_lines > 0:
+        print(f"  平均行大小:         {format_bytes(total_size / total_lines)}")
+
+    print(f"\n{'── 分片列表 ──':─^56}")
+    print(f"  {'分片':<20} {'记录数':>10} {'大小':>10} {'CRC32':>10}")
+    print(f"  {'─' * 20} {'─' * 10} {'─' * 10} {'─' * 10}")
+    for fp, entry in entries.items():
+        print(f"  {fp.name:<20} {entry['lines']:>10,} {format_bytes(entry['bytes']):>10} {entry['crc32']:>10}")
+
+    if body_types is not None:
+        print(f"\n{'── bodies[0].type 分布 ──':─^50}")
+        print(f"  {'类型':<20} {'数量':>8} {'占比':>10}")
+        print(f"  {'─' * 20} {'─' * 8} {'─' * 10}")
+        for t, count in body_types.most_common():
+            pct = count / total_lines * 100 if total_lines else 0
+            print(f"  {t:<20} {count:>8,} {pct:>9.1f}%")
+
+    if content:
+        print(f"\n{'── content_type 分布 ──':─^50}")
+        print(f"  {'类型':<35} {'数量':>8} {'占比':>10}")
+        print(f"  {'─' * 35} {'─' * 8} {'─' * 10}")
+        for t, count in content_types.most_common():
+            pct = count / total_lines * 100 if total_lines else 0
+            print(f"  {t:<35} {count:>8,} {pct:>9.1f}%")
+
+    if body_mins:
+        print(f"\n{'── bodies[0] 长度 (bytes) ──':─^46}")
+        print(f"  Min:   {format_bytes(min(body_mins))}")
+        print(f"  Max:   {format_bytes(max(body_maxes))}")
+
+    if content:
+        print(f"\n{'── 行长度分桶 ──':─^52}")
+        print(f"  {'桶':<12} {'数量':>8} {'占比':>10} {'柱状图'}")
+        print(f"  {'─' * 12} {'─' * 8} {'─' * 10} {'─' * 20}")
+        max_count = max(buckets.values()) if buckets else 1
+        for _, label in BUCKET_BOUNDARIES:
+            count = buckets.get(label, 0)
+            pct = count / total_lines * 100 if total_lines else 0
+            bar = "█" * (int(count / max_count * 20) if max_count else 0)
+            print(f"  {label:<12} {count:>8,} {pct:>9.1f}% {bar}")
+
+    print()
+    if not content:
+        print("  注: 清单不含内容统计（sampler 切割时加 --manifest-stats 才会统计），需要分布时重新切割或去掉 --manifest 完整分析")
+    else:
+        missing = "chat_type 分布和百分位数" if body_types is not None else "body type / chat_type 分布和百分位数（旧清单）"
+        print(f"  注: 清单不含 {missing}，需要时去掉 --manifest 完整分析")
+    print()
+    print("=" * 60)
+    print("  分析完成 ✅")
+    print("=" * 60)
+
+
 def main():
-    if len(sys.argv) < 2:
-        print("用法: uv run main.py <数据文件夹路径>")
-        print("示例: uv run main.py ../../sdkTest/tmp")
+    args = sys.argv[1:]
+    if not args or args[0] in ("-h", "--help"):
+        print("用法: uv run main.py <数据文件夹路径> [选项]")
+        print("      数据文件夹也可以是 filter --lazy 写出的选择清单（selection.json 或其所在文件夹），只读取其中列出的范围")
+        print()
+        print("选项:")
+        print("  --workers N      并行进程数（默认 1，即单进程；0 表示使用全部 CPU 核）")
+        print("  --percentiles L  输出的百分位数，逗号分隔（默认 50,90,99）")
+        print(f"  --cache FILE     增量缓存文件路径（默认 <数据文件夹>/{CACHE_FILENAME}）")
+        print("  --no-cache       不读取也不写入缓存，完整分析所有文件")
+        print(f"  --build-index    分析时同时建立列式索引（默认 <数据文件夹>/{INDEX_DIRNAME}）")
+        print("  --index-dir DIR  索引目录路径")
+        print()
+        print("抽样估计（需要先用 sampler 建立行偏移索引: uv run main.py index <数据文件夹>）:")
+        print("  --sample N       随机读取 N 条记录估计整体分布，不扫描全部数据")
+        print("  --seed S         抽样随机种子")
+        print(f"  --line-index DIR 行偏移索引目录（默认 <数据文件夹>/{LINE_INDEX_DIRNAME}）")
+        print()
+        print(f"分片清单（sampler 切割时生成的 {MANIFEST_FILENAME}）:")
+        print("  --manifest       直接汇总分片清单中的记录数与分布，不读取分片内容")
+        print()
+        print("查询模式（读取索引，不扫描原始数据，需要 numpy: uv run --extra query ...）:")
+        print("  --query          按索引查询，不重新分析")
+        print("  --group-by F     分组字段，逗号分隔，最多两个（两个时输出交叉表）")
+        print("                   可选: content_type, chat_type, body_type, file")
+        print("  --where F=V      过滤条件，可重复；同一字段多次出现表示“或”")
+        print("  --value body     统计长度列: body（bodies[0] 长度）或 line（整行长度）")
+        print()
+        print("编解码矩阵（lz4 / zstd 需要: uv run --extra compress ...）:")
+        print("  --compress       对每条记录的整行和 bodies[0] 评估压缩率与吞吐")
+        print("  --codecs L       编解码器[:级别]，逗号分隔（默认 lz4-block,lz4-frame,zlib:6,zstd:3）")
+        print()
+        print("计量与剖析:")
+        print("  --metrics-json FILE  输出分阶段耗时、吞吐、峰值内存，并写入 JSON 文件")
+        print("  --profile MODE[:FILE]  性能剖析: cprofile 或 sample（采样），可选输出文件")
+        print()
+        print("示例:")
+        print("  uv run main.py ../../sdkTest/tmp")
+        print("  uv run main.py ../../sdkTest/tmp --workers 8")
+        print("  uv run main.py ../../sdkTest/tmp --percentiles 50,90,99,99.9")
+        print("  uv run main.py ../../sdkTest/tmp --build-index")
+        print("  uv run main.py ../../sdkTest/tmp --sample 10000 --seed 1")
+        print("  uv run main.py ../sampler/output --manifest")
+        print("  uv run --extra query main.py ../../sdkTest/tmp --query "
+              "--group-by body_type --where chat_type=groupchat")
+        print("  uv run --extra compress main.py ../../sdkTest/tmp --compress --workers 0")
+        sys.exit(0 if args else 1)
+
+    input_dir = args[0]
+    workers = 1
+    percentiles = DEFAULT_PERCENTILES
+    cache_path = Path(input_dir) / CACHE_FILENAME
+    build_index = False
+    index_dir = Path(input_dir) / INDEX_DIRNAME
+    query = False
+    group_by: list[str] = []
+    where: list[str] = []
+    value = "body"
+    compress = False
+    codecs: list[str] | None = None
+    sample_size: int | None = None
+    seed: int | None = None
+    line_index_dir = Path(input_dir) / LINE_INDEX_DIRNAME
+    manifest = False
+    metrics_json: Path | None = None
+    profiler: Profiler | None = None
+
+    i = 1
+    while i < len(args):
+        if args[i] == "--workers" and i + 1 < len(args):
+            workers = int(args[i + 1])
+            i += 2
+        elif args[i] == "--percentiles" and i + 1 < len(args):
+            percentiles = [float(p) for p in args[i + 1].split(",") if p.strip()]
+            i += 2
+        elif args[i] == "--cache" and i + 1 < len(args):
+            cache_path = Path(args[i + 1])
+            i += 2
+        elif args[i] == "--no-cache":
+            cache_path = None
+            i += 1
+        elif args[i] == "--build-index":
+            build_index = True
+            i += 1
+        elif args[i] == "--index-dir" and i + 1 < len(args):
+            index_dir = Path(args[i + 1])
+            i += 2
+        elif args[i] == "--query":
+            query = True
+            i += 1
+        elif args[i] == "--group-by" and i + 1 < len(args):
+            group_by = [f.strip() for f in args[i + 1].split(",") if f.strip()]
+            i += 2
+        elif args[i] == "--where" and i + 1 < len(args):
+            where.append(args[i + 1])
+            i += 2
+        elif args[i] == "--value" and i + 1 < len(args):
+            value = args[i + 1]
+            i += 2
+        elif args[i] == "--compress":
+            compress = True
+            i += 1
+        elif args[i] == "--codecs" and i + 1 < len(args):
+            codecs = [c.strip() for c in args[i + 1].split(",") if c.strip()]
+            i += 2
+        elif args[i] == "--sample" and i + 1 < len(args):
+            sample_size = int(args[i + 1])
+            i += 2
+        elif args[i] == "--seed" and i + 1 < len(args):
+            seed = int(args[i + 1])
+            i += 2
+        elif args[i] == "--line-index" and i + 1 < len(args):
+            line_index_dir = Path(args[i + 1])
+            i += 2
+        elif args[i] == "--manifest":
+            manifest = True
+            i += 1
+        elif args[i] == "--metrics-json" and i + 1 < len(args):
+            metrics_json = Path(args[i + 1])
+            i += 2
+        elif args[i] == "--profile" and i + 1 < len(args):
+            try:
+                profiler = Profiler.parse(args[i + 1])
+            except ValueError as e:
+                print(f"❌ {e}")
+                sys.exit(1)
+            i += 2
+        else:
+            print(f"❌ 未知参数: {args[i]}")
+            sys.exit(1)
+
+    if workers < 0:
+        print("❌ --workers 必须 >= 0")
+        sys.exit(1)
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if not percentiles or any(not 0 <= p <= 100 for p in percentiles):
+        print("❌ --percentiles 必须是 0~100 之间的数")
+        sys.exit(1)
+    if sample_size is not None and sample_size < 1:
+        print("❌ --sample 必须 >= 1")
         sys.exit(1)
 
-    analyze_directory(sys.argv[1])
+    metrics = Metrics("analyze", enabled=metrics_json is not None)
+    metrics.extra["workers"] = workers
+    metrics.extra["json_backend"] = JSON_BACKEND
+
+    if query:
+        data_dir = Path(input_dir)
+        data_files = get_data_files(data_dir) if data_dir.is_dir() else []
+        try:
+            with profiler or nullcontext(), metrics.phase("query"):
+                run_query(index_dir, data_files, group_by, parse_where(where), value, percentiles)
+        except QueryError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+    elif compress:
+        try:
+            codec_specs, skipped = resolve_codecs(codecs)
+        except CodecError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        if skipped:
+            print(f"⚠️  缺少依赖，跳过: {', '.join(skipped)}（使用 uv run --extra compress 安装）")
+        if not codec_specs:
+            print("❌ 没有可用的编解码器")
+            sys.exit(1)
+        data_files = load_data_files(input_dir)
+        print(f"📂 分析目录: {input_dir}")
+        print(f"📄 数据文件: {len(data_files)} 个")
+        with profiler or nullcontext(), metrics.phase("compress"):
+            run_compress(data_files, workers, codec_specs, percentiles, metrics)
+    elif manifest:
+        with profiler or nullcontext():
+            summarize_manifest(input_dir, metrics)
+    elif sample_size is not None:
+        with profiler or nullcontext():
+            estimate_directory(input_dir, sample_size, seed, percentiles, line_index_dir, metrics)
+    else:
+        with profiler or nullcontext():
+            analyze_directory(
+                input_dir,
+                workers,
+                percentiles,
+                cache_path,
+                index_dir if build_index else None,
+                metrics,
+            )
+
+    metrics.report(metrics_json)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+"""
+可合并的对数分桶分位数草图（DDSketch 风格）
+
+对正数 v，桶下标为 ceil(log_γ(v))，其中 γ = (1 + α) / (1 - α)。
+同一个桶内的所有值都落在 (γ^(i-1), γ^i] 区间，用 2γ^i / (γ + 1) 作为代表值，
+因此任意分位数估计值与真实值的相对误差不超过 α。
+
+- 插入：整数小值查表，其余一次 log 运算，均为 O(1)
+- 合并：相同 α 的草图按桶下标累加即可，用于多进程分片与增量分析
+- 序列化：to_dict() / from_dict() 输出纯 JSON 结构
+"""
+
+import math
+
+# 默认相对误差 1%
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# 小于该值的整数直接查表得到桶下标，避免 log 运算
+_INDEX_TABLE_SIZE = 1 << 16
+
+# 按精度缓存的下标表（同一进程内所有草图共享）
+_index_tables: dict[float, list[int]] = {}
+
+
+def _index_table(relative_accuracy: float, log_gamma: float) -> list[int]:
+    table = _index_tables.get(relative_accuracy)
+    if table is None:
+        table = [0] + [
+            math.ceil(math.log(v) / log_gamma) for v in range(1, _INDEX_TABLE_SIZE)
+        ]
+        _index_tables[relative_accuracy] = table
+    return table
+
+
+class LogSketch:
+    """相对误差有保证的流式分位数草图，只接受非负数"""
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> None:
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy 必须在 (0, 1) 之间")
+        self.relative_accuracy = relative_accuracy
+        self.count = 0
+        self.zero_count = 0
+        # bins[i - offset] 为下标 i 的计数；offset 随最小下标向下扩展
+        self.bins: list[int] = []
+        self.offset = 0
+        self._init_params()
+
+    def _init_params(self) -> None:
+        self.gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._table = _index_table(self.relative_accuracy, self._log_gamma)
+
+    def key(self, value: float) -> int:
+        """值对应的桶下标"""
+        if type(value) is int and value < _INDEX_TABLE_SIZE:
+            return self._table[value]
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def add(self, value: float, n: int = 1) -> None:
+        self.count += n
+        if value <= 0:
+            self.zero_count += n
+            return
+        if type(value) is int and value < _INDEX_TABLE_SIZE:
+            k = self._table[value]
+        else:
+            k = math.ceil(math.log(value) / self._log_gamma)
+        i = k - self.offset
+        if 0 <= i < len(self.bins):
+            self.bins[i] += n
+        else:
+            self._add_out_of_range(k, n)
+
+    def _add_out_of_range(self, k: int, n: int) -> None:
+        if not self.bins:
+            self.bins = [n]
+            self.offset = k
+        elif k < self.offset:
+            self.bins[:0] = [0] * (self.offset - k)
+            self.offset = k
+            self.bins[0] += n
+        else:
+            self.bins.extend([0] * (k - self.offset - len(self.bins) + 1))
+            self.bins[k - self.offset] += n
+
+    def value_at(self, k: int) -> float:
+        """桶下标 k 的代表值（相对误差 ≤ α）"""
+        return 2 * self.gamma**k / (self.gamma + 1)
+
+    def quantile(self, q: float) -> float:
+        """第 q 分位数 (0 ≤ q ≤ 1)，按最近秩：返回第 ceil(q * count) 个值的估计"""
+        if self.count == 0:
+            return 0.0
+        target = max(1, math.ceil(q * self.count))
+        cumulative = self.zero_count
+        if cumulative >= target:
+            return 0.0
+        for i, c in enumerate(self.bins):
+            cumulative += c
+            if cumulative >= target:
+                return self.value_at(i + self.offset)
+        return self.value_at(self.offset + len(self.bins) - 1)
+
+    def merge(self, other: "LogSketch") -> None:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("只能合并相对误差相同的草图")
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for i, c in enumerate(other.bins):
+            if c:
+                k = i + other.offset
+                j = k - self.offset
+                if 0 <= j < len(self.bins):
+                    self.bins[j] += c
+                else:
+                    self._add_out_of_range(k, c)
+
+    def to_dict(self) -> dict:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "count": self.count,
+            "zero_count": self.zero_count,
+            "offset": self.offset,
+            "bins": self.bins,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LogSketch":
+        sketch = cls(data["relative_accuracy"])
+        sketch.count = data["count"]
+        sketch.zero_count = data["zero_count"]
+        sketch.offset = data["offset"]
+        sketch.bins = list(data["bins"])
+        return sketch
+
+    # 多进程传递时不携带共享的下标表
+    def __getstate__(self) -> dict:
+        return self.to_dict()
+
+    def __setstate__(self, state: dict) -> None:
+        self.relative_accuracy = state["relative_accuracy"]
+        self.count = state["count"]
+        self.zero_count = state["zero_count"]
+        self.offset = state["offset"]
+        self.bins = state["bins"]
+        self._init_params()
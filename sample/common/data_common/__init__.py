@@ -0,0 +1,114 @@
+"""IM 数据工具（sampler / analyze / filter / send_message）的公共模块"""
+
+from data_common.buckets import BUCKET_BOUNDARIES, COMPRESS_BOUNDARIES, bucket_label, compress_label
+from data_common.compressed import (
+    COMPRESSED_SUFFIXES,
+    OUTPUT_LEVELS,
+    CompressedWriter,
+    DecompressError,
+    is_compressed,
+    missing_packages,
+)
+from data_common.files import format_bytes, get_data_files
+from data_common.lineindex import (
+    LINE_INDEX_DIRNAME,
+    LineIndex,
+    LineIndexError,
+    build_line_index,
+    copy_line_index,
+    record_starts,
+)
+from data_common.manifest import (
+    MANIFEST_FILENAME,
+    ManifestError,
+    PartStats,
+    copy_manifest,
+    file_crc32,
+    load_manifest,
+    read_manifest,
+    write_manifest,
+)
+from data_common.metrics import Metrics, Profiler, peak_rss
+from data_common.reader import (
+    CHUNK_SIZE,
+    ProgressCallback,
+    Throttle,
+    iter_batches,
+    iter_lines,
+    strip_line,
+    strip_lines,
+)
+from data_common.records import JSON_BACKEND, body_bytes, body_json_bytes, loads_record
+from data_common.selection import (
+    SELECTION_FILENAME,
+    SelectionError,
+    find_selection,
+    load_selection,
+    write_selection,
+)
+from data_common.timeindex import (
+    DEFAULT_TIME_FIELD,
+    TIME_BLOCK_SIZE,
+    TIME_INDEX_DIRNAME,
+    TimeIndexError,
+    build_time_index,
+    load_time_index,
+    record_time,
+    save_time_index,
+)
+
+__all__ = [
+    "BUCKET_BOUNDARIES",
+    "CHUNK_SIZE",
+    "COMPRESSED_SUFFIXES",
+    "COMPRESS_BOUNDARIES",
+    "CompressedWriter",
+    "DEFAULT_TIME_FIELD",
+    "DecompressError",
+    "JSON_BACKEND",
+    "LINE_INDEX_DIRNAME",
+    "LineIndex",
+    "LineIndexError",
+    "MANIFEST_FILENAME",
+    "ManifestError",
+    "Metrics",
+    "OUTPUT_LEVELS",
+    "PartStats",
+    "Profiler",
+    "ProgressCallback",
+    "SELECTION_FILENAME",
+    "SelectionError",
+    "TIME_BLOCK_SIZE",
+    "TIME_INDEX_DIRNAME",
+    "Throttle",
+    "TimeIndexError",
+    "body_bytes",
+    "body_json_bytes",
+    "bucket_label",
+    "build_line_index",
+    "build_time_index",
+    "compress_label",
+    "copy_line_index",
+    "copy_manifest",
+    "file_crc32",
+    "find_selection",
+    "format_bytes",
+    "get_data_files",
+    "is_compressed",
+    "iter_batches",
+    "iter_lines",
+    "load_manifest",
+    "load_selection",
+    "load_time_index",
+    "loads_record",
+    "missing_packages",
+    "peak_rss",
+    "read_manifest",
+    "record_starts",
+    "record_time",
+    "save_time_index",
+    "strip_line",
+    "strip_lines",
+    "write_manifest",
+    "write_selection",
+]
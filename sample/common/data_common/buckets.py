@@ -0,0 +1,38 @@
+"""长度分桶定义（analyze 报告、编解码矩阵与字典评估共用，保证各报告口径一致）与压缩率分档（分片清单、filter 代表性筛选共用）"""
+
+# (上界（不含）, 标签)，按上界递增
+BUCKET_BOUNDARIES = [
+    (200, "<200B"),
+    (500, "200-500B"),
+    (1024, "500B-1KB"),
+    (5120, "1-5KB"),
+    (float("inf"), ">5KB"),
+]
+
+
+def bucket_label(n: int) -> str:
+    """长度 n 所在的分桶标签"""
+    for boundary, label in BUCKET_BOUNDARIES:
+        if n < boundary:
+            return label
+    return BUCKET_BOUNDARIES[-1][1]
+
+
+# (上界（不含）, 标签)：压缩后大小 / 原始大小，按上界递增
+COMPRESS_BOUNDARIES = [
+    (0.05, "<5%"),
+    (0.1, "5-10%"),
+    (0.15, "10-15%"),
+    (0.2, "15-20%"),
+    (0.3, "20-30%"),
+    (0.5, "30-50%"),
+    (float("inf"), ">50%"),
+]
+
+
+def compress_label(ratio: float) -> str:
+    """压缩率 ratio 所在的分档标签"""
+    for boundary, label in COMPRESS_BOUNDARIES:
+        if ratio < boundary:
+            return label
+    return COMPRESS_BOUNDARIES[-1][1]
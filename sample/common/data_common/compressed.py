@@ -0,0 +1,198 @@
+"""
+压缩输入（.gz / .zst / .lz4）的透明读取
+
+按后缀识别压缩文件，在后台线程中流式解压，主线程只负责切行和解析。
+zlib / zstandard / lz4 解压时都会释放 GIL，解压与解析可以重叠进行，
+不需要先把几十 GB 的数据解压到磁盘。
+
+.gz 使用标准库；.zst 需要 zstandard，.lz4（帧格式）需要 lz4，均为可选依赖。
+压缩流无法从中间开始读取，只能整个文件从头读到尾。
+
+CompressedWriter 写出 .gz / .zst：数据按块压缩为独立的 gzip member / zstd frame，
+拼接后仍是合法的压缩文件（读取时连续解压），各块可以交给线程池并行压缩。
+"""
+
+import gzip
+import queue
+import threading
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import Executor
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖：读取 .zst 时需要
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:  # 可选依赖：读取 .lz4 时需要
+    lz4 = None
+
+# 后缀 -> 解压所需的第三方包（None 表示标准库即可）
+COMPRESSED_SUFFIXES = {".gz": None, ".zst": "zstandard", ".lz4": "lz4"}
+# 解压线程最多领先主线程的块数
+QUEUE_CHUNKS = 4
+# 可写出的压缩格式 -> 默认压缩级别
+OUTPUT_LEVELS = {".gz": 6, ".zst": 3}
+# 写出时每块（一个 gzip member / zstd frame）的未压缩大小
+COMPRESS_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class DecompressError(OSError):
+    """压缩文件损坏或被截断（按无法读取的文件处理）"""
+
+
+def is_compressed(path: Path) -> bool:
+    return path.suffix in COMPRESSED_SUFFIXES
+
+
+def missing_packages(paths: list[Path]) -> list[str]:
+    """读取这些文件还缺少的第三方包，按名称排序"""
+    available = {"zstandard": zstandard is not None, "lz4": lz4 is not None}
+    needed = {COMPRESSED_SUFFIXES.get(p.suffix) for p in paths}
+    return sorted(pkg for pkg in needed if pkg is not None and not available[pkg])
+
+
+def _open_stream(path: Path, raw):
+    """在原始文件对象上套一层解压流"""
+    if path.suffix == ".gz":
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    if path.suffix == ".zst":
+        if zstandard is None:
+            raise DecompressError(f"读取 {path.name} 需要 zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+    if lz4 is None:
+        raise DecompressError(f"读取 {path.name} 需要 lz4")
+    return lz4.frame.LZ4FrameFile(raw, mode="rb")
+
+
+def iter_decompressed(path: Path, chunk_size: int) -> Iterator[tuple[int, bytes]]:
+    """后台线程解压，按顺序产出 (已读取的压缩字节数, 解压后的数据块)
+
+    调用方提前结束迭代时，解压线程随之退出并关闭文件。
+    """
+    chunks: queue.Queue = queue.Queue(maxsize=QUEUE_CHUNKS)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker() -> None:
+        try:
+            with open(path, "rb") as raw, _open_stream(path, raw) as stream:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not put((raw.tell(), chunk)) or not chunk:
+                        return
+        except OSError as e:
+            put(e)
+        except Exception as e:  # zstandard.ZstdError、lz4 的 RuntimeError、EOFError 等
+            put(DecompressError(f"解压失败 {path.name}: {e}"))
+
+    thread = threading.Thread(target=worker, name=f"decompress-{path.name}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            if not item[1]:
+                return
+    finally:
+        stop.set()
+        thread.join()
+
+
+def compress_block(data: bytes, suffix: str, level: int) -> bytes:
+    """把 data 压缩为一个完整的 gzip member / zstd frame（zlib / zstandard 压缩时释放 GIL，可在线程中并行）"""
+    if suffix == ".gz":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if zstandard is None:
+        raise DecompressError("写出 .zst 需要 zstandard")
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+class CompressedWriter:
+    """按块压缩写出 .gz / .zst 文件（按 path 的后缀选择格式）
+
+    数据攒满 COMPRESS_BLOCK_SIZE 后压缩为一块写入。给出 pool 时块交给线程池压缩，
+    调用方不必等待、继续准备下一批数据，最多 max_pending 块在压缩中，按提交顺序写入；
+    不给 pool 时在调用线程中同步压缩。on_write 在每块压缩数据写入后调用（用于统计文件大小与校验和）。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        level: int | None = None,
+        pool: Executor | None = None,
+        max_pending: int = 4,
+        on_write: Callable[[bytes], None] | None = None,
+    ) -> None:
+        if path.suffix not in OUTPUT_LEVELS:
+            raise ValueError(f"不支持写出的压缩格式: {path.name}")
+        self.suffix = path.suffix
+        self.level = OUTPUT_LEVELS[self.suffix] if level is None else level
+        self.pool = pool
+        self.max_pending = max(1, max_pending)
+        self.on_write = on_write
+        self.raw_bytes = 0
+        self.bytes_written = 0
+        self._buffer: list[bytes] = []
+        self._buffered = 0
+        self._blocks = 0
+        self._pending: deque = deque()
+        self._file = open(path, "wb")
+
+    def write(self, data: bytes) -> None:
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= COMPRESS_BLOCK_SIZE:
+            self._submit()
+
+    def _submit(self) -> None:
+        block = b"".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self._blocks += 1
+        self.raw_bytes += len(block)
+        if self.pool is None:
+            self._emit(compress_block(block, self.suffix, self.level))
+            return
+        self._pending.append(self.pool.submit(compress_block, block, self.suffix, self.level))
+        while len(self._pending) > self.max_pending:
+            self._emit(self._pending.popleft().result())
+
+    def _emit(self, data: bytes) -> None:
+        self._file.write(data)
+        self.bytes_written += len(data)
+        if self.on_write is not None:
+            self.on_write(data)
+
+    def close(self) -> None:
+        """写出剩余数据并关闭；没有任何数据时也写出一个空块，保证是合法的压缩文件"""
+        if self._file.closed:
+            return
+        try:
+            if self._buffer or not self._blocks:
+                self._submit()
+            while self._pending:
+                self._emit(self._pending.popleft().result())
+        finally:
+            for future in self._pending:
+                future.cancel()
+            self._file.close()
+
+    def __enter__(self) -> "CompressedWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
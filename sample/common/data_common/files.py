@@ -0,0 +1,27 @@
+"""数据文件枚举与格式化"""
+
+from pathlib import Path
+
+# 工具在输出文件夹中写出的附属文件（不是数据文件）
+SIDECAR_FILENAMES = {"strata.json", "manifest.json", "dedup.json", "selection.json"}
+
+
+def format_bytes(n: float) -> str:
+    """格式化字节数为可读字符串"""
+    if n < 1024:
+        return f"{n:.0f} B"
+    elif n < 1024 * 1024:
+        return f"{n / 1024:.1f} KB"
+    elif n < 1024 * 1024 * 1024:
+        return f"{n / (1024 * 1024):.2f} MB"
+    else:
+        return f"{n / (1024 * 1024 * 1024):.2f} GB"
+
+
+def get_data_files(dir_path: Path) -> list[Path]:
+    """获取文件夹下所有数据文件（排除隐藏文件和附属文件），按名称排序"""
+    files = []
+    for entry in sorted(dir_path.iterdir()):
+        if entry.is_file() and not entry.name.startswith(".") and entry.name not in SIDECAR_FILENAMES:
+            files.append(entry)
+    return files
@@ -0,0 +1,241 @@
+"""
+行偏移索引：按记录号直接定位到数据文件中的字节偏移
+
+sampler 的 index 子命令一遍流式读取数据目录，记录每条记录（去除首尾空白后非空的行）的行首偏移：
+
+    <数据目录>/.line_index/
+        meta.json         版本、字节序、各文件的大小 / 记录数 / 校验和
+        <文件名>.offsets  uint64 数组：各记录的行首偏移，末尾再追加文件大小（共 记录数 + 1 项）
+
+第 i 条记录占据 [offsets[i], offsets[i + 1])（可能带有尾随的空行，读取方 strip 即可），
+任意连续记录区间都对应一段连续的字节范围，可以直接交给 iter_batches 或按字节复制。
+
+加载时 mmap 各 .offsets 文件，用 memoryview.cast 直接当作整数数组访问，不读入内存，
+上亿条记录也能瞬间加载。校验和为文件大小加头尾各 CHECKSUM_SPAN 字节的 blake2b：
+文件被追加、截断或改写头尾后索引视为过期，需要重新建立（只改写中间内容且大小不变的情况检测不到）。
+压缩文件无法随机访问，不能建索引。
+"""
+
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import sys
+from array import array
+from collections.abc import Iterable, Iterator
+from itertools import accumulate, compress
+from pathlib import Path
+
+from data_common.compressed import is_compressed
+from data_common.reader import ProgressCallback, iter_batches, strip_line
+
+LINE_INDEX_VERSION = 1
+LINE_INDEX_DIRNAME = ".line_index"
+META_FILENAME = "meta.json"
+OFFSETS_SUFFIX = ".offsets"
+
+# 校验和覆盖的文件头 / 尾字节数
+CHECKSUM_SPAN = 64 * 1024
+
+# (文件, 起始偏移, 结束偏移)
+ByteRange = tuple[Path, int, int]
+
+
+class LineIndexError(ValueError):
+    """索引不存在、已过期或无法建立"""
+
+
+def file_checksum(path: Path, size: int) -> str:
+    """文件大小与头尾各 CHECKSUM_SPAN 字节的哈希"""
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(min(size, CHECKSUM_SPAN)))
+        if size > CHECKSUM_SPAN:
+            f.seek(max(CHECKSUM_SPAN, size - CHECKSUM_SPAN))
+            h.update(f.read(CHECKSUM_SPAN))
+    return h.hexdigest()
+
+
+def record_starts(offset: int, lines: list[bytes]) -> array:
+    """一批行中非空行（strip 后）的行首偏移"""
+    starts = array("Q", accumulate(map(len, lines), lambda pos, n: pos + n + 1, initial=offset))
+    starts.pop()  # 最后一项是下一批的起点
+    keep = list(map(strip_line, lines))
+    if all(keep):
+        return starts
+    return array("Q", compress(starts, keep))
+
+
+def build_line_index(
+    data_files: list[Path],
+    index_dir: Path,
+    progress: ProgressCallback | None = None,
+) -> int:
+    """一遍流式读取，为每个数据文件写入 .offsets，最后写 meta.json，返回总记录数
+
+    progress(已读取的总字节数) 最多每秒调用一次。
+    """
+    compressed = [fp.name for fp in data_files if is_compressed(fp)]
+    if compressed:
+        raise LineIndexError(f"压缩文件无法随机访问，不能建索引: {', '.join(compressed)}")
+
+    index_dir.mkdir(parents=True, exist_ok=True)
+    meta_path = index_dir / META_FILENAME
+    meta_path.unlink(missing_ok=True)
+
+    entries = []
+    bytes_done = 0
+    for fp in data_files:
+        size = fp.stat().st_size
+        records = 0
+
+        def on_progress(offset: int) -> None:
+            progress(bytes_done + offset)
+
+        tmp_path = index_dir / f"{fp.name}{OFFSETS_SUFFIX}.tmp"
+        with open(tmp_path, "wb") as out:
+            for offset, lines in iter_batches(fp, 0, size, on_progress if progress else None):
+                starts = record_starts(offset, lines)
+                starts.tofile(out)
+                records += len(starts)
+            # 末尾追加结束位置，第 i 条记录为 [offsets[i], offsets[i + 1])
+            array("Q", [size]).tofile(out)
+        os.replace(tmp_path, index_dir / f"{fp.name}{OFFSETS_SUFFIX}")
+
+        entries.append(
+            {"name": fp.name, "size": size, "records": records, "checksum": file_checksum(fp, size)}
+        )
+        bytes_done += size
+
+    _write_meta(index_dir, entries)
+    return sum(e["records"] for e in entries)
+
+
+def _write_meta(index_dir: Path, entries: list[dict]) -> None:
+    meta = {"version": LINE_INDEX_VERSION, "byteorder": sys.byteorder, "files": entries}
+    with open(index_dir / META_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+
+def _read_meta(index_dir: Path) -> dict:
+    try:
+        with open(index_dir / META_FILENAME, encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        raise LineIndexError(f"索引不存在: {index_dir}") from None
+    except (OSError, ValueError) as e:
+        raise LineIndexError(f"索引无法读取: {e}") from None
+    if meta.get("version") != LINE_INDEX_VERSION or meta.get("byteorder") != sys.byteorder:
+        raise LineIndexError("索引版本或字节序不符，请重新建立")
+    return meta
+
+
+def copy_line_index(src_dir: Path, dst_dir: Path, files: list[Path]) -> None:
+    """把 files（src_dir 索引中的一部分文件）的索引复制到 dst_dir，供复制后的文件使用"""
+    meta = _read_meta(src_dir)
+    by_name = {entry["name"]: entry for entry in meta["files"]}
+    entries = [by_name[fp.name] for fp in files]
+
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    (dst_dir / META_FILENAME).unlink(missing_ok=True)
+    for entry in entries:
+        name = entry["name"] + OFFSETS_SUFFIX
+        shutil.copyfile(src_dir / name, dst_dir / name)
+    _write_meta(dst_dir, entries)
+
+
+class LineIndex:
+    """已加载的行偏移索引：记录号（跨文件连续编号）-> (文件, 字节范围)"""
+
+    def __init__(self, files: list[Path], offsets: list[memoryview], maps: list[mmap.mmap]):
+        self.files = files
+        self._offsets = offsets
+        self._maps = maps
+        # 第 k 个文件的第一条记录的全局记录号
+        self._first = list(accumulate((len(o) - 1 for o in offsets), initial=0))
+
+    @classmethod
+    def load(cls, data_files: list[Path], index_dir: Path) -> "LineIndex":
+        """加载并校验索引；文件列表不一致或任何文件已变化时抛出 LineIndexError"""
+        meta = _read_meta(index_dir)
+        entries = meta["files"]
+        if [e["name"] for e in entries] != [fp.name for fp in data_files]:
+            raise LineIndexError("数据文件列表与索引不一致，请重新建立索引")
+        for fp, entry in zip(data_files, entries):
+            size = fp.stat().st_size
+            if size != entry["size"] or file_checksum(fp, size) != entry["checksum"]:
+                raise LineIndexError(f"索引已过期（{fp.name} 已变化），请重新建立索引")
+
+        offsets, maps = [], []
+        try:
+            for fp, entry in zip(data_files, entries):
+                with open(index_dir / f"{fp.name}{OFFSETS_SUFFIX}", "rb") as f:
+                    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                maps.append(m)
+                view = memoryview(m).cast("Q")
+                if len(view) != entry["records"] + 1:
+                    view.release()
+                    raise LineIndexError(f"索引文件不完整: {fp.name}{OFFSETS_SUFFIX}")
+                offsets.append(view)
+        except OSError as e:
+            cls(data_files[: len(offsets)], offsets, maps).close()
+            raise LineIndexError(f"索引无法读取: {e}") from None
+        except LineIndexError:
+            cls(data_files[: len(offsets)], offsets, maps).close()
+            raise
+        return cls(data_files, offsets, maps)
+
+    def __len__(self) -> int:
+        return self._first[-1]
+
+    def __enter__(self) -> "LineIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for view in self._offsets:
+            view.release()
+        for m in self._maps:
+            m.close()
+        self._offsets, self._maps = [], []
+
+    def file_records(self, file_idx: int) -> int:
+        return len(self._offsets[file_idx]) - 1
+
+    def locate(self, record: int) -> tuple[int, int]:
+        """全局记录号 -> (文件序号, 文件内记录号)"""
+        if not 0 <= record < len(self):
+            raise IndexError(f"记录号超出范围: {record}")
+        file_idx = bisect.bisect_right(self._first, record) - 1
+        return file_idx, record - self._first[file_idx]
+
+    def record_ranges(self, start: int, stop: int) -> list[ByteRange]:
+        """记录 [start, stop) 所在的字节范围，按文件顺序，每个文件至多一段"""
+        ranges = []
+        for file_idx, fp in enumerate(self.files):
+            first, last = self._first[file_idx], self._first[file_idx + 1]
+            lo, hi = max(start, first), min(stop, last)
+            if lo < hi:
+                offsets = self._offsets[file_idx]
+                ranges.append((fp, offsets[lo - first], offsets[hi - first]))
+        return ranges
+
+    def read_records(self, records: Iterable[int]) -> Iterator[bytes]:
+        """按给定顺序读取记录（已去除首尾空白）；记录号有序时读取近似顺序访问"""
+        fds: dict[int, int] = {}
+        try:
+            for record in records:
+                file_idx, local = self.locate(record)
+                fd = fds.get(file_idx)
+                if fd is None:
+                    fd = fds[file_idx] = os.open(self.files[file_idx], os.O_RDONLY)
+                offsets = self._offsets[file_idx]
+                start = offsets[local]
+                yield strip_line(os.pread(fd, offsets[local + 1] - start, start))
+        finally:
+            for fd in fds.values():
+                os.close(fd)
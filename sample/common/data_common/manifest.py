@@ -0,0 +1,264 @@
+"""
+分片清单：sampler 切割时边写边统计，在输出文件夹中写出 manifest.json
+
+    {
+      "version": 1,
+      "split_by": "bytes",
+      "content_stats": false,                  条目中是否有下面的内容统计（sampler --manifest-stats）
+      "parts": [
+        {
+          "name": "part_001.jsonl",
+          "lines": 2000,                       记录数（strip 后非空的行）
+          "bytes": 1048576,                    分片文件大小
+          "crc32": "1a2b3c4d",                 分片文件内容的 CRC32
+          "sources": [{"file": "a.jsonl", "start": 0, "end": 1048000}],
+          以下为内容统计，只在 content_stats 为 true 时存在：
+          "content_types": {"chat": 1990, ...},
+          "body_types": {"txt": 1500, ...},    bodies[0].type 计数
+          "buckets": {"<200B": 1200, ...},     按行长度分桶（与 analyze 相同的 5 档）
+          "compressibility": {"5-10%": 2000},  压缩率分档的记录数（见下）
+          "body_min": 12, "body_max": 4096,    bodies[0] 字节长度（与 analyze 定义一致）
+          "parse_errors": 0
+        },
+        ...
+      ]
+    }
+
+sources 为分片内容来自的源文件字节范围，一行属于其首字节所在的范围；
+源文件为压缩文件时是解压后数据中的偏移。
+
+compressibility 为压缩率估计：每 1MB 记录取开头连续的 64KB 用 zlib（级别 6）压缩，
+这 1MB 中的记录都计入该样本压缩率所在的分档；不足 64KB 的分片整个作为一个样本。
+body_types / compressibility 为后加的字段，旧清单中没有。
+
+默认只记录复制时顺带得到的记录数、大小、CRC32 和来源范围，不解析记录；内容统计需要逐条解析 JSON，
+比切割本身慢得多，由 sampler --manifest-stats 开启。
+下游工具（filter / analyze / send_message）读取清单即可得到各分片的记录数和分布，不需要重新打开分片；
+分片文件大小与清单不符时视为过期。
+"""
+
+import json
+import re
+import zlib
+from collections import Counter
+from pathlib import Path
+
+from data_common.buckets import BUCKET_BOUNDARIES, COMPRESS_BOUNDARIES, bucket_label, compress_label
+from data_common.reader import iter_batches, strip_lines
+from data_common.records import body_bytes, loads_record
+
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+
+# 压缩率估计：每 COMPRESS_STRIDE 字节的记录取开头连续的 COMPRESS_SAMPLE_SIZE 字节压缩
+COMPRESS_STRIDE = 1024 * 1024
+COMPRESS_SAMPLE_SIZE = 64 * 1024
+COMPRESS_SAMPLE_LEVEL = 6
+
+
+# str.isspace() 为真的字符的 UTF-8 编码（ASCII 空白、\x1c-\x1f、U+0085、U+00A0、U+1680、U+2000-U+200A、
+# U+2028、U+2029、U+202F、U+205F、U+3000），与 strip_line 去除的空白一致
+_SPACE = rb"(?:[ \t\r\x0b\x0c\x1c-\x1f]|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|\xe3\x80\x80)"
+# 空白行：换行之后、下一个换行之前只有空白（与 strip_lines 丢弃的行一致）
+_BLANK_LINE = re.compile(rb"\n" + _SPACE + rb"*(?=\n)")
+# 未结束的末行仍可能是空白行：只有空白，结尾可能是被截断的多字节空白字符
+_BLANK_TAIL = re.compile(_SPACE + rb"*(?:\xc2|\xe1\x9a?|\xe2[\x80\x81]?|\xe3\x80?)?")
+
+
+class ManifestError(ValueError):
+    """清单不存在、版本不符或与分片文件不一致"""
+
+
+class PartStats:
+    """一份的统计：写入时逐批累加；content 为 False 时只统计记录数、大小、校验和与来源，不解析记录"""
+
+    def __init__(self, name: str, content: bool = True) -> None:
+        self.name = name
+        self.content = content
+        self.lines = 0
+        self.bytes = 0
+        self.crc32 = 0
+        self.sources: list[dict] = []
+        self.content_types: Counter[str] = Counter()
+        self.body_types: Counter[str] = Counter()
+        self.buckets: Counter[str] = Counter()
+        self.compressibility: Counter[str] = Counter()
+        self.body_min: int | None = None
+        self.body_max: int | None = None
+        self.parse_errors = 0
+        # 压缩率抽样的状态：当前样本的行、样本字节数、距下一个样本还需跳过的字节数、自上个样本以来的记录数
+        self._sample: list[bytes] = []
+        self._sample_size = 0
+        self._skip = 0
+        self._covered = 0
+        self._last_label: str | None = None
+        # add_raw：上一段末尾未结束的空白行（从换行开始）
+        self._raw_tail = b""
+
+    def add_source(self, filepath: Path, start: int, end: int) -> None:
+        """记录来源字节范围；与上一段同属一个文件时合并（两段之间只可能是空白）"""
+        if self.sources and self.sources[-1]["file"] == filepath.name:
+            self.sources[-1]["end"] = end
+        else:
+            self.sources.append({"file": filepath.name, "start": start, "end": end})
+
+    def add_bytes(self, data: bytes) -> None:
+        """累加写入分片文件的字节"""
+        self.bytes += len(data)
+        self.crc32 = zlib.crc32(data, self.crc32)
+
+    def add_raw(self, data: bytes) -> None:
+        """累加原样复制的一段数据中的记录数（非空白的行），不解析内容；一行可以跨越两次调用
+
+        数据须从行首开始、以换行结束（copy_part 写出的各段即是如此）。
+        """
+        text = self._raw_tail + data if self._raw_tail else data
+        self.lines += data.count(b"\n") - len(_BLANK_LINE.findall(text))
+        cut = text.rfind(b"\n")
+        self._raw_tail = text[cut:] if cut >= 0 and _BLANK_TAIL.fullmatch(text, cut + 1) else b""
+
+    def add_records(self, lines: list[bytes]) -> None:
+        """累加一批记录（已去除首尾空白的非空行）"""
+        self.lines += len(lines)
+        if not self.content:
+            return
+        self.buckets.update(map(bucket_label, map(len, lines)))
+        self._sample_lines(lines)
+        content_types = []
+        body_types = []
+        body_min, body_max = self.body_min, self.body_max
+        for line in lines:
+            try:
+                record = loads_record(line)
+                content_type = str(record.get("content_type", "unknown"))
+                bodies = record.get("payload", {}).get("bodies", [])
+                # 与 analyze 的 bodies[0].type 口径一致
+                body_type = str(bodies[0].get("type", "unknown")) if bodies else "(empty)"
+                size = body_bytes(bodies[0]) if bodies else 0
+            except (ValueError, AttributeError):
+                self.parse_errors += 1
+                continue
+            content_types.append(content_type)
+            body_types.append(body_type)
+            if body_min is None or size < body_min:
+                body_min = size
+            if body_max is None or size > body_max:
+                body_max = size
+        self.body_min, self.body_max = body_min, body_max
+        self.content_types.update(content_types)
+        self.body_types.update(body_types)
+
+    def _sample_lines(self, lines: list[bytes]) -> None:
+        """压缩率抽样：按字节跳过，攒够一个样本时压缩"""
+        for line in lines:
+            self._covered += 1
+            if self._skip > 0:
+                self._skip -= len(line) + 1
+                continue
+            self._sample.append(line)
+            self._sample_size += len(line) + 1
+            if self._sample_size >= COMPRESS_SAMPLE_SIZE:
+                self._flush_sample()
+
+    def _flush_sample(self) -> None:
+        if self._sample:
+            data = b"\n".join(self._sample)
+            self._last_label = compress_label(len(zlib.compress(data, COMPRESS_SAMPLE_LEVEL)) / len(data))
+            self._skip = COMPRESS_STRIDE - self._sample_size
+            self._sample = []
+            self._sample_size = 0
+        if self._covered and self._last_label is not None:
+            self.compressibility[self._last_label] += self._covered
+            self._covered = 0
+
+    def scan_file(self, path: Path) -> None:
+        """读取已写好的分片文件统计内容（原样复制时数据不经过 Python，只能事后读取）"""
+        with open(path, "rb") as f:
+            while block := f.read(1024 * 1024):
+                self.add_bytes(block)
+        for _, lines in iter_batches(path):
+            self.add_records(strip_lines(lines))
+
+    def to_dict(self) -> dict:
+        entry = {
+            "name": self.name,
+            "lines": self.lines,
+            "bytes": self.bytes,
+            "crc32": f"{self.crc32:08x}",
+            "sources": self.sources,
+        }
+        if not self.content:
+            return entry
+        # 未攒满的样本（或样本之后跳过的记录）在这里计入
+        self._flush_sample()
+        return {
+            **entry,
+            "content_types": dict(self.content_types.most_common()),
+            "body_types": dict(self.body_types.most_common()),
+            "buckets": {label: self.buckets[label] for _, label in BUCKET_BOUNDARIES if label in self.buckets},
+            "compressibility": {
+                label: self.compressibility[label] for _, label in COMPRESS_BOUNDARIES if label in self.compressibility
+            },
+            "body_min": self.body_min,
+            "body_max": self.body_max,
+            "parse_errors": self.parse_errors,
+        }
+
+
+def file_crc32(path: Path) -> str:
+    """整个文件的 CRC32（用于按清单校验分片）"""
+    crc = 0
+    with open(path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            crc = zlib.crc32(block, crc)
+    return f"{crc:08x}"
+
+
+def write_manifest(output_dir: Path, parts: list[dict], **info) -> Path:
+    """写出 manifest.json；info 为切割参数（如 split_by），原样写入顶层"""
+    manifest = {"version": MANIFEST_VERSION, **info, "parts": parts}
+    path = output_dir / MANIFEST_FILENAME
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    tmp_path.replace(path)
+    return path
+
+
+def read_manifest(dir_path: Path) -> dict:
+    """读取 manifest.json 的全部内容"""
+    try:
+        with open(dir_path / MANIFEST_FILENAME, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ManifestError(f"清单不存在: {dir_path / MANIFEST_FILENAME}") from None
+    except (OSError, ValueError) as e:
+        raise ManifestError(f"清单无法读取: {e}") from None
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ManifestError("清单版本不符，请重新切割")
+    return manifest
+
+
+def load_manifest(dir_path: Path, part_files: list[Path]) -> dict[Path, dict]:
+    """读取清单中 part_files 各自的条目；有文件不在清单中或大小不符时抛出 ManifestError"""
+    manifest = read_manifest(dir_path)
+    by_name = {entry["name"]: entry for entry in manifest["parts"]}
+    entries = {}
+    for fp in part_files:
+        entry = by_name.get(fp.name)
+        if entry is None:
+            raise ManifestError(f"清单中没有 {fp.name}")
+        if fp.stat().st_size != entry["bytes"]:
+            raise ManifestError(f"清单已过期（{fp.name} 大小不符）")
+        entries[fp] = entry
+    return entries
+
+
+def copy_manifest(src_dir: Path, dst_dir: Path, files: list[Path]) -> None:
+    """把 files（src_dir 清单中的一部分分片）的条目写成 dst_dir 的清单"""
+    manifest = read_manifest(src_dir)
+    names = {fp.name for fp in files}
+    parts = [entry for entry in manifest.pop("parts") if entry["name"] in names]
+    manifest.pop("version")
+    write_manifest(dst_dir, parts, **manifest)
@@ -0,0 +1,244 @@
+"""
+运行计量与性能剖析
+
+Metrics：分阶段耗时（read / parse / stats / write 等）、行数与字节数计数、吞吐和峰值内存，
+用于发现性能回退、估算夜间任务所需的机器规格。计时以批（4MB 块）或文件为单位，
+不在逐行循环里读时钟；未启用时 phase() / timed() 直接返回空操作，没有额外开销。
+
+Profiler：--profile 的实现，支持
+  - cprofile：标准库 cProfile，确定性剖析，开销较大但调用次数精确
+  - sample：采样剖析，后台线程每隔几毫秒记录一次主线程调用栈，开销很小，
+    可输出 flamegraph.pl / speedscope 能直接读取的折叠栈（folded）格式
+
+多进程模式下只统计主进程；工作进程的耗时体现在主进程的对应阶段中。
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计峰值内存
+    resource = None
+
+from data_common.files import format_bytes
+
+# 采样剖析的默认间隔（秒）
+SAMPLE_INTERVAL = 0.005
+# 剖析报告中列出的函数数
+PROFILE_TOP = 25
+PROFILE_MODES = ("cprofile", "sample")
+
+_NULL_CONTEXT = nullcontext()
+
+
+def peak_rss() -> dict[str, int] | None:
+    """本进程与已结束子进程的峰值常驻内存（字节），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+    unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit,
+    }
+
+
+class Metrics:
+    """一次运行的计量：分阶段耗时、行数 / 字节数计数、吞吐与峰值内存"""
+
+    def __init__(self, tool: str, enabled: bool = True) -> None:
+        self.tool = tool
+        self.enabled = enabled
+        self.phases: dict[str, float] = {}
+        self.lines = 0
+        self.bytes = 0
+        self.extra: dict = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def _timer(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - t0
+
+    def phase(self, name: str):
+        """计时上下文：with metrics.phase("write"): ...，同名阶段累加"""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timer(name)
+
+    def timed(self, name: str, iterable: Iterable, body: str | None = None) -> Iterator:
+        """把每次从 iterable 取下一项的耗时计入阶段 name（用于区分读取与处理）
+
+        body 不为 None 时，调用方处理每一项的耗时（两次取值之间）计入阶段 body。
+        """
+        if not self.enabled:
+            return iter(iterable)
+        return self._timed(name, iterable, body)
+
+    def _timed(self, name: str, iterable: Iterable, body: str | None) -> Iterator:
+        it = iter(iterable)
+        phases = self.phases
+        perf_counter = time.perf_counter
+        while True:
+            t0 = perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                phases[name] = phases.get(name, 0.0) + perf_counter() - t0
+                return
+            t1 = perf_counter()
+            phases[name] = phases.get(name, 0.0) + t1 - t0
+            yield item
+            if body is not None:
+                phases[body] = phases.get(body, 0.0) + perf_counter() - t1
+
+    def add(self, lines: int = 0, nbytes: int = 0) -> None:
+        """累加处理的行数与输入字节数"""
+        self.lines += lines
+        self.bytes += nbytes
+
+    def summary(self) -> dict:
+        wall = time.perf_counter() - self._start
+        return {
+            "tool": self.tool,
+            "argv": sys.argv[1:],
+            "wall_seconds": round(wall, 3),
+            "phases": {name: round(sec, 3) for name, sec in self.phases.items()},
+            "lines": self.lines,
+            "bytes": self.bytes,
+            "lines_per_second": round(self.lines / wall, 1) if wall > 0 else 0,
+            "mb_per_second": round(self.bytes / wall / (1024 * 1024), 2) if wall > 0 else 0,
+            "peak_rss_bytes": peak_rss(),
+            **self.extra,
+        }
+
+    def report(self, json_path: Path | None = None) -> None:
+        """打印计量摘要，json_path 不为 None 时同时写入 JSON 文件"""
+        if not self.enabled:
+            return
+        summary = self.summary()
+        wall = summary["wall_seconds"]
+        print(f"\n{'── ⏱️  运行计量 ──':─^56}")
+        print(f"  总耗时:     {wall:.2f}s")
+        for name, sec in summary["phases"].items():
+            pct = sec / wall * 100 if wall > 0 else 0
+            print(f"  {name:<12}{sec:>9.2f}s {pct:>6.1f}%")
+        untimed = wall - sum(summary["phases"].values())
+        if summary["phases"] and untimed >= 0.01:
+            print(f"  {'(其他)':<10}{untimed:>9.2f}s {untimed / wall * 100:>6.1f}%")
+        if summary["lines"]:
+            print(f"  行数:       {summary['lines']:,}（{summary['lines_per_second']:,.0f} 行/s）")
+        print(f"  输入字节:   {format_bytes(summary['bytes'])}（{summary['mb_per_second']:.1f} MB/s）")
+        rss = summary["peak_rss_bytes"]
+        if rss is not None:
+            children = f"，子进程 {format_bytes(rss['children'])}" if rss["children"] else ""
+            print(f"  峰值内存:   {format_bytes(rss['self'])}{children}")
+        if json_path is not None:
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+                f.write("\n")
+            print(f"  📝 已写入: {json_path}")
+
+
+class Profiler:
+    """--profile MODE[:FILE] 的实现，用作上下文管理器包住要剖析的代码"""
+
+    def __init__(self, mode: str, output: Path | None = None, interval: float = SAMPLE_INTERVAL):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"--profile 可选: {', '.join(PROFILE_MODES)}（可加 :输出文件）")
+        self.mode = mode
+        self.output = output
+        self.interval = interval
+        self._profile = None
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def parse(cls, spec: str) -> "Profiler":
+        """解析 MODE[:FILE]，例如 cprofile、sample:analyze.folded"""
+        mode, _, output = spec.partition(":")
+        return cls(mode, Path(output) if output else None)
+
+    def __enter__(self) -> "Profiler":
+        if self.mode == "cprofile":
+            import cProfile
+
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            target = threading.get_ident()
+            self._thread = threading.Thread(
+                target=self._sample, args=(target,), name="profiler", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._profile is not None:
+            self._profile.disable()
+        else:
+            self._stop.set()
+            self._thread.join()
+        self.report()
+
+    def _sample(self, target: int) -> None:
+        """采样线程：定时记录目标线程的调用栈（由外到内）"""
+        stacks = self._stacks
+        labels: dict = {}  # code 对象 -> 显示名称，避免每次采样都格式化
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = (
+                        f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+                    )
+                stack.append(label)
+                frame = frame.f_back
+            if stack:
+                stacks[tuple(reversed(stack))] += 1
+
+    def report(self) -> None:
+        print(f"\n{'── 🔬 性能剖析 (' + self.mode + ') ──':─^56}")
+        if self._profile is not None:
+            import pstats
+
+            stats = pstats.Stats(self._profile, stream=sys.stdout)
+            stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+            if self.output is not None:
+                stats.dump_stats(self.output)
+                print(f"  📝 已写入: {self.output}（可用 snakeviz / pstats 查看）")
+            return
+
+        total = sum(self._stacks.values())
+        if total == 0:
+            print("  没有采到样本（运行时间太短）")
+            return
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, n in self._stacks.items():
+            own[stack[-1]] += n
+            for func in set(stack):
+                inclusive[func] += n
+        print(f"  样本数: {total:,}（每 {self.interval * 1000:g}ms 一次）")
+        print(f"  {'自身':>7} {'累计':>7}  函数")
+        for func, n in own.most_common(PROFILE_TOP):
+            print(f"  {n / total * 100:>6.1f}% {inclusive[func] / total * 100:>6.1f}%  {func}")
+        if self.output is not None:
+            with open(self.output, "w", encoding="utf-8") as f:
+                for stack, n in self._stacks.items():
+                    f.write(f"{';'.join(stack)} {n}\n")
+            print(f"  📝 已写入: {self.output}（折叠栈格式，可用 flamegraph.pl / speedscope 查看）")
@@ -0,0 +1,159 @@
+"""
+高吞吐 JSONL 读取
+
+以二进制大块读取文件，用 bytes.split 一次切出整块中的所有行，按批交给调用方，
+不做逐行解码、strip、重新编码，也不逐行读时钟。
+
+行的归属规则：一行属于其首字节所在的字节范围。按 [start, end) 读取时，
+若 start 落在某行中间，该行由前一个范围负责，因此把文件切成任意相邻范围
+分别读取，既不会重复也不会遗漏（用于多进程分片）。
+
+返回的行不含结尾的 "\\n"，但保留其余字节（如 "\\r"），是否 strip 由调用方决定
+（strip_line / strip_lines 与文本模式的 str.strip() 结果一致）。
+
+压缩文件（.gz / .zst / .lz4，见 compressed.py）在后台线程中流式解压：只能整体读取，
+行偏移是解压后数据中的偏移，进度回调的参数是已读取的压缩字节数。
+"""
+
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+from data_common.compressed import is_compressed, iter_decompressed
+
+# 每次从磁盘读取的字节数
+CHUNK_SIZE = 4 * 1024 * 1024
+# 进度回调的最小间隔（秒）
+PROGRESS_INTERVAL = 1.0
+
+# progress(当前文件偏移)：每读完一块检查一次，最多每 PROGRESS_INTERVAL 秒调用一次
+# （压缩文件为已读取的压缩字节数，与文件大小可直接比较）
+ProgressCallback = Callable[[int], None]
+
+
+class Throttle:
+    """限制某个动作的频率：ready() 距上次返回 True 超过 interval 秒时才返回 True"""
+
+    def __init__(self, interval: float = PROGRESS_INTERVAL) -> None:
+        self.interval = interval
+        self._next = time.monotonic() + interval
+
+    def ready(self) -> bool:
+        now = time.monotonic()
+        if now < self._next:
+            return False
+        self._next = now + self.interval
+        return True
+
+
+def iter_batches(
+    path: Path,
+    start: int = 0,
+    end: int | None = None,
+    progress: ProgressCallback | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[tuple[int, list[bytes]]]:
+    """按批读取 [start, end) 范围内的行，产出 (本批第一行的文件偏移, 行列表)
+
+    批内第 i + 1 行的偏移 = 第 i 行偏移 + len(第 i 行) + 1。
+    压缩文件只能整体读取：start 必须为 0，end 被忽略。
+    """
+    if is_compressed(path):
+        if start != 0:
+            raise ValueError(f"压缩文件不能从中间开始读取: {path.name}")
+        yield from _iter_compressed_batches(path, progress, chunk_size)
+        return
+
+    throttle = Throttle() if progress is not None else None
+    with open(path, "rb") as f:
+        if end is None:
+            end = f.seek(0, 2)
+        pos = start
+        f.seek(start)
+        if start > 0:
+            # 跳过 start 所在的残行（从 start - 1 读到换行为止）
+            f.seek(start - 1)
+            pos = start - 1 + len(f.readline())
+
+        carry = b""
+        while pos < end:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                # 文件末尾没有换行的最后一行
+                if carry:
+                    yield pos, [carry]
+                break
+
+            data = carry + chunk if carry else chunk
+            lines = data.split(b"\n")
+            carry = lines.pop()
+            data_end = pos + len(data) - len(carry)
+
+            if data_end > end:
+                # 本块越过了 end：只保留首字节在 end 之前的行
+                keep = data.count(b"\n", 0, end - pos - 1) + 1
+                yield pos, lines[:keep]
+                break
+            if lines:
+                yield pos, lines
+            pos = data_end
+
+            if throttle is not None and throttle.ready():
+                progress(pos)
+
+
+def _iter_compressed_batches(
+    path: Path, progress: ProgressCallback | None, chunk_size: int
+) -> Iterator[tuple[int, list[bytes]]]:
+    """iter_batches 的压缩文件版本：切行规则相同，偏移为解压后的偏移"""
+    throttle = Throttle() if progress is not None else None
+    pos = 0
+    carry = b""
+    for raw_pos, chunk in iter_decompressed(path, chunk_size):
+        if not chunk:
+            if carry:
+                yield pos, [carry]
+            break
+
+        data = carry + chunk if carry else chunk
+        lines = data.split(b"\n")
+        carry = lines.pop()
+        if lines:
+            yield pos, lines
+        pos += len(data) - len(carry)
+
+        if throttle is not None and throttle.ready():
+            progress(raw_pos)
+
+
+def iter_lines(
+    path: Path,
+    start: int = 0,
+    end: int | None = None,
+    progress: ProgressCallback | None = None,
+) -> Iterator[tuple[int, bytes]]:
+    """逐行产出 (行首文件偏移, 行内容)，适合需要精确偏移的调用方"""
+    for offset, lines in iter_batches(path, start, end, progress):
+        for line in lines:
+            yield offset, line
+            offset += len(line) + 1
+
+
+def strip_line(line: bytes) -> bytes:
+    """去除一行首尾的空白，结果与文本模式的 str.strip() 一致
+
+    bytes.strip 只去除 ASCII 空白；结果不是 {...} 形式时（首尾可能还有全角空格等 Unicode 空白），
+    再按文本去除一次。绝大多数记录行只需一次 bytes.strip。
+    """
+    stripped = line.strip()
+    if stripped and (stripped[0] != 0x7B or stripped[-1] != 0x7D):
+        stripped = stripped.decode("utf-8", "surrogateescape").strip().encode("utf-8", "surrogateescape")
+    return stripped
+
+
+def strip_lines(lines: list[bytes]) -> list[bytes]:
+    """去除每行首尾空白（同 strip_line）并丢弃空行"""
+    stripped = list(filter(None, map(bytes.strip, lines)))
+    if all(line[0] == 0x7B and line[-1] == 0x7D for line in stripped):
+        return stripped
+    return list(filter(None, map(strip_line, stripped)))
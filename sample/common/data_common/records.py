@@ -0,0 +1,116 @@
+"""
+记录解析：整行 JSON 解析与 bodies[0] 字节长度（analyze 报告与 sampler 分片清单共用，保证口径一致）
+
+bodies[0] 长度的定义：len(json.dumps(body, ensure_ascii=False).encode())。
+
+json.loads / json.dumps 每次调用都要重新创建解析器 / 编码器，
+对几百字节的小记录来说这部分固定开销比真正的解析还大。这里：
+  - 直接复用 C 实现的扫描器和编码器（json.scanner / json.encoder），行为与
+    json.loads / json.dumps(ensure_ascii=False) 完全一致，只是省掉每次的初始化
+  - 安装了 orjson 时用它解析整行；body 长度用 orjson 的紧凑输出长度加上
+    json.dumps 默认分隔符 ", " / ": " 多出的空格数得到，不再经过 json.dumps；
+    body 中有浮点数（两者格式化规则不同）时改用标准库编码器
+  - orjson 拒绝而标准库接受的少数输入（超过 64 位的整数、NaN 等）交给标准库裁决
+
+orjson 为可选依赖，由各工具的 fast extra 安装：uv run --extra fast main.py ...
+"""
+
+import json
+from json import encoder, scanner
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+_scan_once = scanner.make_scanner(json.JSONDecoder())
+# 与 json.dumps(obj, ensure_ascii=False) 参数一致：
+# (markers, default, encoder, indent, key_sep, item_sep, sort_keys, skipkeys, allow_nan)
+_encode = encoder.c_make_encoder(
+    None,
+    json.JSONEncoder(ensure_ascii=False).default,
+    encoder.encode_basestring,
+    None,
+    ": ",
+    ", ",
+    False,
+    False,
+    True,
+) if encoder.c_make_encoder is not None else None
+
+
+class _HasFloat(Exception):
+    pass
+
+
+def _separator_count(obj) -> int:
+    """obj 中结构性的 ':' 和 ',' 个数（json.dumps 会在每个之后多输出一个空格）"""
+    t = type(obj)
+    if t is dict:
+        n = 2 * len(obj) - 1 if obj else 0
+        values = obj.values()
+    elif t is list:
+        n = len(obj) - 1 if obj else 0
+        values = obj
+    else:
+        return 0
+    for v in values:
+        tv = type(v)
+        if tv is dict or tv is list:
+            n += _separator_count(v)
+        elif tv is float:
+            raise _HasFloat
+    return n
+
+
+def _stdlib_loads(line: bytes):
+    text = line.decode("utf-8", "surrogatepass")
+    try:
+        record, end = _scan_once(text, 0)
+    except StopIteration:
+        raise ValueError("invalid JSON") from None
+    if end != len(text):
+        # 调用方已去除首尾空白，剩余内容即为多余数据
+        raise ValueError("extra data")
+    return record
+
+
+def loads_record(line: bytes):
+    """解析一行（已去除首尾空白），失败时抛出 ValueError"""
+    if orjson is not None:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            pass
+    return _stdlib_loads(line)
+
+
+def body_json_bytes(body) -> bytes:
+    """bodies[0] 的 JSON 字节（与长度定义一致：json.dumps(body, ensure_ascii=False)）"""
+    if _encode is None:
+        body_json = json.dumps(body, ensure_ascii=False)
+    else:
+        body_json = "".join(_encode(body, 0))
+    return body_json.encode("utf-8", "surrogatepass")
+
+
+def _stdlib_body_bytes(body) -> int:
+    if _encode is None:
+        body_json = json.dumps(body, ensure_ascii=False)
+    else:
+        body_json = "".join(_encode(body, 0))
+    if body_json.isascii():
+        return len(body_json)
+    return len(body_json.encode("utf-8", "surrogatepass"))
+
+
+def body_bytes(body) -> int:
+    """bodies[0] 的 JSON 字节长度"""
+    if orjson is not None:
+        try:
+            return len(orjson.dumps(body)) + _separator_count(body)
+        except (_HasFloat, TypeError):
+            pass
+    return _stdlib_body_bytes(body)
@@ -0,0 +1,130 @@
+"""
+选择清单：filter --lazy 只写出选中了哪些分片（及其中的哪一段），不复制数据
+
+    <输出文件夹>/selection.json
+    {
+      "version": 1,
+      "source": "/data/parts",                 筛选的分片文件夹（仅供查看）
+      "mode": "even",
+      "parts": [
+        {"path": "/data/parts/part_003.jsonl", "bytes": 2915123, "lines": 5000},
+        {"path": "/data/parts/part_010.jsonl", "bytes": 2915123, "start": 0, "end": 1048576},
+        {"path": "part_020.jsonl", "bytes": 2915123, "records": [100, 200]}
+      ]
+    }
+
+每项为一个文件（path 为相对路径时相对于清单所在的文件夹）及其中的一段：
+  - 不写范围时为整个文件
+  - start / end：字节范围 [start, end)，一行属于其首字节所在的范围（与 iter_batches 一致）
+  - records：文件内的记录号范围 [a, b)，借助分片文件夹的行偏移索引换算为字节范围
+bytes 为选择时的文件大小，大小不符时视为过期；lines 为该段的记录数（已知时）。
+压缩文件无法按范围读取，只能整个选中。
+
+下游工具（analyze / send_message）的输入为清单文件，或含有 selection.json 的文件夹：
+按清单中的顺序流式读取各段，只读取选中的数据；重新筛选只需改写这个小文件，不产生数据 I/O。
+"""
+
+import json
+from pathlib import Path
+
+from data_common.compressed import is_compressed
+from data_common.files import get_data_files
+from data_common.lineindex import LINE_INDEX_DIRNAME, ByteRange, LineIndex, LineIndexError
+
+SELECTION_VERSION = 1
+SELECTION_FILENAME = "selection.json"
+
+
+class SelectionError(ValueError):
+    """选择清单无法读取、版本不符，或引用的文件不存在 / 已变化"""
+
+
+def find_selection(path: Path) -> Path | None:
+    """path 为选择清单文件，或为含有 selection.json 的文件夹时返回清单路径，否则为 None"""
+    if path.is_dir():
+        candidate = path / SELECTION_FILENAME
+        return candidate if candidate.is_file() else None
+    if path.is_file() and path.suffix == ".json":
+        return path
+    return None
+
+
+def write_selection(output_dir: Path, parts: list[dict], **info) -> Path:
+    """写出 selection.json（先写临时文件再替换）；info 为筛选参数（如 mode），原样写入顶层"""
+    selection = {"version": SELECTION_VERSION, **info, "parts": parts}
+    output_dir.mkdir(parents=True, exist_ok=True)
+    path = output_dir / SELECTION_FILENAME
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(selection, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    tmp_path.replace(path)
+    return path
+
+
+def _record_range(filepath: Path, first: int, stop: int, indexes: dict[Path, LineIndex]) -> ByteRange:
+    """文件内记录 [first, stop) -> 字节范围，索引按文件夹加载一次"""
+    dir_path = filepath.parent
+    line_index = indexes.get(dir_path)
+    if line_index is None:
+        try:
+            line_index = LineIndex.load(get_data_files(dir_path), dir_path / LINE_INDEX_DIRNAME)
+        except LineIndexError as e:
+            raise SelectionError(f"{filepath.name} 按记录号选择需要行偏移索引: {e}") from None
+        indexes[dir_path] = line_index
+    file_idx = line_index.files.index(filepath)
+    if not 0 <= first <= stop <= line_index.file_records(file_idx):
+        raise SelectionError(f"{filepath.name} 的记录范围超出文件: [{first}, {stop})")
+    base = sum(line_index.file_records(k) for k in range(file_idx))
+    ranges = line_index.record_ranges(base + first, base + stop)
+    return ranges[0] if ranges else (filepath, 0, 0)
+
+
+def load_selection(path: Path) -> tuple[list[ByteRange], list[int | None]]:
+    """读取选择清单，返回各段的字节范围及其记录数（未知时为 None）
+
+    文件不存在、大小与清单不符、范围不合法时抛出 SelectionError。
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            selection = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SelectionError(f"选择清单无法读取: {e}") from None
+    if not isinstance(selection, dict) or selection.get("version") != SELECTION_VERSION:
+        raise SelectionError(f"不是选择清单或版本不符: {path}")
+
+    ranges: list[ByteRange] = []
+    counts: list[int | None] = []
+    indexes: dict[Path, LineIndex] = {}
+    try:
+        for entry in selection["parts"]:
+            filepath = path.parent / entry["path"]
+            try:
+                size = filepath.stat().st_size
+            except OSError:
+                raise SelectionError(f"选中的文件不存在: {filepath}") from None
+            if size != entry["bytes"]:
+                raise SelectionError(f"选择清单已过期（{filepath.name} 大小不符），请重新筛选")
+
+            lines = entry.get("lines")
+            if "records" in entry:
+                first, stop = entry["records"]
+                byte_range = _record_range(filepath, first, stop, indexes)
+                lines = stop - first
+            else:
+                byte_range = (filepath, entry.get("start", 0), entry.get("end", size))
+            _, start, end = byte_range
+            if not 0 <= start <= end <= size:
+                raise SelectionError(f"{filepath.name} 的字节范围超出文件: [{start}, {end})")
+            if is_compressed(filepath) and (start, end) != (0, size):
+                raise SelectionError(f"压缩文件只能整个选中: {filepath.name}")
+            ranges.append(byte_range)
+            counts.append(lines)
+    except SelectionError:
+        raise
+    except (KeyError, TypeError, ValueError) as e:
+        raise SelectionError(f"选择清单格式错误: {e!r}") from None
+    finally:
+        for line_index in indexes.values():
+            line_index.close()
+    return ranges, counts
@@ -0,0 +1,171 @@
+"""
+时间范围索引：每个数据文件、每个数据块（按字节每 TIME_BLOCK_SIZE 一块）中记录时间戳的最小 / 最大值
+
+sampler 按时间窗口抽取（--time-window）或按时间等分（--split-by time）时使用，第一次使用时建立：
+
+    <数据目录>/.time_index/<时间字段>.json
+    {
+      "version": 1,
+      "field": "timestamp",
+      "block_size": 1048576,
+      "files": [
+        {
+          "name": "2026012000", "size": 28000000, "checksum": "...",
+          "records": 49893, "missing": 0,          记录数、没有时间戳（或解析失败）的记录数
+          "min": 1769529622835, "max": 1769530872951,
+          "sorted": true,                          时间戳是否按文件顺序非递减
+          "blocks": [[0, 1769529622835, 1769529649021, 1790], ...]
+        },
+        ...
+      ]
+    }
+
+blocks 每项为 [块号, 最小时间戳, 最大时间戳, 记录数]，只列出有带时间戳记录的块；
+一条记录属于其行首字节所在的块（与 iter_batches 的首字节归属规则一致），
+块 k 的记录即 iter_batches(文件, k × block_size, (k + 1) × block_size) 读到的记录。
+压缩文件无法按字节定位，整个文件只有块 0。
+
+时间戳为记录顶层字段的整数值（IM 导出为毫秒时间戳），也接受数字字符串。
+校验方式与行偏移索引相同（文件大小 + 头尾哈希），文件变化后重新建立。
+"""
+
+import json
+import math
+import os
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from data_common.compressed import is_compressed
+from data_common.lineindex import file_checksum, record_starts
+from data_common.reader import iter_batches, strip_lines
+from data_common.records import loads_record
+
+TIME_INDEX_VERSION = 1
+TIME_INDEX_DIRNAME = ".time_index"
+DEFAULT_TIME_FIELD = "timestamp"
+TIME_BLOCK_SIZE = 1024 * 1024
+
+
+class TimeIndexError(ValueError):
+    """时间索引不存在、已过期或无法建立"""
+
+
+def record_time(line: bytes, field: str) -> int | None:
+    """一行记录（已去除首尾空白）的时间戳，没有该字段或无法解析时为 None"""
+    try:
+        record = loads_record(line)
+        value = record.get(field)
+    except (ValueError, AttributeError):
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, float):
+        # 标准库 json 接受 NaN / Infinity
+        return int(value) if math.isfinite(value) else None
+    # isdigit 对 "²" 等非 ASCII 数字也为真，int() 却无法转换
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    return None
+
+
+def index_file(path: Path, field: str, block_size: int = TIME_BLOCK_SIZE) -> dict:
+    """一遍读取一个文件，统计各块的时间范围（进程池任务）"""
+    size = path.stat().st_size
+    compressed = is_compressed(path)
+    blocks: dict[int, list[int]] = {}
+    records = missing = 0
+    sorted_ = True
+    last: int | None = None
+    for offset, lines in iter_batches(path):
+        starts = record_starts(offset, lines)
+        lines = strip_lines(lines)
+        records += len(lines)
+        for start, line in zip(starts, lines):
+            ts = record_time(line, field)
+            if ts is None:
+                missing += 1
+                continue
+            if last is not None and ts < last:
+                sorted_ = False
+            last = ts
+            k = 0 if compressed else start // block_size
+            block = blocks.get(k)
+            if block is None:
+                blocks[k] = [k, ts, ts, 1]
+            else:
+                if ts < block[1]:
+                    block[1] = ts
+                elif ts > block[2]:
+                    block[2] = ts
+                block[3] += 1
+    ordered = [blocks[k] for k in sorted(blocks)]
+    return {
+        "name": path.name,
+        "size": size,
+        "checksum": file_checksum(path, size),
+        "records": records,
+        "missing": missing,
+        "min": min((b[1] for b in ordered), default=None),
+        "max": max((b[2] for b in ordered), default=None),
+        "sorted": sorted_,
+        "blocks": ordered,
+    }
+
+
+def _index_path(index_dir: Path, field: str) -> Path:
+    return index_dir / f"{field}.json"
+
+
+def build_time_index(
+    data_files: list[Path],
+    field: str = DEFAULT_TIME_FIELD,
+    workers: int = 1,
+    progress: Callable[[int], None] | None = None,
+) -> list[dict]:
+    """建立时间索引（各文件由进程池并行读取），返回各文件的条目，写出见 save_time_index
+
+    progress(已完成的文件数) 在每个文件完成后调用。
+    """
+    entries: list[dict] = []
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(data_files)))) as pool:
+        for done, entry in enumerate(pool.map(index_file, data_files, [field] * len(data_files)), 1):
+            entries.append(entry)
+            if progress is not None:
+                progress(done)
+    return entries
+
+
+def save_time_index(entries: list[dict], index_dir: Path, field: str) -> None:
+    """写出索引文件（先写临时文件再替换）；无法写入（如数据目录只读）时抛出 TimeIndexError"""
+    index = {"version": TIME_INDEX_VERSION, "field": field, "block_size": TIME_BLOCK_SIZE, "files": entries}
+    try:
+        index_dir.mkdir(parents=True, exist_ok=True)
+        path = _index_path(index_dir, field)
+        tmp_path = path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        raise TimeIndexError(f"无法写入时间索引: {e}") from None
+
+
+def load_time_index(data_files: list[Path], index_dir: Path, field: str = DEFAULT_TIME_FIELD) -> list[dict]:
+    """加载并校验时间索引；不存在、文件列表不一致或任何文件已变化时抛出 TimeIndexError"""
+    try:
+        with open(_index_path(index_dir, field), encoding="utf-8") as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        raise TimeIndexError("时间索引不存在") from None
+    except (OSError, ValueError) as e:
+        raise TimeIndexError(f"时间索引无法读取: {e}") from None
+    if index.get("version") != TIME_INDEX_VERSION or index.get("block_size") != TIME_BLOCK_SIZE:
+        raise TimeIndexError("时间索引版本不符")
+    entries = index["files"]
+    if [e["name"] for e in entries] != [fp.name for fp in data_files]:
+        raise TimeIndexError("数据文件列表与时间索引不一致")
+    for fp, entry in zip(data_files, entries):
+        size = fp.stat().st_size
+        if size != entry["size"] or file_checksum(fp, size) != entry["checksum"]:
+            raise TimeIndexError(f"时间索引已过期（{fp.name} 已变化）")
+    return entries
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+IM 数据字典压缩评估工具
+
+单条 IM 消息大多只有几百字节，逐条 LZ4 压缩几乎没有收益。本工具评估“预共享字典”
+方案：用一部分分片文件训练压缩字典，在其余分片（留出集）上逐条压缩，对比有 / 无字典的
+压缩率和速度，按长度分桶、按 bodies[0].type 分别输出。
+
+  - zstd：zstandard.train_dictionary 训练的标准字典
+  - LZ4：块格式的前缀字典。LZ4 只能引用前 64KB 的内容，取 zstd 字典末尾 64KB
+    （zstd 字典的内容段在末尾，越靠后的内容越常用）
+
+用法:
+    uv run main.py <分片文件夹路径> [选项]
+
+示例:
+    uv run main.py ../sampler/output
+    uv run main.py ../filter/selected --train-ratio 0.3 --workers 4
+    uv run main.py ../sampler/output --save-dict ./dict
+"""
+
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import lz4.block
+import zstandard
+from data_common import (
+    BUCKET_BOUNDARIES,
+    JSON_BACKEND,
+    body_json_bytes,
+    bucket_label,
+    format_bytes,
+    get_data_files,
+    iter_batches,
+    loads_record,
+    strip_lines,
+)
+
+# 默认字典大小（与 zstd 命令行 --train 默认值一致）
+DEFAULT_DICT_SIZE = 112640
+# LZ4 前缀字典最多能被引用的长度
+LZ4_DICT_SIZE = 64 * 1024
+# 训练集占分片文件的比例
+DEFAULT_TRAIN_RATIO = 0.2
+# 每种压缩对象最多采样的训练记录数
+DEFAULT_MAX_SAMPLES = 100_000
+DEFAULT_ZSTD_LEVEL = 3
+
+# 压缩对象 -> 显示名称
+TARGETS = {"line": "整行", "body": "bodies[0]"}
+# 对比的压缩方式（顺序即报告列顺序）
+METHODS = ["lz4", "lz4+dict", "zstd", "zstd+dict"]
+
+PARSE_ERROR_LABEL = "(解析失败)"
+
+
+def extract_record(line: bytes) -> tuple[bytes | None, str]:
+    """从一行中取 bodies[0] 的 JSON 字节与 type（data_common.body_json_bytes，与 analyze 测量的字节相同）
+
+    没有 body 或解析失败时 body 为 None。
+    """
+    try:
+        record = loads_record(line)
+        bodies = record.get("payload", {}).get("bodies", [])
+    except (ValueError, AttributeError):
+        return None, PARSE_ERROR_LABEL
+    if not bodies or not isinstance(bodies[0], dict):
+        return None, "(empty)"
+    body = bodies[0]
+    return body_json_bytes(body), str(body.get("type", "unknown"))
+
+
+def iter_records(path: Path):
+    """逐条产出 (压缩对象, 数据, body type)：每行产出整行，有 body 时再产出 bodies[0]"""
+    for _, lines in iter_batches(path):
+        for line in strip_lines(lines):
+            body, body_type = extract_record(line)
+            yield "line", line, body_type
+            if body is not None:
+                yield "body", body, body_type
+
+
+def split_parts(files: list[Path], train_count: int) -> tuple[list[Path], list[Path]]:
+    """等间距选出 train_count 份作为训练集，其余作为留出集（与 filter 的 even 模式一致）"""
+    step = len(files) / train_count
+    train_indices = {int(i * step) for i in range(train_count)}
+    train = [f for i, f in enumerate(files) if i in train_indices]
+    held_out = [f for i, f in enumerate(files) if i not in train_indices]
+    return train, held_out
+
+
+def collect_samples(
+    train_files: list[Path], max_samples: int, rng: random.Random
+) -> dict[str, list[bytes]]:
+    """从训练集中为每种压缩对象蓄水池采样最多 max_samples 条记录"""
+    samples: dict[str, list[bytes]] = {target: [] for target in TARGETS}
+    seen = dict.fromkeys(TARGETS, 0)
+    for path in train_files:
+        for target, data, _ in iter_records(path):
+            seen[target] += 1
+            reservoir = samples[target]
+            if len(reservoir) < max_samples:
+                reservoir.append(data)
+            else:
+                j = rng.randrange(seen[target])
+                if j < max_samples:
+                    reservoir[j] = data
+    return samples
+
+
+def train_dictionaries(
+    samples: dict[str, list[bytes]], dict_size: int
+) -> dict[str, tuple[bytes, bytes]]:
+    """为每种压缩对象训练字典，返回 压缩对象 -> (zstd 字典, LZ4 前缀字典)"""
+    dictionaries = {}
+    for target, data in samples.items():
+        zstd_dict = zstandard.train_dictionary(dict_size, data).as_bytes()
+        dictionaries[target] = (zstd_dict, zstd_dict[-LZ4_DICT_SIZE:])
+    return dictionaries
+
+
+class Compressors:
+    """一种压缩对象的四种压缩方式：方式 -> (compress(data), decompress(data, 原始大小))"""
+
+    def __init__(self, zstd_dict: bytes, lz4_dict: bytes, level: int) -> None:
+        dict_data = zstandard.ZstdCompressionDict(zstd_dict)
+        dict_data.precompute_compress(level=level)
+        # 字典 ID 由传输双方约定，不写入每条消息
+        plain_c = zstandard.ZstdCompressor(level=level)
+        dict_c = zstandard.ZstdCompressor(level=level, dict_data=dict_data, write_dict_id=False)
+        plain_d = zstandard.ZstdDecompressor()
+        dict_d = zstandard.ZstdDecompressor(dict_data=dict_data)
+
+        self.methods = {
+            "lz4": (
+                lambda d: lz4.block.compress(d, store_size=False),
+                lambda c, n: lz4.block.decompress(c, uncompressed_size=n),
+            ),
+            # python-lz4 每次调用都重新加载字典（哈希 64KB），测得的压缩速度偏低；
+            # C 端用 LZ4_attach_dictionary 复用已加载的字典时没有这部分开销
+            "lz4+dict": (
+                lambda d: lz4.block.compress(d, store_size=False, dict=lz4_dict),
+                lambda c, n: lz4.block.decompress(c, uncompressed_size=n, dict=lz4_dict),
+            ),
+            "zstd": (plain_c.compress, lambda c, n: plain_d.decompress(c)),
+            "zstd+dict": (dict_c.compress, lambda c, n: dict_d.decompress(c)),
+        }
+
+
+class GroupStats:
+    """一组记录在各压缩方式下的总大小"""
+
+    def __init__(self) -> None:
+        self.records = 0
+        self.original = 0
+        self.compressed = dict.fromkeys(METHODS, 0)
+
+    def merge(self, other: "GroupStats") -> None:
+        self.records += other.records
+        self.original += other.original
+        for method in METHODS:
+            self.compressed[method] += other.compressed[method]
+
+    def ratio(self, method: str) -> float:
+        """压缩率 = 压缩后 / 原始 (%)"""
+        return self.compressed[method] / self.original * 100 if self.original else 0.0
+
+    def gain(self, plain: str, with_dict: str) -> float:
+        """字典带来的节省：相对无字典少传的字节比例 (%)"""
+        base = self.compressed[plain]
+        return (base - self.compressed[with_dict]) / base * 100 if base else 0.0
+
+
+class TargetResult:
+    """一种压缩对象的评估结果"""
+
+    def __init__(self) -> None:
+        self.by_bucket: dict[str, GroupStats] = {}
+        self.by_body_type: dict[str, GroupStats] = {}
+        self.compress_seconds = dict.fromkeys(METHODS, 0.0)
+        self.decompress_seconds = dict.fromkeys(METHODS, 0.0)
+        self.mismatches = 0
+
+    def add_batch(self, compressors: Compressors, items: list[bytes], body_types: list[str]) -> None:
+        """整批压缩、解压（每种方式分别计时）并校验往返结果，再按分桶和 body type 累加"""
+        sizes = [len(d) for d in items]
+        packed_sizes = {}
+        for method, (compress, decompress) in compressors.methods.items():
+            t0 = time.perf_counter()
+            packed = [compress(d) for d in items]
+            t1 = time.perf_counter()
+            restored = [decompress(c, n) for c, n in zip(packed, sizes)]
+            t2 = time.perf_counter()
+            self.compress_seconds[method] += t1 - t0
+            self.decompress_seconds[method] += t2 - t1
+            if restored != items:
+                self.mismatches += sum(a != b for a, b in zip(restored, items))
+            packed_sizes[method] = [len(c) for c in packed]
+
+        for i, (n, body_type) in enumerate(zip(sizes, body_types)):
+            for groups, key in ((self.by_bucket, bucket_label(n)), (self.by_body_type, body_type)):
+                stats = groups.get(key)
+                if stats is None:
+                    stats = groups[key] = GroupStats()
+                stats.records += 1
+                stats.original += n
+                for method in METHODS:
+                    stats.compressed[method] += packed_sizes[method][i]
+
+    def merge(self, other: "TargetResult") -> None:
+        for label, stats in other.by_bucket.items():
+            self.by_bucket.setdefault(label, GroupStats()).merge(stats)
+        for body_type, stats in other.by_body_type.items():
+            self.by_body_type.setdefault(body_type, GroupStats()).merge(stats)
+        for method in METHODS:
+            self.compress_seconds[method] += other.compress_seconds[method]
+            self.decompress_seconds[method] += other.decompress_seconds[method]
+        self.mismatches += other.mismatches
+
+    def overall(self) -> GroupStats:
+        total = GroupStats()
+        for stats in self.by_bucket.values():
+            total.merge(stats)
+        return total
+
+
+# 每批评估的记录数
+BATCH_RECORDS = 4096
+
+
+def evaluate_part(
+    path: Path, dictionaries: dict[str, tuple[bytes, bytes]], level: int
+) -> dict[str, TargetResult]:
+    """在一个留出分片上评估所有压缩方式（进程池任务）"""
+    compressors = {
+        target: Compressors(zstd_dict, lz4_dict, level)
+        for target, (zstd_dict, lz4_dict) in dictionaries.items()
+    }
+    results = {target: TargetResult() for target in TARGETS}
+    items: dict[str, list[bytes]] = {target: [] for target in TARGETS}
+    body_types: dict[str, list[str]] = {target: [] for target in TARGETS}
+
+    def flush(target: str) -> None:
+        results[target].add_batch(compressors[target], items[target], body_types[target])
+        items[target] = []
+        body_types[target] = []
+
+    for target, data, body_type in iter_records(path):
+        items[target].append(data)
+        body_types[target].append(body_type)
+        if len(items[target]) >= BATCH_RECORDS:
+            flush(target)
+    for target in TARGETS:
+        if items[target]:
+            flush(target)
+    return results
+
+
+def print_group_table(title: str, key_header: str, groups: list[tuple[str, GroupStats]]) -> None:
+    print(f"\n{'── ' + title + ' ──':─^56}")
+    method_header = "".join(f" {m:>10}" for m in METHODS)
+    print(
+        f"  {key_header:<12} {'数量':>9} {'原始大小':>10}{method_header}"
+        f" {'lz4收益':>9} {'zstd收益':>9}"
+    )
+    for key, stats in groups:
+        if stats.records == 0:
+            continue
+        cells = "".join(f" {stats.ratio(m):>9.1f}%" for m in METHODS)
+        print(
+            f"  {key[:12]:<12} {stats.records:>9,} {format_bytes(stats.original):>10}{cells}"
+            f" {stats.gain('lz4', 'lz4+dict'):>8.1f}% {stats.gain('zstd', 'zstd+dict'):>8.1f}%"
+        )
+
+
+def print_report(results: dict[str, TargetResult]) -> None:
+    print("=" * 60)
+    print("  📖 字典压缩评估报告（留出集）")
+    print("=" * 60)
+    print("\n  压缩率 = 压缩后 / 原始（越小越好）；收益 = 加字典后相对无字典少传的字节比例")
+
+    for target, target_name in TARGETS.items():
+        result = results[target]
+        overall = result.overall()
+        if overall.records == 0:
+            continue
+
+        bucket_groups = [
+            (label, result.by_bucket[label]) for _, label in BUCKET_BOUNDARIES if label in result.by_bucket
+        ]
+        bucket_groups.append(("全部", overall))
+        print_group_table(f"{target_name} 按长度分桶", "桶", bucket_groups)
+
+        type_groups = sorted(result.by_body_type.items(), key=lambda kv: -kv[1].records)
+        print_group_table(f"{target_name} 按 bodies[0].type", "类型", type_groups)
+
+        print(f"\n{'── ' + target_name + ' 速度（单核，按原始字节计）──':─^48}")
+        print(f"  {'方式':<12} {'压缩MB/s':>10} {'解压MB/s':>10}")
+        for method in METHODS:
+            c_sec = result.compress_seconds[method]
+            d_sec = result.decompress_seconds[method]
+            c_speed = overall.original / c_sec / (1024 * 1024) if c_sec > 0 else 0
+            d_speed = overall.original / d_sec / (1024 * 1024) if d_sec > 0 else 0
+            print(f"  {method:<12} {c_speed:>10.1f} {d_speed:>10.1f}")
+        if result.mismatches:
+            print(f"  ⚠️  {result.mismatches} 条记录解压后与原始数据不一致")
+
+    print()
+    print("=" * 60)
+    print("  评估完成 ✅")
+    print("=" * 60)
+
+
+def save_dictionaries(dictionaries: dict[str, tuple[bytes, bytes]], output_dir: Path) -> None:
+    """保存训练好的字典，供 SDK 侧实验使用"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for target, (zstd_dict, lz4_dict) in dictionaries.items():
+        (output_dir / f"{target}.zstd.dict").write_bytes(zstd_dict)
+        (output_dir / f"{target}.lz4.dict").write_bytes(lz4_dict)
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] in ("-h", "--help"):
+        print("用法: uv run main.py <分片文件夹路径> [选项]")
+        print()
+        print("选项:")
+        print(f"  --train-ratio R  训练集占分片文件的比例（默认 {DEFAULT_TRAIN_RATIO}）")
+        print("  --train-count N  训练集分片数（与 --train-ratio 二选一）")
+        print(f"  --dict-size N    字典大小，字节（默认 {DEFAULT_DICT_SIZE}）")
+        print(f"  --max-samples N  每种压缩对象最多采样的训练记录数（默认 {DEFAULT_MAX_SAMPLES}）")
+        print(f"  --level N        zstd 压缩级别（默认 {DEFAULT_ZSTD_LEVEL}）")
+        print("  --workers N      并行评估的进程数（默认 1；0 表示使用全部 CPU 核）")
+        print("  --seed S         训练采样的随机种子")
+        print("  --save-dict DIR  保存训练好的字典到指定文件夹")
+        print()
+        print("示例:")
+        print("  uv run main.py ../sampler/output")
+        print("  uv run main.py ../filter/selected --train-ratio 0.3 --workers 4")
+        sys.exit(0 if args else 1)
+
+    input_dir = args[0]
+    train_ratio = DEFAULT_TRAIN_RATIO
+    train_count = None
+    dict_size = DEFAULT_DICT_SIZE
+    max_samples = DEFAULT_MAX_SAMPLES
+    level = DEFAULT_ZSTD_LEVEL
+    workers = 1
+    seed = None
+    save_dir = None
+
+    i = 1
+    while i < len(args):
+        if args[i] == "--train-ratio" and i + 1 < len(args):
+            train_ratio = float(args[i + 1])
+            i += 2
+        elif args[i] == "--train-count" and i + 1 < len(args):
+            train_count = int(args[i + 1])
+            i += 2
+        elif args[i] == "--dict-size" and i + 1 < len(args):
+            dict_size = int(args[i + 1])
+            i += 2
+        elif args[i] == "--max-samples" and i + 1 < len(args):
+            max_samples = int(args[i + 1])
+            i += 2
+        elif args[i] == "--level" and i + 1 < len(args):
+            level = int(args[i + 1])
+            i += 2
+        elif args[i] == "--workers" and i + 1 < len(args):
+            workers = int(args[i + 1])
+            i += 2
+        elif args[i] == "--seed" and i + 1 < len(args):
+            seed = int(args[i + 1])
+            i += 2
+        elif args[i] == "--save-dict" and i + 1 < len(args):
+            save_dir = Path(args[i + 1])
+            i += 2
+        else:
+            print(f"❌ 未知参数: {args[i]}")
+            sys.exit(1)
+
+    dir_path = Path(input_dir)
+    if not dir_path.is_dir():
+        print(f"❌ 不是文件夹: {input_dir}")
+        sys.exit(1)
+    files = get_data_files(dir_path)
+    if len(files) < 2:
+        print("❌ 至少需要 2 个分片文件（一部分训练，其余评估）")
+        sys.exit(1)
+
+    if train_count is None:
+        if not 0 < train_ratio < 1:
+            print("❌ --train-ratio 必须在 0~1 之间")
+            sys.exit(1)
+        train_count = max(1, round(len(files) * train_ratio))
+    train_count = min(max(1, train_count), len(files) - 1)
+    if workers < 0:
+        print("❌ --workers 必须 >= 0")
+        sys.exit(1)
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    train_files, held_out = split_parts(files, train_count)
+    print(f"📂 分片目录: {input_dir}")
+    print(f"📄 分片文件: {len(files)} 个（训练 {len(train_files)} 个，评估 {len(held_out)} 个）")
+    print(f"📖 字典大小: {format_bytes(dict_size)}（LZ4 前缀字典 {format_bytes(min(dict_size, LZ4_DICT_SIZE))}）")
+    print(f"🗜️  zstd 级别: {level}")
+    print(f"🧩 JSON 解析: {JSON_BACKEND}")
+
+    # 训练
+    t0 = time.time()
+    samples = collect_samples(train_files, max_samples, random.Random(seed))
+    try:
+        dictionaries = train_dictionaries(samples, dict_size)
+    except zstandard.ZstdError as e:
+        print(f"❌ 字典训练失败（训练数据可能太少）: {e}")
+        sys.exit(1)
+    counts = "，".join(f"{TARGETS[t]} {len(s):,} 条" for t, s in samples.items())
+    print(f"🎓 训练完成: {counts}，耗时 {time.time() - t0:.1f}s")
+    if save_dir is not None:
+        save_dictionaries(dictionaries, save_dir)
+        print(f"💾 字典已保存到: {save_dir}")
+    print()
+
+    # 在留出集上评估，按分片并行
+    results = {target: TargetResult() for target in TARGETS}
+    part_results: list[dict[str, TargetResult] | None] = [None] * len(held_out)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(evaluate_part, path, dictionaries, level): idx
+                for idx, path in enumerate(held_out)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                part_results[futures[future]] = future.result()
+                print(f"\r  ⏳ 评估进度: {done}/{len(held_out)}", end="", flush=True)
+    else:
+        for idx, path in enumerate(held_out):
+            part_results[idx] = evaluate_part(path, dictionaries, level)
+            print(f"\r  ⏳ 评估进度: {idx + 1}/{len(held_out)}", end="", flush=True)
+    print(f"\r{' ' * 60}\r", end="")
+
+    # 按分片顺序合并，body type 的同频项排序与串行一致
+    for part in part_results:
+        for target in TARGETS:
+            results[target].merge(part[target])
+
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
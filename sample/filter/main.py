@@ -5,9 +5,15 @@ IM 数据筛选工具（按比例筛选）
 从 sampler 输出的分片文件中按比例筛选部分文件，
 将筛选结果复制到指定的输出文件夹。
 
-支持两种筛选模式：
+支持三种筛选模式：
   - even（默认）：等间距均匀抽取，保持时序覆盖
   - random：随机抽取
+  - representative：按分片内容（content_type / bodies[0].type / 行长度 / 压缩率分布）
+    贪心选出与全量分布最接近的一组分片
+
+默认由多个线程并行复制；--link hard / reflink / symlink 时创建硬链接、写时复制克隆或符号链接，
+不复制数据，同一文件系统内任意大小的筛选都在毫秒级完成；无法创建链接（如跨文件系统）时自动改为并行复制。
+--lazy 时只写出选择清单 selection.json（选中的分片路径），analyze / send_message 直接按清单读取原分片。
 
 用法:
     uv run main.py <分片文件夹路径> [选项]
@@ -15,30 +21,115 @@ IM 数据筛选工具（按比例筛选）
 示例:
     uv run main.py ../sampler/output --ratio 0.1
     uv run main.py ../sampler/output --count 10 --mode random
+    uv run main.py ../sampler/output --ratio 0.5 --link hard
+    uv run main.py ../sampler/output --count 5 --mode representative
+    uv run main.py ../sampler/output --ratio 0.1 --lazy --output-dir ../../send_message/data
 """
 
+import math
+import os
 import random
 import shutil
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from pathlib import Path
 
-
-def format_bytes(n: float) -> str:
-    """格式化字节数为可读字符串"""
-    if n < 1024:
-        return f"{n:.0f} B"
-    elif n < 1024 * 1024:
-        return f"{n / 1024:.1f} KB"
-    elif n < 1024 * 1024 * 1024:
-        return f"{n / (1024 * 1024):.2f} MB"
-    else:
-        return f"{n / (1024 * 1024 * 1024):.2f} GB"
+from data_common import (
+    LINE_INDEX_DIRNAME,
+    LineIndex,
+    LineIndexError,
+    MANIFEST_FILENAME,
+    SELECTION_FILENAME,
+    ManifestError,
+    Metrics,
+    PartStats,
+    Profiler,
+    copy_line_index,
+    copy_manifest,
+    file_crc32,
+    format_bytes,
+    is_compressed,
+    iter_batches,
+    load_manifest,
+    strip_lines,
+    write_selection,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_WORKERS = 4
+
+# 筛选模式 -> 显示名称
+MODE_LABELS = {"even": "均匀等间距", "random": "随机", "representative": "分布最接近全量"}
+
+# --link 模式 -> 显示名称
+LINK_MODES = {"hard": "硬链接", "reflink": "写时复制克隆", "symlink": "符号链接"}
+
+# 代表性筛选使用的分布（分片清单中的字段 -> 显示名称）
+FEATURE_GROUPS = {
+    "content_types": "content_type",
+    "body_types": "bodies[0].type",
+    "buckets": "行长度",
+    "compressibility": "压缩率",
+}
+
+# 代表性筛选在贪心之后做交换改进的最多轮数（每轮试遍所有 选中 × 未选中 的交换）
+SWAP_ROUNDS = 2
+
+# linux/fs.h: FICLONE = _IOW(0x94, 9, int)，btrfs / XFS / bcachefs 等支持
+FICLONE = 0x40049409
 
 
 def get_part_files(dir_path: Path) -> list[Path]:
-    """获取文件夹下所有分片文件（part_*.jsonl），按名称排序"""
-    files = sorted(dir_path.glob("part_*.jsonl"))
-    return files
+    """获取文件夹下所有分片文件（part_*.jsonl 及其 .gz / .zst / .lz4 压缩版本），按名称排序
+
+    筛选只复制文件，压缩分片原样复制，不需要解压。
+    """
+    files = [
+        fp
+        for fp in dir_path.glob("part_*.jsonl*")
+        if fp.suffix == ".jsonl" or (is_compressed(fp) and fp.suffixes[-2:-1] == [".jsonl"])
+    ]
+    return sorted(files)
+
+
+def load_record_counts(dir_path: Path, part_files: list[Path]) -> dict[Path, int] | None:
+    """分片文件夹有可用的行偏移索引（sampler index）时，返回各分片的记录数，不读取分片内容"""
+    index_dir = dir_path / LINE_INDEX_DIRNAME
+    if not index_dir.exists():
+        return None
+    try:
+        with LineIndex.load(part_files, index_dir) as line_index:
+            return {fp: line_index.file_records(i) for i, fp in enumerate(part_files)}
+    except LineIndexError as e:
+        print(f"⚠️  {e}，本次不使用索引")
+        return None
+
+
+def load_part_manifest(dir_path: Path, part_files: list[Path]) -> dict[Path, dict] | None:
+    """分片文件夹有 sampler 写出的分片清单时，返回各分片的清单条目（记录数、大小、校验和、统计）"""
+    if not (dir_path / MANIFEST_FILENAME).exists():
+        return None
+    try:
+        return load_manifest(dir_path, part_files)
+    except ManifestError as e:
+        print(f"⚠️  {e}，本次不使用清单")
+        return None
+
+
+def verify_files(selected: list[Path], output_dir: Path, manifest: dict[Path, dict]) -> list[str]:
+    """按清单中的 CRC32 校验复制出的文件，返回不一致的文件名"""
+    mismatched = []
+    for i, src in enumerate(selected):
+        if file_crc32(output_dir / src.name) != manifest[src]["crc32"]:
+            mismatched.append(src.name)
+        print(f"\r  ⏳ 校验进度: {i + 1}/{len(selected)}", end="", flush=True)
+    print(f"\r{' ' * 40}\r", end="")
+    return mismatched
 
 
 def select_even(files: list[Path], count: int) -> list[Path]:
@@ -67,23 +158,250 @@ def select_random(files: list[Path], count: int) -> list[Path]:
     return sorted(selected)
 
 
-def copy_files(selected: list[Path], output_dir: Path) -> None:
-    """将筛选的文件复制到输出目录"""
-    output_dir.mkdir(parents=True, exist_ok=True)
+def scan_features(path: Path) -> dict[str, dict[str, int]]:
+    """读取一个分片，统计代表性筛选使用的各分布（进程池任务，口径与分片清单相同）"""
+    stats = PartStats(path.name)
+    for _, lines in iter_batches(path):
+        stats.add_records(strip_lines(lines))
+    entry = stats.to_dict()
+    return {group: entry[group] for group in FEATURE_GROUPS}
+
+
+def load_features(
+    part_files: list[Path], manifest: dict[Path, dict] | None, workers: int
+) -> tuple[list[dict[str, dict[str, int]]], str]:
+    """各分片的分布与来源：分片清单中有全部字段时直接取用，否则由进程池并行读取各分片"""
+    if manifest is not None and all(group in manifest[fp] for fp in part_files for group in FEATURE_GROUPS):
+        return [{group: manifest[fp][group] for group in FEATURE_GROUPS} for fp in part_files], "分片清单"
+
+    features = []
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(part_files)))) as pool:
+        for i, feature in enumerate(pool.map(scan_features, part_files), 1):
+            features.append(feature)
+            print(f"\r  ⏳ 统计分片内容: {i}/{len(part_files)}", end="", flush=True)
+    print(f"\r{' ' * 40}\r", end="")
+    return features, "读取分片"
+
+
+def js_divergence(p: list[float], q: list[float]) -> float:
+    """两个计数向量（不必归一化）所代表分布之间的 Jensen-Shannon 散度，以 2 为底，0（相同）~ 1（不相交）"""
+    sp, sq = sum(p), sum(q)
+    if not sp or not sq:
+        return 0.0 if sp == sq else 1.0
+    d = 0.0
+    for a, b in zip(p, q):
+        a /= sp
+        b /= sq
+        m = (a + b) / 2
+        if a:
+            d += a * math.log2(a / m)
+        if b:
+            d += b * math.log2(b / m)
+    return d / 2
+
+
+class Distributions:
+    """各分片的分布向量（每个分布的标签取全部分片的并集），以及任意分片组合与全量分布的散度"""
+
+    def __init__(self, features: list[dict[str, dict[str, int]]]) -> None:
+        self.groups = list(FEATURE_GROUPS)
+        labels = {group: sorted({label for f in features for label in f[group]}) for group in self.groups}
+        # vectors[i][g]：第 i 个分片第 g 个分布的计数向量
+        self.vectors = [
+            [[f[group].get(label, 0) for label in labels[group]] for group in self.groups] for f in features
+        ]
+        self.total = self.sum(range(len(features)))
+        # 全量分布（归一化）
+        self._target = [[x / (sum(t) or 1) for x in t] for t in self.total]
+
+    def sum(self, indices) -> list[list[int]]:
+        """若干分片的计数之和"""
+        total = [[0] * len(v) for v in self.vectors[0]] if self.vectors else []
+        for i in indices:
+            for acc, v in zip(total, self.vectors[i]):
+                for k, x in enumerate(v):
+                    acc[k] += x
+        return total
+
+    def group_divergences(self, counts: list[list[int]]) -> list[float]:
+        """计数 counts 与全量分布在各个分布上的散度"""
+        return [js_divergence(c, t) for c, t in zip(counts, self.total)]
+
+    def divergence(self, counts: list[list[int]]) -> float:
+        """各个分布散度的平均值（每种分布同等重要）"""
+        return sum(self.group_divergences(counts)) / len(self.groups)
+
+    def _trial(self, counts: list[list[int]], i: int, sign: int) -> float:
+        """counts 加上（sign 为 -1 时减去）第 i 个分片后的散度，不生成中间列表（贪心的内层循环）"""
+        d = 0.0
+        for cg, vg, tg in zip(counts, self.vectors[i], self._target):
+            s = sum(cg) + sign * sum(vg)
+            if not s:
+                d += 1.0
+                continue
+            for c, x, q in zip(cg, vg, tg):
+                a = (c + sign * x) / s
+                m = (a + q) / 2
+                if a:
+                    d += a * math.log2(a / m)
+                if q:
+                    d += q * math.log2(q / m)
+        return d / 2 / len(self.groups)
+
+    def select(self, count: int, start: list[int] | None = None) -> list[int]:
+        """选出 count 个分片，使其合计分布与全量分布的散度尽量小，返回按序号排序的分片下标
+
+        先贪心：选出的少于一半时从空集开始，每步加入使散度最小的分片；多于一半时从全集开始，
+        每步去掉使散度最小的分片。两种方向都只需 min(count, n - count) 步，每步试遍剩余分片。
+        贪心不保证最优，之后再做交换改进（见 _swap）。给出 start（如均匀抽取的结果）且它仍比
+        贪心的结果更好时，改为从 start 出发做交换改进，因此结果不会比 start 差。
+        """
+        n = len(self.vectors)
+        if count >= n:
+            return list(range(n))
+        if count <= n - count:
+            chosen: set[int] = set()
+            counts = self.sum(())
+            sign = 1
+            steps = count
+        else:
+            chosen = set(range(n))
+            counts = self.sum(range(n))
+            sign = -1
+            steps = n - count
+        for _ in range(steps):
+            candidates = (i for i in range(n) if (i in chosen) == (sign < 0))
+            best = min(candidates, key=lambda i: self._trial(counts, i, sign))
+            if sign > 0:
+                chosen.add(best)
+            else:
+                chosen.remove(best)
+            for cg, vg in zip(counts, self.vectors[best]):
+                for k, x in enumerate(vg):
+                    cg[k] += sign * x
+        best_d = self._swap(chosen, counts)
+        if start is not None:
+            other = set(start)
+            other_counts = self.sum(other)
+            if self.divergence(other_counts) < best_d:
+                self._swap(other, other_counts)
+                chosen = other
+        return sorted(chosen)
+
+    def _swap(self, chosen: set[int], counts: list[list[int]]) -> float:
+        """交换改进：依次把每个选中的分片换成使散度最小的未选中分片（能降低散度时），
+        直到一轮中没有可改进的交换或达到 SWAP_ROUNDS 轮；原地修改 chosen / counts，返回最终散度"""
+        n = len(self.vectors)
+        current = self.divergence(counts)
+        for _ in range(SWAP_ROUNDS):
+            improved = False
+            for i in sorted(chosen):
+                reduced = [[c - x for c, x in zip(cg, vg)] for cg, vg in zip(counts, self.vectors[i])]
+                best, best_d = None, current
+                for j in range(n):
+                    if j in chosen:
+                        continue
+                    d = self._trial(reduced, j, 1)
+                    # 忽略浮点误差级别的改进，避免来回交换
+                    if d < best_d - 1e-12:
+                        best, best_d = j, d
+                if best is not None:
+                    chosen.remove(i)
+                    chosen.add(best)
+                    counts[:] = [[c + x for c, x in zip(rg, vg)] for rg, vg in zip(reduced, self.vectors[best])]
+                    current = best_d
+                    improved = True
+            if not improved:
+                break
+        return current
+
+
+def reflink_file(src: Path, dst: Path) -> None:
+    """写时复制克隆：新文件与源文件共享数据块，之后任何一方被修改都不影响另一方
+
+    文件系统或平台不支持（如 ext4、跨文件系统）时抛出 OSError。
+    """
+    if fcntl is None or not sys.platform.startswith("linux"):
+        raise OSError("当前平台不支持 reflink")
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        dst.unlink(missing_ok=True)
+        raise
+    shutil.copystat(src, dst)
+
+
+def link_file(src: Path, dst: Path, link: str) -> None:
+    """按 --link 模式在 dst 处创建指向 src 的链接，无法创建时抛出 OSError"""
+    if link == "hard":
+        os.link(src, dst)
+    elif link == "symlink":
+        # 绝对路径，输出目录移动到别处也能找到源文件
+        os.symlink(src.resolve(), dst)
+    else:
+        reflink_file(src, dst)
 
-    for i, src in enumerate(selected):
-        dst = output_dir / src.name
-        shutil.copy2(src, dst)
 
-        # 进度显示
-        pct = (i + 1) / len(selected) * 100
-        print(
-            f"\r  ⏳ 复制进度: {pct:.0f}% ({i + 1}/{len(selected)})",
-            end="",
-            flush=True,
-        )
+def copy_files(selected: list[Path], output_dir: Path, link: str | None = None, workers: int = DEFAULT_WORKERS) -> int:
+    """将筛选的文件放到输出目录，返回创建了链接的文件数（其余为复制）
 
-    print(f"\r  ✅ 复制完成！共 {len(selected)} 个文件{' ' * 20}")
+    link 为 None 时全部复制；否则依次创建链接（每个只需一次系统调用），
+    第一次失败后其余文件不再尝试，改为复制。复制由 workers 个线程并行进行，
+    shutil.copy2 在 Linux 上用 sendfile 在内核中复制，系统调用期间释放 GIL。
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # 先删除输出目录中的同名文件：上次筛选留下的链接指向源文件，覆盖写入会改写（或截断）源文件
+    for src in selected:
+        (output_dir / src.name).unlink(missing_ok=True)
+
+    linked = 0
+    if link is not None:
+        for src in selected:
+            try:
+                link_file(src, output_dir / src.name, link)
+            except OSError as e:
+                print(f"⚠️  无法创建{LINK_MODES[link]}（{e.strerror or e}），其余文件改为并行复制")
+                break
+            linked += 1
+        if linked == len(selected):
+            print(f"  ✅ 完成！共 {linked} 个{LINK_MODES[link]}，未复制数据")
+            return linked
+
+    to_copy = selected[linked:]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(to_copy)))) as pool:
+        futures = [pool.submit(shutil.copy2, src, output_dir / src.name) for src in to_copy]
+        for i, future in enumerate(as_completed(futures), 1):
+            future.result()
+
+            # 进度显示
+            pct = i / len(to_copy) * 100
+            print(
+                f"\r  ⏳ 复制进度: {pct:.0f}% ({i}/{len(to_copy)})",
+                end="",
+                flush=True,
+            )
+
+    linked_label = f"，{linked} 个{LINK_MODES[link]}" if linked else ""
+    print(f"\r  ✅ 复制完成！共 {len(to_copy)} 个文件{linked_label}{' ' * 20}")
+    return linked
+
+
+def write_lazy_selection(
+    selected: list[Path],
+    output_dir: Path,
+    sizes: dict[Path, int],
+    record_counts: dict[Path, int] | None,
+    **info,
+) -> Path:
+    """--lazy：只写出选择清单（分片的绝对路径、大小与记录数），不复制数据"""
+    parts = []
+    for fp in selected:
+        entry = {"path": str(fp.resolve()), "bytes": sizes[fp]}
+        if record_counts is not None:
+            entry["lines"] = record_counts[fp]
+        parts.append(entry)
+    return write_selection(output_dir, parts, **info)
 
 
 def main():
@@ -95,13 +413,23 @@ def main():
         print("选项:")
         print("  --ratio R        筛选比例 0~1（与 --count 二选一，默认 0.1）")
         print("  --count N        筛选数量（与 --ratio 二选一）")
-        print("  --mode MODE      筛选模式: even（均匀，默认）/ random（随机）")
+        print("  --mode MODE      筛选模式: even（均匀，默认）/ random（随机）/ representative（分布最接近全量）")
         print("  --output-dir DIR 输出文件夹（默认 ./selected）")
         print("  --seed S         随机种子（仅 random 模式生效）")
+        print("  --link MODE      不复制数据，创建链接: hard（硬链接）/ reflink（写时复制克隆）/ symlink（符号链接），")
+        print("                   无法创建时（如跨文件系统）自动改为复制")
+        print(f"  --workers N      并行复制的线程数 / 统计分片内容的进程数（默认 {DEFAULT_WORKERS}；0 表示使用全部 CPU 核）")
+        print(f"  --lazy           不复制分片，只写出选择清单 {SELECTION_FILENAME}（analyze / send_message 直接读取原分片）")
+        print(f"  --verify         复制后按分片清单（{MANIFEST_FILENAME}）中的 CRC32 校验")
+        print("  --metrics-json FILE    输出分阶段耗时、吞吐、峰值内存，并写入 JSON 文件")
+        print("  --profile MODE[:FILE]  性能剖析: cprofile 或 sample（采样），可选输出文件")
         print()
         print("示例:")
         print("  uv run main.py ../sampler/output --ratio 0.1")
         print("  uv run main.py ../sampler/output --count 10 --mode random")
+        print("  uv run main.py ../sampler/output --ratio 0.5 --link hard")
+        print("  uv run main.py ../sampler/output --count 5 --mode representative")
+        print("  uv run main.py ../sampler/output --ratio 0.1 --lazy --output-dir ../../send_message/data")
         print(
             "  uv run main.py ../sampler/output --ratio 0.2 --output-dir ./my_selected"
         )
@@ -113,6 +441,12 @@ def main():
     mode = "even"
     output_dir = "./selected"
     seed = None
+    verify = False
+    lazy = False
+    link: str | None = None
+    workers = DEFAULT_WORKERS
+    metrics_json: Path | None = None
+    profiler: Profiler | None = None
 
     i = 1
     while i < len(args):
@@ -131,14 +465,47 @@ def main():
         elif args[i] == "--seed" and i + 1 < len(args):
             seed = int(args[i + 1])
             i += 2
+        elif args[i] == "--link" and i + 1 < len(args):
+            link = args[i + 1]
+            i += 2
+        elif args[i] == "--workers" and i + 1 < len(args):
+            workers = int(args[i + 1])
+            i += 2
+        elif args[i] == "--verify":
+            verify = True
+            i += 1
+        elif args[i] == "--lazy":
+            lazy = True
+            i += 1
+        elif args[i] == "--metrics-json" and i + 1 < len(args):
+            metrics_json = Path(args[i + 1])
+            i += 2
+        elif args[i] == "--profile" and i + 1 < len(args):
+            try:
+                profiler = Profiler.parse(args[i + 1])
+            except ValueError as e:
+                print(f"❌ {e}")
+                sys.exit(1)
+            i += 2
         else:
             print(f"❌ 未知参数: {args[i]}")
             sys.exit(1)
 
     # 参数校验
-    if mode not in ("even", "random"):
-        print(f"❌ 未知模式: {mode}（支持 even / random）")
+    if mode not in MODE_LABELS:
+        print(f"❌ 未知模式: {mode}（支持 {' / '.join(MODE_LABELS)}）")
+        sys.exit(1)
+    if link is not None and link not in LINK_MODES:
+        print(f"❌ 未知链接方式: {link}（支持 {' / '.join(LINK_MODES)}）")
         sys.exit(1)
+    if lazy and (link is not None or verify):
+        print("❌ --lazy 不复制分片，不能与 --link / --verify 同时使用")
+        sys.exit(1)
+    if workers < 0:
+        print("❌ --workers 必须 >= 0")
+        sys.exit(1)
+    if workers == 0:
+        workers = os.cpu_count() or 1
 
     dir_path = Path(input_dir)
     if not dir_path.exists():
@@ -150,7 +517,7 @@ def main():
 
     part_files = get_part_files(dir_path)
     if not part_files:
-        print(f"❌ 文件夹中没有分片文件 (part_*.jsonl): {input_dir}")
+        print(f"❌ 文件夹中没有分片文件 (part_*.jsonl[.gz|.zst|.lz4]): {input_dir}")
         sys.exit(1)
 
     total_count = len(part_files)
@@ -180,8 +547,25 @@ def main():
         select_count = total_count
 
     out_path = Path(output_dir)
-    total_size = sum(f.stat().st_size for f in part_files)
-    mode_label = "均匀等间距" if mode == "even" else "随机"
+    if out_path.exists() and out_path.resolve() == dir_path.resolve():
+        print("❌ 输出目录不能与分片文件夹相同")
+        sys.exit(1)
+    index_counts = load_record_counts(dir_path, part_files)
+    # 有分片清单时大小与记录数都来自清单，不需要逐个 stat
+    manifest = load_part_manifest(dir_path, part_files)
+    if manifest is not None:
+        sizes = {fp: entry["bytes"] for fp, entry in manifest.items()}
+        record_counts = {fp: entry["lines"] for fp, entry in manifest.items()}
+        counts_label = "分片清单"
+    else:
+        sizes = {fp: fp.stat().st_size for fp in part_files}
+        record_counts = index_counts
+        counts_label = "行偏移索引"
+    total_size = sum(sizes.values())
+    if verify and manifest is None:
+        print(f"❌ --verify 需要分片清单 {MANIFEST_FILENAME}（由 sampler 切割时生成）")
+        sys.exit(1)
+    mode_label = MODE_LABELS[mode]
 
     # 打印概要
     print("=" * 60)
@@ -190,41 +574,111 @@ def main():
     print(f"\n📂 输入目录:   {dir_path.resolve()}")
     print(f"📄 分片文件:   {total_count} 个")
     print(f"📦 总大小:     {format_bytes(total_size)}")
+    if record_counts is not None:
+        print(f"🧾 总记录数:   {sum(record_counts.values()):,}（{counts_label}）")
     print(f"🎯 筛选数量:   {select_count} / {total_count}")
     print(f"📊 筛选比例:   {select_count / total_count * 100:.1f}%")
     print(f"🔀 筛选模式:   {mode_label} ({mode})")
     print(f"📁 输出目录:   {out_path.resolve()}")
+    if link is not None:
+        print(f"🔗 链接方式:   {LINK_MODES[link]} ({link})")
+    if lazy:
+        print(f"📝 选择清单:   {out_path.resolve() / SELECTION_FILENAME}（不复制分片）")
     if mode == "random" and seed is not None:
         print(f"🎲 随机种子:   {seed}")
     print()
 
-    # 执行筛选
-    if mode == "random":
-        if seed is not None:
-            random.seed(seed)
-        selected = select_random(part_files, select_count)
-    else:
-        selected = select_even(part_files, select_count)
-
-    # 显示筛选结果
-    print(f"📋 筛选结果（{len(selected)} 个文件）:")
-    if len(selected) <= 20:
-        for fp in selected:
-            print(f"  ├── {fp.name}  ({format_bytes(fp.stat().st_size)})")
-    else:
-        for fp in selected[:5]:
-            print(f"  ├── {fp.name}  ({format_bytes(fp.stat().st_size)})")
-        print(f"  ├── ... (省略 {len(selected) - 10} 个)")
-        for fp in selected[-5:]:
-            print(f"  ├── {fp.name}  ({format_bytes(fp.stat().st_size)})")
-    print()
+    metrics = Metrics("filter", enabled=metrics_json is not None)
+    with profiler or nullcontext():
+        # 执行筛选
+        distributions: Distributions | None = None
+        if mode == "representative":
+            with metrics.phase("features"):
+                features, features_label = load_features(part_files, manifest, workers)
+            print(f"📐 分片内容分布: 来自{features_label}（{' / '.join(FEATURE_GROUPS.values())}）")
+        with metrics.phase("select"):
+            if mode == "random":
+                if seed is not None:
+                    random.seed(seed)
+                selected = select_random(part_files, select_count)
+            elif mode == "representative":
+                distributions = Distributions(features)
+                positions = {fp: i for i, fp in enumerate(part_files)}
+                even = [positions[fp] for fp in select_even(part_files, select_count)]
+                selected = [part_files[i] for i in distributions.select(select_count, even)]
+            else:
+                selected = select_even(part_files, select_count)
+
+        if distributions is not None:
+            # 与全量分布的散度，并与同样数量的均匀抽取对比
+            achieved = distributions.sum(positions[fp] for fp in selected)
+            baseline = distributions.sum(even)
+            print("📐 与全量分布的 Jensen-Shannon 散度（0 为完全一致）:")
+            for name, d, b in zip(
+                FEATURE_GROUPS.values(),
+                distributions.group_divergences(achieved),
+                distributions.group_divergences(baseline),
+            ):
+                print(f"  ├── {name}: {d:.6f}（均匀抽取 {b:.6f}）")
+            print(
+                f"  └── 平均: {distributions.divergence(achieved):.6f}"
+                f"（均匀抽取 {distributions.divergence(baseline):.6f}）"
+            )
+            print()
+
+        # 显示筛选结果
+        print(f"📋 筛选结果（{len(selected)} 个文件）:")
+        if len(selected) <= 20:
+            for fp in selected:
+                print(f"  ├── {fp.name}  ({format_bytes(sizes[fp])})")
+        else:
+            for fp in selected[:5]:
+                print(f"  ├── {fp.name}  ({format_bytes(sizes[fp])})")
+            print(f"  ├── ... (省略 {len(selected) - 10} 个)")
+            for fp in selected[-5:]:
+                print(f"  ├── {fp.name}  ({format_bytes(sizes[fp])})")
+        print()
 
-    # 复制文件
-    print("📦 开始复制文件...")
-    copy_files(selected, out_path)
+        linked = 0
+        if lazy:
+            with metrics.phase("selection"):
+                info = {"source": str(dir_path.resolve()), "mode": mode}
+                if mode == "random" and seed is not None:
+                    info["seed"] = seed
+                selection_path = write_lazy_selection(selected, out_path, sizes, record_counts, **info)
+            print(f"  ✅ 已写出选择清单: {selection_path}（{len(selected)} 个分片，未复制数据）")
+        else:
+            # 复制文件
+            print("📦 开始创建链接..." if link is not None else "📦 开始复制文件...")
+            with metrics.phase("copy"):
+                # 上次 --lazy 留下的选择清单会让下游工具忽略复制出的分片
+                (out_path / SELECTION_FILENAME).unlink(missing_ok=True)
+                linked = copy_files(selected, out_path, link, workers)
+                if manifest is not None:
+                    # 清单只保留筛选出的分片，下游工具可以直接使用
+                    try:
+                        copy_manifest(dir_path, out_path, selected)
+                    except (OSError, ManifestError) as e:
+                        print(f"⚠️  无法复制分片清单: {e}")
+                if index_counts is not None:
+                    # 索引随分片一起复制，下游工具可以直接使用
+                    try:
+                        copy_line_index(dir_path / LINE_INDEX_DIRNAME, out_path / LINE_INDEX_DIRNAME, selected)
+                    except (OSError, LineIndexError) as e:
+                        print(f"⚠️  无法复制行偏移索引: {e}")
+
+        if verify:
+            with metrics.phase("verify"):
+                mismatched = verify_files(selected, out_path, manifest)
+            if mismatched:
+                print(f"❌ {len(mismatched)} 个文件与清单中的校验和不一致: {', '.join(mismatched)}")
+                sys.exit(1)
+            print(f"  ✅ 校验通过：{len(selected)} 个文件与清单一致")
 
     # 输出概要
-    selected_size = sum(f.stat().st_size for f in selected)
+    selected_size = sum(sizes[fp] for fp in selected)
+    # --lazy 时不读写分片数据
+    metrics.add(nbytes=0 if lazy else selected_size)
 
     print()
     print("=" * 60)
@@ -236,10 +690,18 @@ def main():
     print(f"  筛选总大小:   {format_bytes(selected_size)}")
     print(f"  原始总大小:   {format_bytes(total_size)}")
     print(f"  大小比例:     {selected_size / total_size * 100:.1f}%")
+    if distributions is not None:
+        print(f"  分布散度:     {distributions.divergence(achieved):.6f}（JS 散度，各分布平均）")
+    if link is not None:
+        print(f"  链接 / 复制:  {linked} / {len(selected) - linked}（{LINK_MODES[link]}）")
+    if record_counts is not None:
+        selected_records = sum(record_counts[fp] for fp in selected)
+        total_records = sum(record_counts.values())
+        print(f"  筛选记录数:   {selected_records:,} / {total_records:,}")
     print()
 
-    # 列出输出目录中的文件
-    output_files = sorted(out_path.glob("part_*.jsonl"))
+    # 列出输出目录中的文件（--lazy 时只有选择清单，分片留在原处）
+    output_files = [] if lazy else get_part_files(out_path)
     if len(output_files) <= 10:
         for fp in output_files:
             print(f"  {fp.name:20s} {format_bytes(fp.stat().st_size):>10s}")
@@ -254,6 +716,7 @@ def main():
     print("=" * 60)
     print("  筛选完成 ✅")
     print("=" * 60)
+    metrics.report(metrics_json)
 
 
 if __name__ == "__main__":
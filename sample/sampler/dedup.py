@@ -0,0 +1,457 @@
+"""
+去重（--mode dedup）
+
+IM 导出数据中有大量重复消息（机器人指令、相同的 cmd action 等），会让压缩率测试的结果偏高。
+去重一遍流式读取数据文件夹，每个数据文件输出一个去重后的 JSONL 文件（保持原有顺序，保留第一次出现的记录），
+之后可以直接作为切割的输入：
+
+  - 完全重复：每条记录取一个 64 位指纹，默认为 bodies[0]（JSON 字节）的指纹，
+    --dedup-key line 时为整行的指纹（解析失败或没有 body 的记录总是按整行）
+  - 近似重复（--near）：对 bodies[0] 的文本（msg / action，其他类型为 body 的 JSON）取字符 4-gram，
+    用单次哈希 MinHash（64 个分箱，空箱按轮转规则补齐）得到签名，分成 8 段 × 8 行做 LSH，
+    任意一段与之前保留的记录相同即视为近似重复（Jaccard 相似度约 0.77 以上大概率命中，0.5 时约 3%）
+
+指纹集合先放在内存中，超过 --memory-limit 后排序写入磁盘（溢出段），内存中只为每段保留一个布隆过滤器
+（每个指纹约 1.25 字节），查找时先查布隆过滤器，命中再在 mmap 的溢出段中二分查找。
+
+解析与计算指纹由进程池按分片并行完成（--workers），主进程按分片顺序判定是否重复并写出。
+指纹由 blake2b（64 位摘要）计算，MinHash 对码位元组取内置 hash（整数元组的 hash 没有随机盐），
+都与进程和运行次数无关，因此完全重复和近似重复的结果都可以复现：同样的输入每次运行、任意 --workers 的结果完全一致。
+近似重复本身仍是概率判定：相似度在阈值附近的记录是否被判为重复取决于哈希值，但对同一输入是确定的。
+"""
+
+import bisect
+import hashlib
+import json
+import mmap
+import struct
+import tempfile
+from array import array
+from collections import Counter, deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import compress
+from pathlib import Path
+
+from data_common import (
+    Metrics,
+    body_json_bytes,
+    format_bytes,
+    is_compressed,
+    iter_batches,
+    loads_record,
+    strip_lines,
+)
+
+REPORT_FILENAME = "dedup.json"
+DEDUP_KEYS = ("body", "line")
+DEFAULT_MEMORY_LIMIT_MB = 512
+# 内存中每个指纹（set 中的 int）的大致开销
+SET_ENTRY_BYTES = 64
+# 并行时每个分片的字节数（压缩文件只能整体读取，一个文件一个分片）
+SHARD_SIZE = 32 * 1024 * 1024
+
+# 近似重复：字符 shingle 长度、MinHash 分箱数 = 段数 × 每段行数
+SHINGLE_SIZE = 4
+BANDS = 8
+ROWS = 8
+NUM_BINS = BANDS * ROWS
+_EMPTY = 1 << 64
+# 每个分片缓存的文本签名个数上限
+BAND_CACHE_SIZE = 65536
+# 空箱补齐时每跨过一个箱加上的偏移（大于任何箱值）
+_ROTATION = 1 << 58
+
+# 布隆过滤器：每个指纹的位数、哈希个数
+BLOOM_BITS_PER_ENTRY = 10
+BLOOM_HASHES = 4
+
+_MASK64 = (1 << 64) - 1
+# 段指纹的输入：段号与该段 ROWS 个箱值（补齐后的箱值小于 2^64）
+_BAND = struct.Struct(f"<B{ROWS}Q")
+PARSE_ERROR_LABEL = "(解析失败)"
+
+# (文件, 起始偏移, 结束偏移)
+Shard = tuple[Path, int, int]
+
+
+def _fingerprint(data: bytes) -> int:
+    """64 位指纹（blake2b，与进程、运行次数无关），0 保留给“没有指纹”"""
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little") or 1
+
+
+def body_text(body: dict) -> str:
+    """近似去重比较的文本：txt 的 msg、cmd 的 action，其他类型为 body 的 JSON"""
+    text = body.get("msg") or body.get("action")
+    if isinstance(text, str):
+        return text
+    return body_json_bytes(body).decode("utf-8", "surrogatepass")
+
+
+def minhash_bands(text: str) -> list[int]:
+    """单次哈希 MinHash 签名按段取指纹，返回 BANDS 个段指纹"""
+    # shingle 为码位元组：整数与整数元组的 hash 是固定算法，不受 PYTHONHASHSEED 影响（str / bytes 的受影响）
+    points = array("I", text.encode("utf-32-le", "surrogatepass"))
+    if len(points) > SHINGLE_SIZE:
+        shingles = set(zip(*(points[k:] for k in range(SHINGLE_SIZE))))
+    else:
+        shingles = {tuple(points)}
+    bins = [_EMPTY] * NUM_BINS
+    for h in map(hash, shingles):
+        h &= _MASK64
+        b = h & (NUM_BINS - 1)
+        v = h >> 6
+        if v < bins[b]:
+            bins[b] = v
+    if _EMPTY in bins:
+        # 轮转补齐：空箱取右侧（循环）最近的非空箱的值，每跨一个箱加一个偏移；
+        # 从最后一个非空箱开始向左扫一圈
+        orig = bins[:]
+        last = NUM_BINS - 1
+        while orig[last] == _EMPTY:
+            last -= 1
+        j = last
+        for step in range(1, NUM_BINS):
+            i = (last - step) % NUM_BINS
+            if orig[i] != _EMPTY:
+                j = i
+            else:
+                bins[i] = orig[j] + ((j - i) % NUM_BINS) * _ROTATION
+    return [_fingerprint(_BAND.pack(band, *bins[band * ROWS : (band + 1) * ROWS])) for band in range(BANDS)]
+
+
+def fingerprint_shard(shard: Shard, key: str, near: bool) -> tuple[array, array, list[str] | None]:
+    """计算一个分片中每条记录（strip 后非空的行）的指纹（进程池任务）
+
+    返回 (完全重复指纹, 近似重复段指纹（每条 BANDS 个，没有文本时全为 0）, 各条记录的 content_type)；
+    不需要解析时 content_type 为 None。分片内已出现过的指纹一定是完全重复，不再计算 MinHash。
+    """
+    filepath, start, end = shard
+    parse = key == "body" or near
+    exact = array("Q")
+    bands = array("Q")
+    content_types: list[str] | None = [] if parse else None
+    no_bands = [0] * BANDS
+    seen: set[int] = set()
+    # 相同文本的签名相同：IM 数据中文本重复很多（整行不同但 msg 相同），缓存一部分
+    band_cache: dict[str, list[int]] = {}
+    for _, lines in iter_batches(filepath, start, end):
+        lines = strip_lines(lines)
+        if not parse:
+            exact.extend(map(_fingerprint, lines))
+            continue
+        for line in lines:
+            try:
+                record = loads_record(line)
+                bodies = record.get("payload", {}).get("bodies", [])
+                body = bodies[0] if bodies else None
+                content_types.append(str(record.get("content_type", "unknown")))
+            except (ValueError, AttributeError):
+                body = None
+                content_types.append(PARSE_ERROR_LABEL)
+            if key == "body" and isinstance(body, dict):
+                fp = _fingerprint(body_json_bytes(body))
+            else:
+                fp = _fingerprint(line)
+            exact.append(fp)
+            if near:
+                if fp in seen:
+                    bands.extend(no_bands)
+                    continue
+                seen.add(fp)
+                text = body_text(body) if isinstance(body, dict) else ""
+                if not text:
+                    bands.extend(no_bands)
+                    continue
+                band_fps = band_cache.get(text)
+                if band_fps is None:
+                    if len(band_cache) >= BAND_CACHE_SIZE:
+                        band_cache.clear()
+                    band_fps = band_cache[text] = minhash_bands(text)
+                bands.extend(band_fps)
+    return exact, bands, content_types
+
+
+class FingerprintSet:
+    """64 位指纹集合，内存中超过 max_entries 个时排序写入磁盘
+
+    每个溢出段是排序后的 uint64 数组文件（mmap 后二分查找），内存中只保留它的布隆过滤器。
+    """
+
+    def __init__(self, max_entries: int, spill_dir: Path) -> None:
+        self.max_entries = max(1, max_entries)
+        self.spill_dir = spill_dir
+        self._memory: set[int] = set()
+        # (布隆过滤器, 位数, 溢出段视图, mmap)
+        self._runs: list[tuple[bytearray, int, memoryview, mmap.mmap]] = []
+        self.spilled = 0
+
+    def __len__(self) -> int:
+        return len(self._memory) + self.spilled
+
+    def __contains__(self, fp: int) -> bool:
+        if fp in self._memory:
+            return True
+        for bloom, nbits, view, _ in self._runs:
+            h1 = fp & 0xFFFFFFFF
+            h2 = (fp >> 32) | 1
+            for i in range(BLOOM_HASHES):
+                pos = (h1 + i * h2) % nbits
+                if not bloom[pos >> 3] & (1 << (pos & 7)):
+                    break
+            else:
+                i = bisect.bisect_left(view, fp)
+                if i < len(view) and view[i] == fp:
+                    return True
+        return False
+
+    def add(self, fp: int) -> None:
+        self._memory.add(fp)
+        if len(self._memory) >= self.max_entries:
+            self._spill()
+
+    def _spill(self) -> None:
+        fps = array("Q", sorted(self._memory))
+        path = self.spill_dir / f"run_{id(self):x}_{len(self._runs):04d}.u64"
+        with open(path, "wb") as f:
+            fps.tofile(f)
+        with open(path, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        nbits = max(64, len(fps) * BLOOM_BITS_PER_ENTRY)
+        bloom = bytearray((nbits + 7) // 8)
+        for fp in fps:
+            h1 = fp & 0xFFFFFFFF
+            h2 = (fp >> 32) | 1
+            for i in range(BLOOM_HASHES):
+                pos = (h1 + i * h2) % nbits
+                bloom[pos >> 3] |= 1 << (pos & 7)
+
+        self._runs.append((bloom, nbits, memoryview(m).cast("Q"), m))
+        self.spilled += len(fps)
+        self._memory = set()
+
+    def close(self) -> None:
+        for _, _, view, m in self._runs:
+            view.release()
+            m.close()
+        self._runs = []
+
+
+def judge_shard(
+    exact: array,
+    bands: array,
+    content_types: list[str] | None,
+    exact_set: FingerprintSet,
+    near_set: FingerprintSet | None,
+    exact_dups: Counter,
+    near_dups: Counter,
+) -> list[bool]:
+    """按顺序判定一个分片中每条记录是否保留，重复数按 content_type 计入 exact_dups / near_dups
+
+    近似去重只与之前保留的记录比较：只有保留的记录才把段指纹加入 near_set。
+    """
+    keep = []
+    for i, fp in enumerate(exact):
+        label = content_types[i] if content_types is not None else None
+        if fp in exact_set:
+            keep.append(False)
+            exact_dups[label] += 1
+            continue
+        exact_set.add(fp)
+        if near_set is not None:
+            band_fps = bands[i * BANDS : (i + 1) * BANDS]
+            if band_fps[0]:
+                if any(b in near_set for b in band_fps):
+                    keep.append(False)
+                    near_dups[label] += 1
+                    continue
+                for b in band_fps:
+                    near_set.add(b)
+        keep.append(True)
+    return keep
+
+
+def plan_shards(data_files: list[Path], parallel: bool) -> list[Shard]:
+    """按文件切分片：并行时大文件按 SHARD_SIZE 切成多片，分片不跨文件"""
+    shards = []
+    for fp in data_files:
+        size = fp.stat().st_size
+        if not parallel or is_compressed(fp) or size <= SHARD_SIZE:
+            shards.append((fp, 0, size))
+            continue
+        cuts = list(range(0, size, SHARD_SIZE)) + [size]
+        shards.extend((fp, start, end) for start, end in zip(cuts, cuts[1:]))
+    return shards
+
+
+def _ordered_results(pool: ProcessPoolExecutor, shards: list[Shard], key: str, near: bool, window: int) -> Iterator:
+    """按分片顺序取结果，同时最多 window 个分片在计算或等待处理，避免结果堆积在内存中"""
+    pending: deque = deque()
+    it = iter(shards)
+    for shard in it:
+        pending.append(pool.submit(fingerprint_shard, shard, key, near))
+        if len(pending) >= window:
+            break
+    while pending:
+        result = pending.popleft().result()
+        for shard in it:
+            pending.append(pool.submit(fingerprint_shard, shard, key, near))
+            break
+        yield result
+
+
+def output_name(filepath: Path) -> str:
+    """去重输出的文件名：去掉压缩后缀"""
+    return filepath.stem if is_compressed(filepath) else filepath.name
+
+
+def run_dedup(
+    data_files: list[Path],
+    total_file_size: int,
+    output_dir: Path,
+    key: str,
+    near: bool,
+    memory_limit_mb: int,
+    workers: int,
+    metrics: Metrics,
+) -> None:
+    """去重：每个数据文件写出一个去重后的文件，并写出报告 dedup.json"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    shards = plan_shards(data_files, workers > 1)
+    max_entries = memory_limit_mb * 1024 * 1024 // SET_ENTRY_BYTES
+    if near:
+        # 近似去重的段指纹是完全重复指纹的 BANDS 倍：内存上限分成 BANDS + 1 份，完全重复占 1 份，近似重复占 BANDS 份
+        max_entries //= BANDS + 1
+
+    totals: Counter[str] = Counter()
+    exact_dups: Counter[str] = Counter()
+    near_dups: Counter[str] = Counter()
+    records = kept = 0
+    bytes_done = 0
+    out_file = None
+    out_path: Path | None = None
+
+    spill = tempfile.TemporaryDirectory(prefix=".dedup_", dir=output_dir)
+    exact_set = FingerprintSet(max_entries, Path(spill.name))
+    near_set = FingerprintSet(max_entries * BANDS, Path(spill.name)) if near else None
+    pool = None
+    try:
+        if workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            results = _ordered_results(pool, shards, key, near, 2 * workers)
+        else:
+            results = (fingerprint_shard(shard, key, near) for shard in shards)
+
+        for (filepath, start, end), (exact, bands, content_types) in zip(
+            shards, metrics.timed("fingerprint", results)
+        ):
+            with metrics.phase("dedup"):
+                keep = judge_shard(exact, bands, content_types, exact_set, near_set, exact_dups, near_dups)
+            if content_types is not None:
+                totals.update(content_types)
+            else:
+                totals[None] += len(exact)
+            records += len(exact)
+            kept += sum(keep)
+
+            # 第二次读取本分片（大多还在页缓存中），按判定结果写出
+            target = output_dir / output_name(filepath)
+            if target != out_path:
+                if out_file is not None:
+                    out_file.close()
+                out_path = target
+                out_file = open(out_path, "wb")
+            with metrics.phase("write"):
+                pos = 0
+                for _, lines in iter_batches(filepath, start, end):
+                    lines = strip_lines(lines)
+                    chosen = list(compress(lines, keep[pos : pos + len(lines)]))
+                    pos += len(lines)
+                    if chosen:
+                        out_file.write(b"\n".join(chosen))
+                        out_file.write(b"\n")
+
+            bytes_done += end - start
+            pct = bytes_done / total_file_size * 100 if total_file_size else 0
+            print(
+                f"\r  ⏳ 进度: {pct:.1f}% | 已处理 {records:,} 条，保留 {kept:,} 条",
+                end="",
+                flush=True,
+            )
+    finally:
+        if out_file is not None:
+            out_file.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        spilled_runs = len(exact_set._runs) + (len(near_set._runs) if near_set is not None else 0)
+        exact_set.close()
+        if near_set is not None:
+            near_set.close()
+        spill.cleanup()
+
+    metrics.add(lines=records, nbytes=total_file_size)
+    print(f"\r  ✅ 去重完成: {records:,} 条 → 保留 {kept:,} 条{' ' * 40}")
+
+    def rate(n: int, total: int) -> float:
+        return round(n / total, 6) if total else 0.0
+
+    exact_total = sum(exact_dups.values())
+    near_total = sum(near_dups.values())
+    report = {
+        "key": key,
+        "near": near,
+        "near_params": {"shingle": SHINGLE_SIZE, "bands": BANDS, "rows": ROWS} if near else None,
+        "records": records,
+        "kept": kept,
+        "exact_duplicates": exact_total,
+        "near_duplicates": near_total,
+        "exact_rate": rate(exact_total, records),
+        "near_rate": rate(near_total, records),
+        "spilled_runs": spilled_runs,
+        "content_types": [
+            {
+                "content_type": label,
+                "records": n,
+                "exact_duplicates": exact_dups[label],
+                "near_duplicates": near_dups[label],
+                "duplicate_rate": rate(exact_dups[label] + near_dups[label], n),
+            }
+            for label, n in totals.most_common()
+            if label is not None
+        ],
+    }
+    with open(output_dir / REPORT_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+    print_report(report, output_dir)
+
+
+def print_report(report: dict, output_dir: Path) -> None:
+    """打印重复率报告"""
+    records = report["records"]
+    print()
+    print("=" * 60)
+    print("  📋 去重结果")
+    print("=" * 60)
+    print(f"\n  输出目录:     {output_dir.resolve()}")
+    print(f"  总记录数:     {records:,}")
+    print(f"  保留记录数:   {report['kept']:,}")
+    print(f"  完全重复:     {report['exact_duplicates']:,}（{report['exact_rate'] * 100:.2f}%）")
+    if report["near"]:
+        print(f"  近似重复:     {report['near_duplicates']:,}（{report['near_rate'] * 100:.2f}%）")
+    if report["spilled_runs"]:
+        print(f"  溢出段:       {report['spilled_runs']} 个（指纹超过内存上限后写入磁盘）")
+    out_size = sum(fp.stat().st_size for fp in output_dir.iterdir() if fp.name != REPORT_FILENAME)
+    print(f"  输出大小:     {format_bytes(out_size)}")
+
+    if report["content_types"]:
+        print()
+        print(f"  {'content_type':<30} {'总数':>8} {'完全重复':>8} {'近似重复':>8} {'重复率':>7}")
+        print(f"  {'─' * 30} {'─' * 10} {'─' * 12} {'─' * 12} {'─' * 10}")
+        for row in report["content_types"]:
+            print(
+                f"  {row['content_type']:<30} {row['records']:>10,} {row['exact_duplicates']:>12,} "
+                f"{row['near_duplicates']:>12,} {row['duplicate_rate'] * 100:>9.1f}%"
+            )
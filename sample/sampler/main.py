@@ -4,66 +4,159 @@ IM 数据抽样工具（等分切割）
 
 将文件夹下所有 JSONL 数据文件等分切割为 N 份小文件，
 保持数据的时序连续性，适用于 LZ4 压缩率测试抽样。
+输入可以是 .gz / .zst / .lz4 压缩文件，边解压边切割，无需先解压到磁盘。
+
+两种切割方式：
+  - bytes（默认）：按文件大小算出 N 个字节切点，对齐到行首后由多个线程并行复制各自的字节范围，
+    复制在内核中完成（copy_file_range / sendfile），数据不经过 Python，速度只受磁盘带宽限制；
+    加 --strip 时改为逐批读取、strip 每行并丢弃空行后写入（单线程）
+  - lines：先统计总行数再按行数等分，每份行数精确相等，但要读两遍数据；
+    有行偏移索引（index 子命令建立）时直接按记录号定位，不需要统计行数
+  - time：按记录的时间戳等分，每份覆盖的时长相等（见 timewindow.py）
+
+加 --time-window 时只切割落在时间窗口内的记录（如每天 20:00~22:00 的高峰时段），
+文件按时间有序时借助时间索引直接定位到窗口的字节范围，不需要扫描整个文件。
+
+加 --compress gz|zst 时各份写为 part_NNN.jsonl.gz / .jsonl.zst，压缩由线程池与读取并行进行。
+
+--mode stratified 改为分层抽样（见 stratified.py），输出一个抽样文件和各层统计。
+--mode dedup 改为去重（见 dedup.py），每个数据文件输出一个去重后的文件和重复率报告，可再作为切割的输入。
 
 用法:
     uv run main.py <数据文件夹路径> [选项]
+    uv run main.py index <数据文件夹路径> [--index-dir DIR]
 
 示例:
     uv run main.py ../../sdkTest/tmp --parts 100
     uv run main.py ../../sdkTest/tmp --parts 50 --output-dir ./my_output
+    uv run main.py ../../sdkTest/tmp --parts 100 --split-by lines
+    uv run main.py ../../sdkTest/tmp --parts 100 --compress zst
+    uv run main.py ../../sdkTest/tmp --parts 24 --split-by time --time-window 20:00,22:00
+    uv run main.py ../../sdkTest/tmp --mode stratified --per-stratum 500 --seed 1
+    uv run main.py ../../sdkTest/tmp --mode dedup --near --output-dir ./dedup
 """
 
+import errno
+import os
 import sys
-import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from pathlib import Path
 
+from data_common import (
+    COMPRESSED_SUFFIXES,
+    CompressedWriter,
+    DEFAULT_TIME_FIELD,
+    LINE_INDEX_DIRNAME,
+    LineIndex,
+    LineIndexError,
+    MANIFEST_FILENAME,
+    Metrics,
+    OUTPUT_LEVELS,
+    PartStats,
+    Profiler,
+    TIME_INDEX_DIRNAME,
+    TimeIndexError,
+    build_line_index,
+    build_time_index,
+    format_bytes,
+    get_data_files,
+    is_compressed,
+    iter_batches,
+    load_time_index,
+    missing_packages,
+    record_starts,
+    record_time,
+    save_time_index,
+    strip_lines,
+    write_manifest,
+)
+from dedup import DEDUP_KEYS, DEFAULT_MEMORY_LIMIT_MB, run_dedup
+from stratified import DEFAULT_PER_STRATUM, run_stratified
+from timewindow import (
+    Timeline,
+    candidate_ranges,
+    format_time,
+    is_seekable,
+    parse_time_window,
+    plan_time_ranges,
+    window_intervals,
+)
 
-def format_bytes(n: float) -> str:
-    """格式化字节数为可读字符串"""
-    if n < 1024:
-        return f"{n:.0f} B"
-    elif n < 1024 * 1024:
-        return f"{n / 1024:.1f} KB"
-    elif n < 1024 * 1024 * 1024:
-        return f"{n / (1024 * 1024):.2f} MB"
-    else:
-        return f"{n / (1024 * 1024 * 1024):.2f} GB"
+# (文件, 起始偏移, 结束偏移)
+ByteRange = tuple[Path, int, int]
+SPLIT_MODES = ("bytes", "lines", "time")
+MODES = ("split", "stratified", "dedup")
+# --compress 可选的输出压缩格式
+OUTPUT_COMPRESSIONS = tuple(suffix.lstrip(".") for suffix in OUTPUT_LEVELS)
+# 默认复制线程数：复制在内核中进行，线程只负责发起系统调用
+DEFAULT_WORKERS = 4
+# 对齐切点、裁剪边缘空白时每次读取的字节数
+EDGE_READ_SIZE = 64 * 1024
+# 内核复制不可用时，用户态复制的缓冲区大小
+COPY_BUFFER_SIZE = 1024 * 1024
+# 行首尾视为空白的字节（与 bytes.strip 一致）
+WHITESPACE = b" \t\n\r\x0b\x0c"
+# 内核复制不支持时返回的错误码，遇到后改用下一种方式
+_COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+
+def part_filename(part_idx: int, parts: int, compression: str | None = None) -> str:
+    """第 part_idx 份（从 0 开始）的文件名，序号按总份数补零；压缩输出时加上 .gz / .zst 后缀"""
+    name = f"part_{part_idx + 1:0{len(str(parts))}d}.jsonl"
+    return f"{name}.{compression}" if compression else name
 
 
-def get_data_files(dir_path: Path) -> list[Path]:
-    """获取文件夹下所有数据文件（排除隐藏文件），按名称排序"""
-    files = []
-    for entry in sorted(dir_path.iterdir()):
-        if entry.is_file() and not entry.name.startswith("."):
-            files.append(entry)
-    return files
+def remove_other_variants(output_dir: Path, parts: int, compression: str | None) -> None:
+    """删除输出目录中同名分片的其他压缩版本（以前用别的 --compress 切割留下的），避免下游重复读取"""
+    for k in range(parts):
+        name = part_filename(k, parts)
+        keep = part_filename(k, parts, compression)
+        for suffix in ("", *COMPRESSED_SUFFIXES):
+            if name + suffix != keep:
+                (output_dir / (name + suffix)).unlink(missing_ok=True)
 
 
-def count_total_lines(data_files: list[Path], total_file_size: int) -> int:
+def open_part(path: Path, level: int | None, pool: Executor | None, workers: int, stats: PartStats | None):
+    """打开一份输出文件；压缩输出时返回 CompressedWriter（最多 2 × workers 块在压缩中），
+    分片清单的大小与校验和按压缩后的数据统计"""
+    if not is_compressed(path):
+        return open(path, "wb")
+    on_write = stats.add_bytes if stats is not None else None
+    return CompressedWriter(path, level, pool, 2 * workers, on_write)
+
+
+def compress_pool(compression: str | None, workers: int):
+    """压缩输出时的压缩线程池（zlib / zstandard 压缩时释放 GIL），不压缩时为空上下文"""
+    if compression is None:
+        return nullcontext()
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compress")
+
+
+def count_total_lines(data_files: list[Path], total_file_size: int, metrics: Metrics) -> int:
     """第一遍：流式统计总行数"""
     print("📊 第一遍：统计总行数...")
     total_lines = 0
-    bytes_read = 0
-    last_progress_time = time.time()
+    bytes_done = 0
 
     for file_idx, filepath in enumerate(data_files):
-        with open(filepath, "r", encoding="utf-8") as f:
-            for raw_line in f:
-                if raw_line.strip():
-                    total_lines += 1
-                bytes_read += len(raw_line.encode("utf-8"))
-
-                now = time.time()
-                if now - last_progress_time >= 1.0:
-                    pct = bytes_read / total_file_size * 100 if total_file_size else 0
-                    print(
-                        f"\r  ⏳ 进度: {pct:.1f}% | "
-                        f"文件 {file_idx + 1}/{len(data_files)} | "
-                        f"已统计 {total_lines:,} 行",
-                        end="",
-                        flush=True,
-                    )
-                    last_progress_time = now
+
+        def on_progress(offset: int) -> None:
+            done = bytes_done + offset
+            pct = done / total_file_size * 100 if total_file_size else 0
+            print(
+                f"\r  ⏳ 进度: {pct:.1f}% | "
+                f"文件 {file_idx + 1}/{len(data_files)} | "
+                f"已统计 {total_lines:,} 行",
+                end="",
+                flush=True,
+            )
+
+        batches = iter_batches(filepath, progress=on_progress)
+        for _, lines in metrics.timed("read", batches, body="count"):
+            total_lines += len(strip_lines(lines))
+        bytes_done += filepath.stat().st_size
+        metrics.add(nbytes=filepath.stat().st_size)
 
     print(f"\r  ✅ 总行数: {total_lines:,}{' ' * 40}")
     return total_lines
@@ -75,8 +168,17 @@ def split_files(
     total_file_size: int,
     parts: int,
     output_dir: Path,
+    metrics: Metrics,
+    stats: list[PartStats] | None = None,
+    compression: str | None = None,
+    level: int | None = None,
+    pool: Executor | None = None,
+    workers: int = 1,
 ) -> None:
-    """第二遍：流式读取并按行数切割写入"""
+    """第二遍：流式读取并按行数切割写入；给出 stats 时边写边统计各份（分片清单）
+
+    压缩输出时各块交给压缩线程池 pool（workers 个线程），读取与切行在主线程中继续进行。
+    """
     lines_per_part = total_lines // parts
     remainder = total_lines % parts
 
@@ -93,26 +195,60 @@ def split_files(
     lines_in_current_part = 0
     # 前 remainder 份每份多分 1 行
     current_part_limit = lines_per_part + (1 if current_part <= remainder else 0)
-    digits = len(str(parts))
-    out_filename = f"part_{current_part:0{digits}d}.jsonl"
-    out_file = open(output_dir / out_filename, "w", encoding="utf-8")
+
+    def open_current():
+        path = output_dir / part_filename(current_part - 1, parts, compression)
+        return open_part(path, level, pool, workers, stats[current_part - 1] if stats is not None else None)
+
+    out_file = open_current()
 
     global_line = 0
-    bytes_read = 0
-    last_progress_time = time.time()
+    bytes_done = 0
 
-    for file_idx, filepath in enumerate(data_files):
-        with open(filepath, "r", encoding="utf-8") as f:
-            for raw_line in f:
-                stripped = raw_line.strip()
-                if not stripped:
-                    continue
+    for filepath in data_files:
 
-                bytes_read += len(raw_line.encode("utf-8"))
-                global_line += 1
+        def on_progress(offset: int) -> None:
+            done = bytes_done + offset
+            pct = done / total_file_size * 100 if total_file_size else 0
+            print(
+                f"\r  ⏳ 进度: {pct:.1f}% | "
+                f"正在写入 part {current_part}/{parts} | "
+                f"已处理 {global_line:,} 行",
+                end="",
+                flush=True,
+            )
 
-                out_file.write(stripped + "\n")
-                lines_in_current_part += 1
+        batches = iter_batches(filepath, progress=on_progress)
+        for offset, lines in metrics.timed("read", batches):
+            if stats is not None:
+                # 各条记录的行首偏移，用于记录每份的来源字节范围
+                starts = record_starts(offset, lines)
+                batch_end = offset + sum(map(len, lines)) + len(lines)
+            lines = strip_lines(lines)
+            i = 0
+            while i < len(lines):
+                # 最后一份不设上限，收下剩余所有行
+                if current_part < parts:
+                    take = min(len(lines) - i, current_part_limit - lines_in_current_part)
+                else:
+                    take = len(lines) - i
+                chunk = lines[i : i + take]
+                with metrics.phase("write"):
+                    data = b"\n".join(chunk)
+                    out_file.write(data)
+                    out_file.write(b"\n")
+                if stats is not None:
+                    part_stats = stats[current_part - 1]
+                    end = starts[i + take] if i + take < len(starts) else batch_end
+                    part_stats.add_source(filepath, starts[i], end)
+                    with metrics.phase("stats"):
+                        if compression is None:
+                            part_stats.add_bytes(data)
+                            part_stats.add_bytes(b"\n")
+                        part_stats.add_records(chunk)
+                i += take
+                global_line += take
+                lines_in_current_part += take
 
                 # 当前分片满了，切换到下一个
                 if lines_in_current_part >= current_part_limit and current_part < parts:
@@ -122,77 +258,844 @@ def split_files(
                     current_part_limit = lines_per_part + (
                         1 if current_part <= remainder else 0
                     )
-                    out_filename = f"part_{current_part:0{digits}d}.jsonl"
-                    out_file = open(output_dir / out_filename, "w", encoding="utf-8")
-
-                # 进度显示
-                now = time.time()
-                if now - last_progress_time >= 1.0:
-                    pct = bytes_read / total_file_size * 100 if total_file_size else 0
-                    print(
-                        f"\r  ⏳ 进度: {pct:.1f}% | "
-                        f"正在写入 part {current_part}/{parts} | "
-                        f"已处理 {global_line:,} 行",
-                        end="",
-                        flush=True,
-                    )
-                    last_progress_time = now
+                    out_file = open_current()
+        bytes_done += filepath.stat().st_size
+        metrics.add(nbytes=filepath.stat().st_size)
 
     out_file.close()
+    metrics.add(lines=global_line)
     print(f"\r  ✅ 切割完成！共 {current_part} 份{' ' * 40}")
 
 
+def plan_byte_parts(data_files: list[Path], parts: int) -> list[list[ByteRange]]:
+    """把所有文件首尾相接看作一个字节流，按总大小等分为 parts 个范围
+
+    第 k 份负责首字节落在 [k * 总大小 / parts, (k + 1) * 总大小 / parts) 内的行，
+    范围跨文件时拆成多段。切点不必落在换行处：iter_batches 按首字节归属规则
+    自动对齐到下一行行首，因此各份之间既不重复也不遗漏。
+    """
+    return plan_range_parts([(fp, 0, fp.stat().st_size) for fp in data_files], parts)
+
+
+def plan_range_parts(ranges: list[ByteRange], parts: int) -> list[list[ByteRange]]:
+    """把若干个字节范围首尾相接，按总大小等分为 parts 份（规则同 plan_byte_parts）
+
+    各范围的两端须在行首（或文件末尾），切点对齐后才不会越出范围。
+    """
+    total_size = sum(end - start for _, start, end in ranges)
+    cuts = [total_size * k // parts for k in range(parts + 1)]
+
+    plan: list[list[ByteRange]] = [[] for _ in range(parts)]
+    base = 0
+    for fp, range_start, range_end in ranges:
+        size = range_end - range_start
+        for k in range(parts):
+            start = max(cuts[k], base)
+            end = min(cuts[k + 1], base + size)
+            if start < end:
+                plan[k].append((fp, range_start + start - base, range_start + end - base))
+        base += size
+    return plan
+
+
+def plan_record_parts(line_index: LineIndex, parts: int) -> tuple[list[list[ByteRange]], list[int]]:
+    """按记录数等分（前 remainder 份多 1 条），返回 (各份的字节范围, 各份记录数)"""
+    per_part, remainder = divmod(len(line_index), parts)
+    counts = [per_part + (1 if k < remainder else 0) for k in range(parts)]
+    plan = []
+    start = 0
+    for count in counts:
+        plan.append(line_index.record_ranges(start, start + count))
+        start += count
+    return plan, counts
+
+
+def strip_parts(
+    plan: list[list[ByteRange]],
+    total_file_size: int,
+    output_dir: Path,
+    metrics: Metrics,
+    stats: list[PartStats] | None = None,
+    compression: str | None = None,
+    level: int | None = None,
+    pool: Executor | None = None,
+    workers: int = 1,
+) -> list[int]:
+    """单遍切割：每份读取各自的字节范围，strip 每行并丢弃空行后写入，返回每份的行数
+
+    给出 stats 时边写边统计各份（分片清单）；压缩输出时与 split_files 相同，由压缩线程池 pool 压缩。
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    parts = len(plan)
+    part_lines = []
+    bytes_done = 0
+
+    for part_idx, ranges in enumerate(plan):
+        lines_in_part = 0
+
+        def on_progress(offset: int) -> None:
+            done = bytes_done + offset - range_start
+            pct = done / total_file_size * 100 if total_file_size else 0
+            print(
+                f"\r  ⏳ 进度: {pct:.1f}% | "
+                f"正在写入 part {part_idx + 1}/{parts} | "
+                f"已处理 {sum(part_lines) + lines_in_part:,} 行",
+                end="",
+                flush=True,
+            )
+
+        part_stats = stats[part_idx] if stats is not None else None
+        out_path = output_dir / part_filename(part_idx, parts, compression)
+        with open_part(out_path, level, pool, workers, part_stats) as out_file:
+            for filepath, range_start, range_end in ranges:
+                if part_stats is not None:
+                    part_stats.add_source(filepath, range_start, range_end)
+                batches = iter_batches(filepath, range_start, range_end, progress=on_progress)
+                for _, lines in metrics.timed("read", batches):
+                    lines = strip_lines(lines)
+                    if not lines:
+                        continue
+                    with metrics.phase("write"):
+                        data = b"\n".join(lines)
+                        out_file.write(data)
+                        out_file.write(b"\n")
+                    if part_stats is not None:
+                        with metrics.phase("stats"):
+                            if compression is None:
+                                part_stats.add_bytes(data)
+                                part_stats.add_bytes(b"\n")
+                            part_stats.add_records(lines)
+                    lines_in_part += len(lines)
+                bytes_done += range_end - range_start
+        part_lines.append(lines_in_part)
+
+    metrics.add(lines=sum(part_lines), nbytes=total_file_size)
+    print(f"\r  ✅ 切割完成！共 {parts} 份{' ' * 40}")
+    return part_lines
+
+
+def route_time_parts(
+    data_files: list[Path],
+    entries: list[dict],
+    timeline: Timeline,
+    parts: int,
+    output_dir: Path,
+    field: str,
+    metrics: Metrics,
+    stats: list[PartStats] | None = None,
+    compression: str | None = None,
+    level: int | None = None,
+    pool: Executor | None = None,
+    workers: int = 1,
+) -> list[int]:
+    """按时间等分（有文件乱序或压缩、无法按偏移定位时）：只读取时间范围与时间轴相交的块，
+    逐条按时间戳写入所在的份（所有份同时打开），返回每份的行数
+
+    没有时间戳的记录跳过。各份的记录来自不连续的位置，分片清单中不记录来源范围。
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    ranges = [r for fp, entry in zip(data_files, entries) for r in candidate_ranges(fp, entry, timeline)]
+    total_size = sum(end - start for _, start, end in ranges)
+    part_lines = [0] * parts
+    skipped = 0
+    bytes_done = 0
+
+    outs = []
+    try:
+        for k in range(parts):
+            path = output_dir / part_filename(k, parts, compression)
+            outs.append(open_part(path, level, pool, workers, stats[k] if stats is not None else None))
+
+        for filepath, range_start, range_end in ranges:
+
+            def on_progress(offset: int) -> None:
+                done = bytes_done + offset - range_start
+                pct = done / total_size * 100 if total_size else 0
+                print(
+                    f"\r  ⏳ 进度: {pct:.1f}% | 正在读取 {filepath.name} | 已写入 {sum(part_lines):,} 行",
+                    end="",
+                    flush=True,
+                )
+
+            batches = iter_batches(filepath, range_start, range_end, progress=on_progress)
+            for _, lines in metrics.timed("read", batches):
+                groups: dict[int, list[bytes]] = {}
+                with metrics.phase("route"):
+                    for line in strip_lines(lines):
+                        ts = record_time(line, field)
+                        k = timeline.part_of(ts, parts) if ts is not None else None
+                        if k is None:
+                            skipped += 1
+                            continue
+                        groups.setdefault(k, []).append(line)
+                for k, chunk in groups.items():
+                    with metrics.phase("write"):
+                        data = b"\n".join(chunk)
+                        outs[k].write(data)
+                        outs[k].write(b"\n")
+                    if stats is not None:
+                        with metrics.phase("stats"):
+                            if compression is None:
+                                stats[k].add_bytes(data)
+                                stats[k].add_bytes(b"\n")
+                            stats[k].add_records(chunk)
+                    part_lines[k] += len(chunk)
+            bytes_done += range_end - range_start
+    finally:
+        for out in outs:
+            out.close()
+
+    metrics.add(lines=sum(part_lines), nbytes=total_size)
+    print(f"\r  ✅ 切割完成！共 {parts} 份（读取 {format_bytes(total_size)}，跳过窗口外或没有时间戳的 {skipped:,} 条）{' ' * 10}")
+    return part_lines
+
+
+def load_time_entries(data_files: list[Path], input_dir: str, field: str, workers: int) -> list[dict]:
+    """加载时间索引；不存在或已过期时建立并保存（数据目录不可写时只在本次使用）"""
+    index_dir = Path(input_dir) / TIME_INDEX_DIRNAME
+    try:
+        return load_time_index(data_files, index_dir, field)
+    except TimeIndexError as e:
+        print(f"🕒 {e}，建立时间索引（字段 {field}）...")
+
+    def on_progress(done: int) -> None:
+        print(f"\r  ⏳ 建立时间索引: {done}/{len(data_files)} 个文件", end="", flush=True)
+
+    entries = build_time_index(data_files, field, workers, on_progress)
+    try:
+        save_time_index(entries, index_dir, field)
+        print(f"\r  ✅ 时间索引已写入: {index_dir}{' ' * 20}")
+    except TimeIndexError as e:
+        print(f"\r  ⚠️  {e}，本次只在内存中使用{' ' * 20}")
+    return entries
+
+
+def _snap_to_line(f, offset: int) -> int:
+    """offset 之后（含）第一个行首的位置；offset 为 0 或恰在换行之后时不变"""
+    if offset == 0:
+        return 0
+    f.seek(offset - 1)
+    return offset - 1 + len(f.readline())
+
+
+def _trim_range(f, start: int, end: int) -> tuple[int, int]:
+    """去掉 [start, end) 首尾的空白字节（首尾的空行与首行行首、末行行尾的空白）"""
+    while start < end:
+        f.seek(start)
+        block = f.read(min(EDGE_READ_SIZE, end - start))
+        stripped = block.lstrip(WHITESPACE)
+        start += len(block) - len(stripped)
+        if stripped:
+            break
+    while end > start:
+        size = min(EDGE_READ_SIZE, end - start)
+        f.seek(end - size)
+        block = f.read(size)
+        stripped = block.rstrip(WHITESPACE)
+        end -= len(block) - len(stripped)
+        if stripped:
+            break
+    return start, end
+
+
+def _copy_range(src: int, dst: int, offset: int, count: int) -> None:
+    """把 src 的 [offset, offset + count) 追加写入 dst 的当前位置
+
+    依次尝试 copy_file_range（同一文件系统内可在内核中完成，支持时还会使用 reflink）、
+    sendfile，都不可用时退回用户态缓冲复制。
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            while count > 0:
+                n = os.copy_file_range(src, dst, count, offset)
+                if n == 0:
+                    break
+                offset += n
+                count -= n
+            return
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+    if hasattr(os, "sendfile"):
+        try:
+            while count > 0:
+                n = os.sendfile(dst, src, offset, count)
+                if n == 0:
+                    break
+                offset += n
+                count -= n
+            return
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+    while count > 0:
+        buf = os.pread(src, min(COPY_BUFFER_SIZE, count), offset)
+        if not buf:
+            break
+        os.write(dst, buf)
+        offset += len(buf)
+        count -= len(buf)
+
+
+def copy_part(
+    ranges: list[ByteRange], out_file: Path, level: int | None = None, stats: PartStats | None = None
+) -> int:
+    """把一份的各个字节范围复制到 out_file，返回写入的字节数
+
+    范围两端先对齐到行首（与 iter_batches 的首字节归属规则一致），再去掉首尾空白，
+    每段末尾补一个换行；段内的行原样复制，不做逐行 strip。
+    给出 stats 时数据经用户态缓冲复制，顺带统计记录数、CRC32 与来源范围（分片清单），只读一遍；
+    不给时在内核中复制。out_file 为压缩文件时数据要经过压缩，见 compress_part。
+    """
+    if is_compressed(out_file):
+        return compress_part(ranges, out_file, level, stats)
+    written = 0
+    dst = os.open(out_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        for filepath, range_start, range_end in ranges:
+            if stats is not None:
+                stats.add_source(filepath, range_start, range_end)
+            with open(filepath, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                start = _snap_to_line(f, range_start)
+                end = size if range_end >= size else _snap_to_line(f, range_end)
+                start, end = _trim_range(f, start, end)
+                if start >= end:
+                    continue
+                if stats is None:
+                    _copy_range(f.fileno(), dst, start, end - start)
+                else:
+                    offset = start
+                    while offset < end:
+                        block = os.pread(f.fileno(), min(COPY_BUFFER_SIZE, end - offset), offset)
+                        if not block:
+                            break
+                        os.write(dst, block)
+                        stats.add_bytes(block)
+                        stats.add_raw(block)
+                        offset += len(block)
+            os.write(dst, b"\n")
+            if stats is not None:
+                stats.add_bytes(b"\n")
+                stats.add_raw(b"\n")
+            written += end - start + 1
+    finally:
+        os.close(dst)
+    return written
+
+
+def compress_part(
+    ranges: list[ByteRange], out_file: Path, level: int | None, stats: PartStats | None = None
+) -> int:
+    """copy_part 的压缩版本：字节范围的处理相同，数据在调用线程中压缩，返回压缩后的字节数
+
+    给出 stats 时记录数按原始数据统计，大小与 CRC32 按压缩后的数据统计。
+    """
+    on_write = stats.add_bytes if stats is not None else None
+    with CompressedWriter(out_file, level, on_write=on_write) as writer:
+        for filepath, range_start, range_end in ranges:
+            if stats is not None:
+                stats.add_source(filepath, range_start, range_end)
+            with open(filepath, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                start = _snap_to_line(f, range_start)
+                end = size if range_end >= size else _snap_to_line(f, range_end)
+                start, end = _trim_range(f, start, end)
+                if start >= end:
+                    continue
+                f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    block = f.read(min(COPY_BUFFER_SIZE, remaining))
+                    if not block:
+                        break
+                    writer.write(block)
+                    if stats is not None:
+                        stats.add_raw(block)
+                    remaining -= len(block)
+            writer.write(b"\n")
+            if stats is not None:
+                stats.add_raw(b"\n")
+    return writer.bytes_written
+
+
+def copy_parts(
+    plan: list[list[ByteRange]],
+    total_file_size: int,
+    output_dir: Path,
+    workers: int,
+    metrics: Metrics,
+    compression: str | None = None,
+    level: int | None = None,
+    stats: list[PartStats] | None = None,
+) -> list[int]:
+    """零拷贝切割：多个线程并行复制各份的字节范围，返回每份的字节数
+
+    用线程而不是进程：复制在内核中进行，系统调用期间释放 GIL，不需要进程间传输数据。
+    压缩输出时每个线程读取并压缩自己的一份（压缩时同样释放 GIL）。
+    给出 stats 时各份在复制的同时统计记录数、CRC32 与来源范围（见 copy_part）。
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    parts = len(plan)
+    part_bytes = [0] * parts
+    done = 0
+
+    with metrics.phase("copy"), ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(
+                copy_part,
+                ranges,
+                output_dir / part_filename(k, parts, compression),
+                level,
+                stats[k] if stats is not None else None,
+            ): k
+            for k, ranges in enumerate(plan)
+        }
+        for future in as_completed(futures):
+            part_bytes[futures[future]] = future.result()
+            done += 1
+            print(f"\r  ⏳ 进度: {done}/{parts} 份", end="", flush=True)
+
+    metrics.add(nbytes=total_file_size)
+    print(f"\r  ✅ 切割完成！共 {parts} 份{' ' * 40}")
+    return part_bytes
+
+
+def scan_part(ranges: list[ByteRange], out_file: Path) -> PartStats:
+    """统计一份已复制好的分片（进程池任务）"""
+    stats = PartStats(out_file.name)
+    for filepath, range_start, range_end in ranges:
+        stats.add_source(filepath, range_start, range_end)
+    stats.scan_file(out_file)
+    return stats
+
+
+def scan_parts(
+    plan: list[list[ByteRange]],
+    output_dir: Path,
+    workers: int,
+    metrics: Metrics,
+    compression: str | None = None,
+) -> list[PartStats]:
+    """--manifest-stats 且原样复制时，复制完再读一遍各分片（此时大多还在页缓存中）统计分片清单的内容统计
+
+    解析 JSON 受 GIL 限制，用进程池并行。
+    """
+    parts = len(plan)
+    stats: list[PartStats | None] = [None] * parts
+    done = 0
+
+    with metrics.phase("stats"), ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(scan_part, ranges, output_dir / part_filename(k, parts, compression)): k
+            for k, ranges in enumerate(plan)
+        }
+        for future in as_completed(futures):
+            stats[futures[future]] = future.result()
+            done += 1
+            print(f"\r  ⏳ 统计分片清单: {done}/{parts} 份", end="", flush=True)
+
+    print(f"\r  ✅ 分片清单统计完成{' ' * 40}")
+    return stats
+
+
+def load_input_files(input_dir: str) -> list[Path]:
+    """检查数据文件夹并列出其中的数据文件，出错时直接退出"""
+    dir_path = Path(input_dir)
+    if not dir_path.exists():
+        print(f"❌ 路径不存在: {input_dir}")
+        sys.exit(1)
+    if not dir_path.is_dir():
+        print(f"❌ 不是文件夹: {input_dir}")
+        sys.exit(1)
+
+    data_files = get_data_files(dir_path)
+    if not data_files:
+        print(f"❌ 文件夹中没有数据文件: {input_dir}")
+        sys.exit(1)
+    missing = missing_packages(data_files)
+    if missing:
+        print(f"❌ 读取压缩文件需要 {', '.join(missing)}，请使用: uv run --extra compressed main.py ...")
+        sys.exit(1)
+    return data_files
+
+
+def index_main(args: list[str]) -> None:
+    """index 子命令：为数据文件夹建立行偏移索引"""
+    if not args or args[0] in ("-h", "--help"):
+        print("用法: uv run main.py index <数据文件夹路径> [--index-dir DIR]")
+        print()
+        print(f"  --index-dir DIR  索引目录（默认 <数据文件夹>/{LINE_INDEX_DIRNAME}）")
+        sys.exit(0 if args else 1)
+
+    input_dir = args[0]
+    index_dir: Path | None = None
+    i = 1
+    while i < len(args):
+        if args[i] == "--index-dir" and i + 1 < len(args):
+            index_dir = Path(args[i + 1])
+            i += 2
+        else:
+            print(f"❌ 未知参数: {args[i]}")
+            sys.exit(1)
+
+    data_files = load_input_files(input_dir)
+    if index_dir is None:
+        index_dir = Path(input_dir) / LINE_INDEX_DIRNAME
+    total_file_size = sum(f.stat().st_size for f in data_files)
+
+    print(f"📇 建立行偏移索引: {input_dir}（{len(data_files)} 个文件，{format_bytes(total_file_size)}）")
+
+    def on_progress(done: int) -> None:
+        pct = done / total_file_size * 100 if total_file_size else 0
+        print(f"\r  ⏳ 进度: {pct:.1f}%", end="", flush=True)
+
+    try:
+        records = build_line_index(data_files, index_dir, on_progress)
+    except LineIndexError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    except OSError as e:
+        print(f"\n❌ 无法建立索引 {index_dir}: {e}")
+        sys.exit(1)
+    size = sum(f.stat().st_size for f in index_dir.iterdir())
+    print(f"\r  ✅ 索引已写入: {index_dir}（{records:,} 条记录，{format_bytes(size)}）{' ' * 20}")
+
+
+def stratified_main(
+    input_dir: str,
+    data_files: list[Path],
+    out_path: Path,
+    per_stratum: int | None,
+    sample_size: int | None,
+    min_per_stratum: int,
+    seed: int | None,
+    profiler: Profiler | None,
+    metrics_json: Path | None,
+) -> None:
+    """--mode stratified：分层抽样"""
+    total_file_size = sum(f.stat().st_size for f in data_files)
+
+    print("=" * 60)
+    print("  🎯 IM 数据分层抽样工具")
+    print("=" * 60)
+    print(f"\n📂 输入目录: {input_dir}")
+    print(f"📄 数据文件: {len(data_files)} 个")
+    print(f"📦 总大小:   {format_bytes(total_file_size)}")
+    print("🧱 分层:     content_type × chat_type × 行长度分桶")
+    if per_stratum is not None:
+        print(f"🔢 配额:     每层 {per_stratum:,} 条")
+    else:
+        floor = f"，每层至少 {min_per_stratum:,} 条" if min_per_stratum else ""
+        print(f"🔢 配额:     按比例分配共 {sample_size:,} 条{floor}")
+    if seed is not None:
+        print(f"🎲 随机种子: {seed}")
+    print(f"📁 输出目录: {out_path.resolve()}\n")
+
+    metrics = Metrics("sampler", enabled=metrics_json is not None)
+    with profiler or nullcontext():
+        run_stratified(
+            data_files, total_file_size, out_path, per_stratum, sample_size,
+            min_per_stratum, seed, metrics,
+        )
+
+    print()
+    print("=" * 60)
+    print("  抽样完成 ✅")
+    print("=" * 60)
+    metrics.report(metrics_json)
+
+
+def dedup_main(
+    input_dir: str,
+    data_files: list[Path],
+    out_path: Path,
+    key: str,
+    near: bool,
+    memory_limit_mb: int,
+    workers: int,
+    profiler: Profiler | None,
+    metrics_json: Path | None,
+) -> None:
+    """--mode dedup：去重"""
+    total_file_size = sum(f.stat().st_size for f in data_files)
+
+    print("=" * 60)
+    print("  🧹 IM 数据去重工具")
+    print("=" * 60)
+    print(f"\n📂 输入目录: {input_dir}")
+    print(f"📄 数据文件: {len(data_files)} 个")
+    print(f"📦 总大小:   {format_bytes(total_file_size)}")
+    print(f"🔑 去重键:   {'bodies[0]' if key == 'body' else '整行'}{' + 近似重复（MinHash/LSH）' if near else ''}")
+    print(f"🧠 内存上限: {memory_limit_mb} MB（超过后指纹写入磁盘）")
+    print(f"🧵 进程数:   {workers}")
+    print(f"📁 输出目录: {out_path.resolve()}\n")
+
+    metrics = Metrics("sampler", enabled=metrics_json is not None)
+    with profiler or nullcontext():
+        run_dedup(data_files, total_file_size, out_path, key, near, memory_limit_mb, workers, metrics)
+
+    print()
+    print("=" * 60)
+    print("  去重完成 ✅")
+    print("=" * 60)
+    metrics.report(metrics_json)
+
+
 def main():
     # 解析参数
     args = sys.argv[1:]
+    if args and args[0] == "index":
+        index_main(args[1:])
+        return
     if not args or args[0] in ("-h", "--help"):
         print("用法: uv run main.py <数据文件夹路径> [选项]")
+        print("      uv run main.py index <数据文件夹路径> [--index-dir DIR]   建立行偏移索引")
         print()
         print("选项:")
+        print("  --mode MODE      split（等分切割，默认）/ stratified（分层抽样）/ dedup（去重）")
         print("  --parts N        切割份数（默认 100）")
         print("  --output-dir DIR 输出文件夹（默认 ./output）")
+        print("  --split-by MODE  切割方式: bytes（按字节，只读一遍，默认）/ lines（按行数精确等分，读两遍）/ time（按时间等分）")
+        print("  --workers N      原样复制的线程数 / 去重的进程数（默认 4；0 表示使用全部 CPU 核）")
+        print("  --strip          逐行 strip 并丢弃空行（经过 Python，较慢；默认原样复制）")
+        print(f"  --index-dir DIR  行偏移索引目录（默认 <数据文件夹>/{LINE_INDEX_DIRNAME}，lines 模式存在时使用）")
+        print(f"  --no-manifest    不生成分片清单 {MANIFEST_FILENAME}（各份的行数、校验和与来源范围）")
+        print("  --manifest-stats 分片清单中加入内容统计（content_type / body type / 长度分桶 / 压缩率），需逐条解析，较慢")
+        print("  --compress FMT   各份写为压缩文件: gz / zst（zst 需要 --extra compressed），由 --workers 个线程压缩")
+        print("  --compress-level L  压缩级别（默认 gz 6、zst 3）")
+        print("  --time-window A,B  只切割时间窗口内的记录: 20:00,22:00（每天）或 \"2026-01-27 20:00,2026-01-27 22:00\"")
+        print(f"  --time-field NAME  时间戳字段（毫秒，默认 {DEFAULT_TIME_FIELD}）")
+        print()
+        print("分层抽样（--mode stratified，按 content_type × chat_type × 长度分桶分层）:")
+        print(f"  --per-stratum K  每层固定抽 K 条（默认 {DEFAULT_PER_STRATUM}）")
+        print("  --sample-size N  按各层大小比例分配共 N 条（与 --per-stratum 二选一）")
+        print("  --min-per-stratum M  按比例分配时每层至少 M 条（默认 0）")
+        print("  --seed S         随机种子，用于复现")
+        print()
+        print("去重（--mode dedup，每个数据文件输出一个去重后的文件和 dedup.json 报告）:")
+        print("  --dedup-key KEY  完全重复的判定: body（bodies[0] 相同，默认）/ line（整行相同）")
+        print("  --near           同时去除近似重复（bodies[0] 文本的 MinHash/LSH，相似度约 0.77 以上）")
+        print(f"  --memory-limit MB  指纹集合的内存上限，超过后写入磁盘（默认 {DEFAULT_MEMORY_LIMIT_MB}）")
+        print()
+        print("计量与剖析:")
+        print("  --metrics-json FILE    输出分阶段耗时、吞吐、峰值内存，并写入 JSON 文件")
+        print("  --profile MODE[:FILE]  性能剖析: cprofile 或 sample（采样），可选输出文件")
         print()
         print("示例:")
         print("  uv run main.py ../../sdkTest/tmp --parts 100")
         print("  uv run main.py ../../sdkTest/tmp --parts 50 --output-dir ./my_output")
+        print("  uv run main.py ../../sdkTest/tmp --parts 100 --split-by lines")
+        print("  uv run main.py ../../sdkTest/tmp --parts 100 --compress zst")
+        print("  uv run main.py ../../sdkTest/tmp --parts 24 --split-by time --time-window 20:00,22:00")
+        print("  uv run main.py index ../../sdkTest/tmp")
+        print("  uv run main.py ../../sdkTest/tmp --mode stratified --sample-size 20000 --min-per-stratum 50")
+        print("  uv run main.py ../../sdkTest/tmp --mode dedup --near --output-dir ./dedup")
         sys.exit(0 if args else 1)
 
     input_dir = args[0]
+    mode = "split"
     parts = 100
     output_dir = "./output"
+    split_by = "bytes"
+    workers = DEFAULT_WORKERS
+    strip = False
+    index_dir: Path | None = None
+    manifest = True
+    manifest_stats = False
+    compression: str | None = None
+    level: int | None = None
+    time_window: str | None = None
+    time_field = DEFAULT_TIME_FIELD
+    per_stratum: int | None = None
+    sample_size: int | None = None
+    min_per_stratum = 0
+    seed: int | None = None
+    dedup_key = "body"
+    near = False
+    memory_limit_mb = DEFAULT_MEMORY_LIMIT_MB
+    metrics_json: Path | None = None
+    profiler: Profiler | None = None
 
     i = 1
     while i < len(args):
-        if args[i] == "--parts" and i + 1 < len(args):
+        if args[i] == "--mode" and i + 1 < len(args):
+            mode = args[i + 1]
+            i += 2
+        elif args[i] == "--parts" and i + 1 < len(args):
             parts = int(args[i + 1])
             i += 2
         elif args[i] == "--output-dir" and i + 1 < len(args):
             output_dir = args[i + 1]
             i += 2
+        elif args[i] == "--split-by" and i + 1 < len(args):
+            split_by = args[i + 1]
+            i += 2
+        elif args[i] == "--workers" and i + 1 < len(args):
+            workers = int(args[i + 1])
+            i += 2
+        elif args[i] == "--strip":
+            strip = True
+            i += 1
+        elif args[i] == "--index-dir" and i + 1 < len(args):
+            index_dir = Path(args[i + 1])
+            i += 2
+        elif args[i] == "--no-manifest":
+            manifest = False
+            i += 1
+        elif args[i] == "--manifest-stats":
+            manifest_stats = True
+            i += 1
+        elif args[i] == "--compress" and i + 1 < len(args):
+            compression = args[i + 1]
+            i += 2
+        elif args[i] == "--compress-level" and i + 1 < len(args):
+            level = int(args[i + 1])
+            i += 2
+        elif args[i] == "--time-window" and i + 1 < len(args):
+            time_window = args[i + 1]
+            i += 2
+        elif args[i] == "--time-field" and i + 1 < len(args):
+            time_field = args[i + 1]
+            i += 2
+        elif args[i] == "--per-stratum" and i + 1 < len(args):
+            per_stratum = int(args[i + 1])
+            i += 2
+        elif args[i] == "--sample-size" and i + 1 < len(args):
+            sample_size = int(args[i + 1])
+            i += 2
+        elif args[i] == "--min-per-stratum" and i + 1 < len(args):
+            min_per_stratum = int(args[i + 1])
+            i += 2
+        elif args[i] == "--seed" and i + 1 < len(args):
+            seed = int(args[i + 1])
+            i += 2
+        elif args[i] == "--dedup-key" and i + 1 < len(args):
+            dedup_key = args[i + 1]
+            i += 2
+        elif args[i] == "--near":
+            near = True
+            i += 1
+        elif args[i] == "--memory-limit" and i + 1 < len(args):
+            memory_limit_mb = int(args[i + 1])
+            i += 2
+        elif args[i] == "--metrics-json" and i + 1 < len(args):
+            metrics_json = Path(args[i + 1])
+            i += 2
+        elif args[i] == "--profile" and i + 1 < len(args):
+            try:
+                profiler = Profiler.parse(args[i + 1])
+            except ValueError as e:
+                print(f"❌ {e}")
+                sys.exit(1)
+            i += 2
         else:
             print(f"❌ 未知参数: {args[i]}")
             sys.exit(1)
 
+    if mode not in MODES:
+        print(f"❌ 未知模式: {mode}（支持 {' / '.join(MODES)}）")
+        sys.exit(1)
+    if per_stratum is not None and sample_size is not None:
+        print("❌ --per-stratum 和 --sample-size 不能同时指定")
+        sys.exit(1)
+    if per_stratum is None and sample_size is None:
+        per_stratum = DEFAULT_PER_STRATUM
+    if (per_stratum is not None and per_stratum < 1) or (sample_size is not None and sample_size < 1):
+        print("❌ --per-stratum / --sample-size 必须 >= 1")
+        sys.exit(1)
     if parts < 1:
         print("❌ --parts 必须 >= 1")
         sys.exit(1)
-
-    dir_path = Path(input_dir)
-    if not dir_path.exists():
-        print(f"❌ 路径不存在: {input_dir}")
+    if split_by not in SPLIT_MODES:
+        print(f"❌ --split-by 可选: {', '.join(SPLIT_MODES)}")
         sys.exit(1)
-    if not dir_path.is_dir():
-        print(f"❌ 不是文件夹: {input_dir}")
+    window = None
+    if time_window is not None:
+        try:
+            window = parse_time_window(time_window)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        if split_by == "lines":
+            print("❌ --time-window 只能与 --split-by bytes / time 一起使用")
+            sys.exit(1)
+    if compression is not None and compression not in OUTPUT_COMPRESSIONS:
+        print(f"❌ --compress 可选: {', '.join(OUTPUT_COMPRESSIONS)}")
         sys.exit(1)
-
-    data_files = get_data_files(dir_path)
-    if not data_files:
-        print(f"❌ 文件夹中没有数据文件: {input_dir}")
+    if compression is not None and missing_packages([Path(part_filename(0, parts, compression))]):
+        print("❌ 写出 .zst 需要 zstandard: uv run --extra compressed main.py ...")
+        sys.exit(1)
+    if dedup_key not in DEDUP_KEYS:
+        print(f"❌ --dedup-key 可选: {', '.join(DEDUP_KEYS)}")
+        sys.exit(1)
+    if memory_limit_mb < 1:
+        print("❌ --memory-limit 必须 >= 1")
+        sys.exit(1)
+    if manifest_stats and not manifest:
+        print("❌ --manifest-stats 和 --no-manifest 不能同时指定")
         sys.exit(1)
+    if workers < 0:
+        print("❌ --workers 必须 >= 0")
+        sys.exit(1)
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    data_files = load_input_files(input_dir)
+
+    if mode == "stratified":
+        stratified_main(
+            input_dir, data_files, Path(output_dir), per_stratum, sample_size,
+            min_per_stratum, seed, profiler, metrics_json,
+        )
+        return
+    if mode == "dedup":
+        dedup_main(
+            input_dir, data_files, Path(output_dir), dedup_key, near,
+            memory_limit_mb, workers, profiler, metrics_json,
+        )
+        return
+
+    time_mode = split_by == "time" or window is not None
+    if split_by == "bytes" and not time_mode and any(is_compressed(fp) for fp in data_files):
+        # 压缩文件无法按字节定位，只能整体读取
+        print("⚠️  输入包含压缩文件，无法按字节切割，改用 --split-by lines")
+        split_by = "lines"
+
+    # 按时间切割：时间索引给出各文件、各块的时间范围
+    if time_mode:
+        entries = load_time_entries(data_files, input_dir, time_field, workers)
+        timed = [entry for entry in entries if entry["min"] is not None]
+        if not timed:
+            print(f"❌ 数据中没有时间戳字段 {time_field}")
+            sys.exit(1)
+        data_min = min(entry["min"] for entry in timed)
+        data_max = max(entry["max"] for entry in timed)
+        intervals = window_intervals(window, data_min, data_max)
+        if not intervals:
+            print(f"❌ 时间窗口内没有数据（数据时间范围 {format_time(data_min)} ~ {format_time(data_max)}）")
+            sys.exit(1)
+        timeline = Timeline(intervals)
+        seekable = is_seekable(data_files, entries)
+        if not seekable and split_by == "bytes":
+            print("⚠️  有文件时间乱序或为压缩文件，无法按字节定位时间窗口，改用 --split-by time")
+            split_by = "time"
 
     total_file_size = sum(f.stat().st_size for f in data_files)
     out_path = Path(output_dir)
 
+    # lines 模式：有可用的行偏移索引时直接按记录号定位，不需要先统计行数
+    line_index: LineIndex | None = None
+    if index_dir is None:
+        index_dir = Path(input_dir) / LINE_INDEX_DIRNAME
+    if split_by == "lines" and index_dir.exists():
+        try:
+            line_index = LineIndex.load(data_files, index_dir)
+        except LineIndexError as e:
+            print(f"⚠️  {e}，本次不使用索引")
+
     print("=" * 60)
     print("  ✂️  IM 数据等分切割工具")
     print("=" * 60)
@@ -200,17 +1103,129 @@ def main():
     print(f"📄 数据文件: {len(data_files)} 个")
     print(f"📦 总大小:   {format_bytes(total_file_size)}")
     print(f"🔢 切割份数: {parts}")
+    write_label = "逐行 strip" if strip else f"原样复制，{workers} 个线程"
+    if split_by == "time" and seekable:
+        print(f"📐 切割方式: 按时间等分（时间索引定位，{write_label}）")
+    elif split_by == "time":
+        print("📐 切割方式: 按时间等分（逐条按时间戳分配）")
+    elif split_by == "bytes":
+        print(f"📐 切割方式: 按字节（{write_label}）")
+    elif line_index is not None:
+        print(f"📐 切割方式: 按行数（行偏移索引，{write_label}）")
+    else:
+        print("📐 切割方式: 按行数")
+    if time_mode:
+        print(f"🕒 时间范围: {format_time(data_min)} ~ {format_time(data_max)}（字段 {time_field}）")
+        if window is not None:
+            first, last = intervals[0][0], intervals[-1][1] - 1
+            print(f"🕒 时间窗口: {time_window}（{len(intervals)} 段，{format_time(first)} ~ {format_time(last)}）")
+    if compression is not None:
+        shown_level = OUTPUT_LEVELS[f".{compression}"] if level is None else level
+        print(f"🗜️  压缩输出: part_*.jsonl.{compression}（级别 {shown_level}，{workers} 个线程压缩）")
+    if manifest:
+        shown = "各份行数、校验和与内容统计" if manifest_stats else "各份行数、校验和与来源范围"
+        print(f"🧾 分片清单: {MANIFEST_FILENAME}（{shown}）")
     print(f"📁 输出目录: {out_path.resolve()}\n")
 
-    # 第一遍：统计总行数
-    total_lines = count_total_lines(data_files, total_file_size)
+    metrics = Metrics("sampler", enabled=metrics_json is not None)
+    total_lines: int | None = None
+    part_lines: list[int] | None = None
+    part_bytes: list[int] | None = None
+    stats: list[PartStats] | None = None
+    part_spans: list[list[tuple[int, int]]] | None = None
+    # 旧的清单与新切出的分片不对应，先删除
+    (out_path / MANIFEST_FILENAME).unlink(missing_ok=True)
+    if out_path.exists():
+        remove_other_variants(out_path, parts, compression)
+    with profiler or nullcontext(), compress_pool(compression, workers) as pool:
+        plan = None
+        if time_mode and split_by == "time":
+            part_spans = timeline.split(parts)
+        if time_mode and seekable:
+            with metrics.phase("plan"):
+                if part_spans is not None:
+                    plan = [plan_time_ranges(data_files, entries, spans, time_field) for spans in part_spans]
+                else:
+                    window_ranges = plan_time_ranges(data_files, entries, intervals, time_field)
+                    plan = plan_range_parts(window_ranges, parts)
+            total_file_size = sum(end - start for ranges in plan for _, start, end in ranges)
+            how = "按时间等分" if part_spans is not None else "按字节"
+            print(f"✂️  {how}切割为 {parts} 份（定位到 {format_bytes(total_file_size)}，不读取窗口外的数据）...")
+        elif time_mode:
+            print(f"✂️  按时间等分切割为 {parts} 份...")
+            if manifest:
+                stats = [PartStats(part_filename(k, parts, compression), manifest_stats) for k in range(parts)]
+            part_lines = route_time_parts(
+                data_files, entries, timeline, parts, out_path, time_field, metrics, stats,
+                compression, level, pool, workers,
+            )
+            total_lines = sum(part_lines)
+        elif split_by == "bytes":
+            print(f"✂️  按字节切割为 {parts} 份（每份约 {format_bytes(total_file_size / parts)}）...")
+            plan = plan_byte_parts(data_files, parts)
+        elif line_index is not None:
+            with line_index:
+                total_lines = len(line_index)
+                if total_lines < parts:
+                    print(f"⚠️  总行数 ({total_lines:,}) 少于切割份数 ({parts})，调整为 {total_lines} 份")
+                    parts = total_lines
+                print(f"✂️  按行数切割为 {parts} 份（索引中共 {total_lines:,} 行，跳过行数统计）...")
+                plan, part_lines = plan_record_parts(line_index, parts)
+            if not strip:
+                metrics.add(lines=total_lines)
+        else:
+            # 第一遍：统计总行数
+            total_lines = count_total_lines(data_files, total_file_size, metrics)
+
+            if total_lines < parts:
+                print(f"⚠️  总行数 ({total_lines:,}) 少于切割份数 ({parts})，调整为 {total_lines} 份")
+                parts = total_lines
+
+            # 第二遍：切割
+            if manifest:
+                stats = [PartStats(part_filename(k, parts, compression), manifest_stats) for k in range(parts)]
+            split_files(
+                data_files, total_lines, total_file_size, parts, out_path, metrics, stats,
+                compression, level, pool, workers,
+            )
 
-    if total_lines < parts:
-        print(f"⚠️  总行数 ({total_lines:,}) 少于切割份数 ({parts})，调整为 {total_lines} 份")
-        parts = total_lines
+        if plan is not None and strip:
+            if manifest:
+                stats = [PartStats(part_filename(k, parts, compression), manifest_stats) for k in range(parts)]
+            part_lines = strip_parts(
+                plan, total_file_size, out_path, metrics, stats, compression, level, pool, workers,
+            )
+            total_lines = sum(part_lines)
+        elif plan is not None:
+            if manifest and not manifest_stats:
+                stats = [PartStats(part_filename(k, parts, compression), content=False) for k in range(parts)]
+            part_bytes = copy_parts(plan, total_file_size, out_path, workers, metrics, compression, level, stats)
+            if manifest_stats:
+                stats = scan_parts(plan, out_path, workers, metrics, compression)
 
-    # 第二遍：切割
-    split_files(data_files, total_lines, total_file_size, parts, out_path)
+        if stats is not None:
+            with metrics.phase("manifest"):
+                entries_out = [part.to_dict() for part in stats]
+                if part_spans is not None:
+                    # 按时间等分时记录每份覆盖的时间段（毫秒时间戳，左闭右开）
+                    for entry_out, spans in zip(entries_out, part_spans):
+                        entry_out["time_spans"] = [list(span) for span in spans]
+                time_info = {"time_field": time_field, "time_window": time_window} if time_mode else {}
+                write_manifest(
+                    out_path,
+                    entries_out,
+                    split_by=split_by,
+                    strip=strip,
+                    compression=compression,
+                    content_stats=manifest_stats,
+                    **time_info,
+                    source_dir=str(Path(input_dir).resolve()),
+                )
+            # 原样复制时行数来自清单的统计
+            part_lines = [part.lines for part in stats]
+            total_lines = sum(part_lines)
+            if plan is not None and line_index is None and not strip:
+                metrics.add(lines=total_lines)
 
     # 输出概要
     print()
@@ -218,13 +1233,29 @@ def main():
     print("  📋 切割结果")
     print("=" * 60)
     print(f"\n  输出目录:   {out_path.resolve()}")
-    print(f"  总行数:     {total_lines:,}")
+    if total_lines is not None:
+        # 按字节原样复制且不生成清单时不读取行内容，不统计行数
+        print(f"  总行数:     {total_lines:,}")
     print(f"  切割份数:   {parts}")
-    print(f"  每份约:     {total_lines // parts:,} 行")
+    if part_lines is not None:
+        print(f"  每份行数:   {min(part_lines):,} ~ {max(part_lines):,}")
+    elif total_lines is not None:
+        print(f"  每份约:     {total_lines // parts:,} 行")
+    if part_bytes is not None:
+        print(f"  每份大小:   {format_bytes(min(part_bytes))} ~ {format_bytes(max(part_bytes))}")
+    empty = (part_lines or part_bytes or []).count(0)
+    if empty:
+        print(f"  ⚠️  {empty} 份为空（数据行数少于份数，或单行超过每份大小）")
+    if stats is not None:
+        print(f"  分片清单:   {out_path.resolve() / MANIFEST_FILENAME}")
+    output_files = sorted(out_path.glob("part_*.jsonl" + (f".{compression}" if compression else "")))
+    if compression is not None:
+        output_size = sum(fp.stat().st_size for fp in output_files)
+        ratio = output_size / total_file_size * 100 if total_file_size else 0
+        print(f"  输出大小:   {format_bytes(output_size)}（输入的 {ratio:.1f}%）")
     print()
 
     # 列出生成的文件
-    output_files = sorted(out_path.glob("part_*.jsonl"))
     if len(output_files) <= 10:
         for fp in output_files:
             print(f"  {fp.name:20s} {format_bytes(fp.stat().st_size):>10s}")
@@ -239,6 +1270,7 @@ def main():
     print("=" * 60)
     print("  切割完成 ✅")
     print("=" * 60)
+    metrics.report(metrics_json)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,277 @@
+"""
+分层抽样（--mode stratified）
+
+按 content_type × chat_type × 行长度分桶（与 analyze 相同的 5 档）把记录分成若干层，
+一遍流式读取，每层各自做蓄水池抽样（Algorithm R），稀有类型和超长消息也能按配额抽到：
+
+  - 固定配额（--per-stratum K）：每层最多 K 条，不足 K 条的层全部保留
+  - 按比例分配（--sample-size N）：每层抽 N × 层大小 / 总数 条（最大余数法取整），
+    可用 --min-per-stratum 给每层设下限
+
+蓄水池里只保存记录的位置（文件序号、行首偏移、行长度），每个位置 16 字节，
+内存只与层数和配额有关，与数据总量无关。读完之后按文件顺序读取被选中的记录：
+普通文件按偏移直接读取，压缩文件无法定位，需要重新解压一遍。
+"""
+
+import json
+import os
+import random
+import unicodedata
+from array import array
+from collections.abc import Callable
+from pathlib import Path
+
+from data_common import (
+    Metrics,
+    bucket_label,
+    format_bytes,
+    is_compressed,
+    iter_batches,
+    iter_lines,
+    loads_record,
+    strip_line,
+)
+
+SAMPLE_FILENAME = "sample.jsonl"
+STRATA_FILENAME = "strata.json"
+DEFAULT_PER_STRATUM = 1000
+PARSE_ERROR_LABEL = "(解析失败)"
+
+# (content_type, chat_type, 长度分桶)
+StratumKey = tuple[str, str, str]
+
+
+def stratum_key(line: bytes) -> StratumKey:
+    """一行（已去除首尾空白）所属的层"""
+    bucket = bucket_label(len(line))
+    try:
+        record = loads_record(line)
+        content_type = str(record.get("content_type", "unknown"))
+        chat_type = str(record.get("chat_type", "unknown"))
+    except (ValueError, AttributeError):
+        return PARSE_ERROR_LABEL, "-", bucket
+    return content_type, chat_type, bucket
+
+
+class Reservoir:
+    """一层的蓄水池：容量 capacity，保存被抽中记录的 (文件序号, 偏移, 长度)"""
+
+    __slots__ = ("capacity", "seen", "files", "offsets", "lengths")
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.seen = 0
+        self.files = array("I")
+        self.offsets = array("Q")
+        self.lengths = array("I")
+
+    def offer(self, rng: random.Random, file_idx: int, offset: int, length: int) -> None:
+        self.seen += 1
+        if len(self.offsets) < self.capacity:
+            self.files.append(file_idx)
+            self.offsets.append(offset)
+            self.lengths.append(length)
+            return
+        j = rng.randrange(self.seen)
+        if j < self.capacity:
+            self.files[j] = file_idx
+            self.offsets[j] = offset
+            self.lengths[j] = length
+
+    def take(self, rng: random.Random, count: int) -> list[tuple[int, int, int]]:
+        """从蓄水池中再随机取 count 条（均匀样本的随机子集仍是均匀样本）"""
+        slots = list(zip(self.files, self.offsets, self.lengths))
+        if count >= len(slots):
+            return slots
+        return rng.sample(slots, count)
+
+
+def allocate(
+    populations: dict[StratumKey, int], sample_size: int, min_per_stratum: int
+) -> dict[StratumKey, int]:
+    """按比例分配各层配额（最大余数法），每层至少 min_per_stratum 条且不超过层大小"""
+    total = sum(populations.values())
+    if total == 0:
+        return dict.fromkeys(populations, 0)
+    exact = {key: sample_size * n / total for key, n in populations.items()}
+    quotas = {key: int(q) for key, q in exact.items()}
+    remaining = sample_size - sum(quotas.values())
+    for key in sorted(exact, key=lambda k: exact[k] - quotas[k], reverse=True)[:remaining]:
+        quotas[key] += 1
+    return {key: min(max(q, min_per_stratum), populations[key]) for key, q in quotas.items()}
+
+
+def scan_strata(
+    data_files: list[Path],
+    capacity: int,
+    rng: random.Random,
+    total_file_size: int,
+    metrics: Metrics,
+) -> dict[StratumKey, Reservoir]:
+    """一遍流式读取，把每条记录放进所属层的蓄水池"""
+    strata: dict[StratumKey, Reservoir] = {}
+    bytes_done = 0
+    lines_done = 0
+
+    for file_idx, filepath in enumerate(data_files):
+
+        def on_progress(offset: int) -> None:
+            done = bytes_done + offset
+            pct = done / total_file_size * 100 if total_file_size else 0
+            print(
+                f"\r  ⏳ 进度: {pct:.1f}% | "
+                f"文件 {file_idx + 1}/{len(data_files)} | "
+                f"已处理 {lines_done:,} 行，{len(strata)} 层",
+                end="",
+                flush=True,
+            )
+
+        batches = iter_batches(filepath, progress=on_progress)
+        for offset, lines in metrics.timed("read", batches, body="parse"):
+            for line in lines:
+                stripped = strip_line(line)
+                if stripped:
+                    key = stratum_key(stripped)
+                    reservoir = strata.get(key)
+                    if reservoir is None:
+                        reservoir = strata[key] = Reservoir(capacity)
+                    reservoir.offer(rng, file_idx, offset, len(line))
+                    lines_done += 1
+                offset += len(line) + 1
+        bytes_done += filepath.stat().st_size
+        metrics.add(nbytes=filepath.stat().st_size)
+
+    metrics.add(lines=lines_done)
+    print(f"\r  ✅ 读取完成: {lines_done:,} 行，{len(strata)} 层{' ' * 40}")
+    return strata
+
+
+def write_sample(
+    data_files: list[Path],
+    selected: list[tuple[int, int, int]],
+    out_file: Path,
+    on_file: Callable[[Path], None] | None = None,
+) -> int:
+    """按文件与偏移顺序写出被选中的记录（保持时序），返回写入的字节数"""
+    by_file: dict[int, list[tuple[int, int]]] = {}
+    for file_idx, offset, length in selected:
+        by_file.setdefault(file_idx, []).append((offset, length))
+
+    written = 0
+    with open(out_file, "wb") as out:
+        for file_idx in sorted(by_file):
+            filepath = data_files[file_idx]
+            if on_file is not None:
+                on_file(filepath)
+            records = sorted(by_file[file_idx])
+            if is_compressed(filepath):
+                # 压缩文件无法定位：重新解压一遍，按偏移挑出选中的行
+                wanted = {offset for offset, _ in records}
+                for offset, line in iter_lines(filepath):
+                    if offset in wanted:
+                        data = strip_line(line) + b"\n"
+                        out.write(data)
+                        written += len(data)
+                continue
+            fd = os.open(filepath, os.O_RDONLY)
+            try:
+                for offset, length in records:
+                    data = strip_line(os.pread(fd, length, offset)) + b"\n"
+                    out.write(data)
+                    written += len(data)
+            finally:
+                os.close(fd)
+    return written
+
+
+def run_stratified(
+    data_files: list[Path],
+    total_file_size: int,
+    output_dir: Path,
+    per_stratum: int | None,
+    sample_size: int | None,
+    min_per_stratum: int,
+    seed: int | None,
+    metrics: Metrics,
+) -> None:
+    """分层抽样：写出 sample.jsonl 与各层统计 strata.json"""
+    rng = random.Random(seed)
+    # 按比例分配时事先不知道各层大小，每层的蓄水池按总样本量开
+    capacity = per_stratum if per_stratum is not None else sample_size
+    print("🎯 第一步：流式读取并按层蓄水池抽样...")
+    strata = scan_strata(data_files, capacity, rng, total_file_size, metrics)
+
+    populations = {key: r.seen for key, r in strata.items()}
+    if per_stratum is not None:
+        quotas = {key: min(per_stratum, n) for key, n in populations.items()}
+    else:
+        quotas = allocate(populations, sample_size, min_per_stratum)
+
+    selected = []
+    for key, reservoir in strata.items():
+        selected.extend(reservoir.take(rng, quotas[key]))
+
+    print(f"\n✍️  第二步：写出 {len(selected):,} 条抽样记录...")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    out_file = output_dir / SAMPLE_FILENAME
+
+    def on_file(filepath: Path) -> None:
+        print(f"\r  ⏳ 正在读取: {filepath.name}{' ' * 20}", end="", flush=True)
+
+    with metrics.phase("write"):
+        written = write_sample(data_files, selected, out_file, on_file)
+    print(f"\r  ✅ 已写入: {out_file}（{format_bytes(written)}）{' ' * 20}")
+
+    total = sum(populations.values())
+    summary = {
+        "allocation": "fixed" if per_stratum is not None else "proportional",
+        "per_stratum": per_stratum,
+        "sample_size": sample_size,
+        "min_per_stratum": min_per_stratum if per_stratum is None else None,
+        "seed": seed,
+        "population": total,
+        "sampled": len(selected),
+        "strata": [
+            {
+                "content_type": key[0],
+                "chat_type": key[1],
+                "bucket": key[2],
+                "population": populations[key],
+                "sampled": quotas[key],
+            }
+            for key in sorted(populations, key=populations.get, reverse=True)
+        ],
+    }
+    with open(output_dir / STRATA_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+    print_strata(summary)
+
+
+def _ljust(text: str, width: int) -> str:
+    """按显示宽度左对齐（中文字符占两列）"""
+    shown = sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text)
+    return text + " " * max(0, width - shown)
+
+
+def print_strata(summary: dict) -> None:
+    """打印各层大小与抽样数"""
+    total = summary["population"]
+    strata = summary["strata"]
+    print()
+    print("=" * 60)
+    print("  📋 分层抽样结果")
+    print("=" * 60)
+    print(f"\n  总记录数:   {total:,}")
+    print(f"  抽样记录数: {summary['sampled']:,}")
+    print(f"  层数:       {len(strata)}")
+    print()
+    print(f"  {'content_type':<22} {'chat_type':<10} {_ljust('分桶', 10)} {'总数':>8} {'占比':>5} {'抽样':>5}")
+    print(f"  {'─' * 22} {'─' * 10} {'─' * 10} {'─' * 10} {'─' * 7} {'─' * 7}")
+    for s in strata:
+        pct = s["population"] / total * 100 if total else 0
+        print(
+            f"  {_ljust(s['content_type'], 22)} {_ljust(s['chat_type'], 10)} {s['bucket']:<10} "
+            f"{s['population']:>10,} {pct:>6.1f}% {s['sampled']:>7,}"
+        )
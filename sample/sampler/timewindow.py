@@ -0,0 +1,202 @@
+"""
+按时间抽取（--time-window）与按时间等分（--split-by time）
+
+时间窗口有两种写法（时间按本机时区解释，可用环境变量 TZ 指定，如 TZ=Asia/Shanghai）：
+
+  - 绝对时间段：--time-window "2026-01-27 20:00,2026-01-27 22:00"，两端也可以是毫秒时间戳
+  - 每天的时段：--time-window 20:00,22:00，展开为数据覆盖的每一天的同一时段（结束早于开始时跨过午夜）
+
+窗口与数据的时间范围相交后得到若干个互不重叠的时间段，首尾相接看作一条时间轴，
+--split-by time 把这条时间轴等分为 N 份（每份的时长相等，记录数随流量变化）。
+
+时间范围来自时间索引（data_common.timeindex，第一次使用时建立）：
+  - 文件按时间有序（IM 导出通常如此）时，每个时间点对应一个字节偏移：先用各块的最大时间戳二分找到所在的块，
+    再只读这一块找到第一条不早于该时间的记录，整个窗口不需要扫描，得到的字节范围交给切割的复制 / strip 流程
+  - 有文件乱序或为压缩文件时无法按偏移定位，改为读取时间范围与窗口相交的块，逐条按时间戳分配到各份
+"""
+
+import bisect
+import re
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+from data_common import TIME_BLOCK_SIZE, is_compressed, iter_batches, record_starts, record_time, strip_lines
+
+# (文件, 起始偏移, 结束偏移)
+ByteRange = tuple[Path, int, int]
+# [开始, 结束) 毫秒时间戳
+Interval = tuple[int, int]
+
+_TIME_OF_DAY = re.compile(r"^(\d{1,2}):(\d{2})(?::(\d{2}))?$")
+
+
+def format_time(ms: int) -> str:
+    """毫秒时间戳 -> 本地时间字符串"""
+    return datetime.fromtimestamp(ms / 1000).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _parse_time_point(text: str) -> int:
+    if text.isdigit():
+        return int(text)
+    try:
+        return int(datetime.fromisoformat(text).timestamp() * 1000)
+    except ValueError:
+        raise ValueError(f"无法解析的时间: {text}（示例: 2026-01-27 20:00 或毫秒时间戳）") from None
+
+
+def _parse_time_of_day(text: str) -> int | None:
+    m = _TIME_OF_DAY.match(text)
+    if m is None:
+        return None
+    hours, minutes, seconds = int(m[1]), int(m[2]), int(m[3] or 0)
+    if hours > 24 or minutes > 59 or seconds > 59 or (hours == 24 and (minutes or seconds)):
+        raise ValueError(f"无效的时刻: {text}")
+    return ((hours * 60 + minutes) * 60 + seconds) * 1000
+
+
+def parse_time_window(spec: str) -> tuple[str, int, int]:
+    """解析 --time-window，返回 ("daily", 开始毫秒数, 结束毫秒数)（当天零点起）或 ("absolute", 开始, 结束)"""
+    bounds = [part.strip() for part in spec.split(",")]
+    if len(bounds) != 2 or not all(bounds):
+        raise ValueError(f"--time-window 格式为 开始,结束: {spec}")
+    daily = [_parse_time_of_day(b) for b in bounds]
+    if None not in daily:
+        if daily[0] == daily[1]:
+            raise ValueError(f"时间窗口为空: {spec}")
+        return "daily", daily[0], daily[1]
+    start, end = map(_parse_time_point, bounds)
+    if start >= end:
+        raise ValueError(f"时间窗口的开始须早于结束: {spec}")
+    return "absolute", start, end
+
+
+def window_intervals(window: tuple[str, int, int] | None, data_min: int, data_max: int) -> list[Interval]:
+    """窗口与数据时间范围 [data_min, data_max] 的交集，按时间排序；window 为 None 时为整个范围"""
+    lo, hi = data_min, data_max + 1
+    if window is None:
+        return [(lo, hi)]
+    kind, start, end = window
+    if kind == "absolute":
+        return [(max(start, lo), min(end, hi))] if max(start, lo) < min(end, hi) else []
+
+    intervals = []
+    # 从前一天开始，跨午夜的时段可能从前一天延续过来
+    day = datetime.fromtimestamp(lo / 1000).date() - timedelta(days=1)
+    last_day = datetime.fromtimestamp(data_max / 1000).date()
+    while day <= last_day:
+        midnight = datetime.combine(day, time())
+        s = int((midnight + timedelta(milliseconds=start)).timestamp() * 1000)
+        e = int((midnight + timedelta(milliseconds=end if end > start else end + 86_400_000)).timestamp() * 1000)
+        s, e = max(s, lo), min(e, hi)
+        if s < e:
+            intervals.append((s, e))
+        day += timedelta(days=1)
+    return intervals
+
+
+class Timeline:
+    """若干个互不重叠的时间段首尾相接组成的时间轴"""
+
+    def __init__(self, intervals: list[Interval]) -> None:
+        self.intervals = intervals
+        self._starts = [s for s, _ in intervals]
+        self._ends = [e for _, e in intervals]
+        # 每段开始处在时间轴上的位置
+        self._positions = [0]
+        for s, e in intervals:
+            self._positions.append(self._positions[-1] + e - s)
+        self.duration = self._positions[-1]
+
+    def position(self, ts: int) -> int | None:
+        """时间戳在时间轴上的位置，不在任何时间段内时为 None"""
+        i = bisect.bisect_right(self._starts, ts) - 1
+        if i < 0 or ts >= self._ends[i]:
+            return None
+        return self._positions[i] + ts - self._starts[i]
+
+    def part_of(self, ts: int, parts: int) -> int | None:
+        """等分为 parts 份时时间戳所在的份（从 0 开始）"""
+        pos = self.position(ts)
+        return None if pos is None else pos * parts // self.duration
+
+    def overlaps(self, lo: int, hi: int) -> bool:
+        """[lo, hi]（闭区间，如一个块的最小 / 最大时间戳）是否与某个时间段相交"""
+        i = bisect.bisect_right(self._starts, hi) - 1
+        return i >= 0 and self._ends[i] > lo
+
+    def split(self, parts: int) -> list[list[Interval]]:
+        """把时间轴等分为 parts 份，每份为若干个时间段；第 k 份即 part_of 为 k 的时间戳"""
+        # 第 k 份为时间轴上 [ceil(k × 总时长 / parts), ceil((k + 1) × 总时长 / parts))，与 part_of 的整除一致
+        cuts = [-(-k * self.duration // parts) for k in range(parts + 1)]
+        result: list[list[Interval]] = [[] for _ in range(parts)]
+        for k in range(parts):
+            for (s, e), pos in zip(self.intervals, self._positions):
+                lo = max(cuts[k], pos)
+                hi = min(cuts[k + 1], pos + e - s)
+                if lo < hi:
+                    result[k].append((s + lo - pos, s + hi - pos))
+        return result
+
+
+def find_offset(filepath: Path, entry: dict, ts: int, field: str) -> int:
+    """时间有序的文件中第一条时间戳不早于 ts 的记录的行首偏移，没有时为文件大小
+
+    先按各块的最大时间戳二分找到所在的块，再只读这一块。
+    """
+    if entry["min"] is None or ts > entry["max"]:
+        return entry["size"]
+    if ts <= entry["min"]:
+        return 0
+    blocks = entry["blocks"]
+    i = bisect.bisect_left([b[2] for b in blocks], ts)
+    k = blocks[i][0]
+    start = k * TIME_BLOCK_SIZE
+    for offset, lines in iter_batches(filepath, start, start + TIME_BLOCK_SIZE):
+        for record_start, line in zip(record_starts(offset, lines), strip_lines(lines)):
+            t = record_time(line, field)
+            if t is not None and t >= ts:
+                return record_start
+    raise ValueError(f"时间索引与文件内容不符: {filepath.name}")
+
+
+def is_seekable(data_files: list[Path], entries: list[dict]) -> bool:
+    """所有文件都按时间有序且未压缩时，时间点可以直接换算为字节偏移"""
+    return all(entry["sorted"] and not is_compressed(fp) for fp, entry in zip(data_files, entries))
+
+
+def plan_time_ranges(data_files: list[Path], entries: list[dict], intervals: list[Interval], field: str) -> list[ByteRange]:
+    """时间有序的文件中落在 intervals 内的记录对应的字节范围，按文件和偏移排序，相邻的合并"""
+    ranges = []
+    for fp, entry in zip(data_files, entries):
+        if entry["min"] is None:
+            continue
+        for s, e in intervals:
+            if e <= entry["min"] or s > entry["max"]:
+                continue
+            start = find_offset(fp, entry, s, field)
+            end = find_offset(fp, entry, e, field)
+            if start >= end:
+                continue
+            if ranges and ranges[-1][0] == fp and ranges[-1][2] == start:
+                ranges[-1] = (fp, ranges[-1][1], end)
+            else:
+                ranges.append((fp, start, end))
+    return ranges
+
+
+def candidate_ranges(filepath: Path, entry: dict, timeline: Timeline) -> list[ByteRange]:
+    """乱序或压缩文件中时间范围与时间轴相交的块（相邻的块合并为一段），其余块不读取"""
+    if entry["min"] is None or not timeline.overlaps(entry["min"], entry["max"]):
+        return []
+    if is_compressed(filepath):
+        return [(filepath, 0, entry["size"])]
+    ranges: list[ByteRange] = []
+    for k, lo, hi, _ in entry["blocks"]:
+        if not timeline.overlaps(lo, hi):
+            continue
+        start, end = k * TIME_BLOCK_SIZE, min((k + 1) * TIME_BLOCK_SIZE, entry["size"])
+        if ranges and ranges[-1][2] == start:
+            ranges[-1] = (filepath, ranges[-1][1], end)
+        else:
+            ranges.append((filepath, start, end))
+    return ranges
@@ -0,0 +1,241 @@
+"""
+开环压测：按固定或分级的到达速率发出请求，统计延迟分布、吞吐和错误
+
+    --load 500              固定 500 条/s
+    --load 100,200,500      分级：每级持续 --step-duration 秒，依次提高速率
+
+开环：第 i 条请求的计划发出时间为 级开始时间 + i / 速率，与之前的请求是否已返回无关；
+延迟从计划发出时间算起（而不是实际发出时间），发送端或连接池排队造成的等待也计入延迟，
+不会因为服务端变慢、发送端跟着放慢而低估延迟（coordinated omission）。
+
+延迟记入 HDR 风格的直方图（按 2 的幂分段再细分，相对误差小于 1%），内存与请求数无关。
+"""
+
+import asyncio
+import json
+import math
+import time
+from collections import Counter
+from collections.abc import AsyncIterator
+from datetime import datetime
+from pathlib import Path
+
+from sender import MessageSender
+
+# 报告的延迟分位数
+PERCENTILES = (50, 90, 99, 99.9)
+# 直方图保留的有效位数：每个 2 的幂区间再等分为 2^(SUB_BITS - 1) 格
+SUB_BITS = 8
+# 计划发出时间已过去这么久还没发出时，认为发送端跟不上计划（秒）
+LAG_WARNING = 0.1
+
+
+class LatencyHistogram:
+    """HDR 风格的延迟直方图：以微秒为单位，按 2 的幂分段，每段等分为 128 格
+
+    第 k 段（值在 [2^(k+7), 2^(k+8)) 之间，k ≥ 1）每格宽 2^k 微秒，相对误差不超过 1/128；
+    256 微秒以下精确到 1 微秒。分位数取所在格的上界（不会低估）。
+    """
+
+    def __init__(self) -> None:
+        self.counts: Counter[int] = Counter()
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, seconds: float) -> None:
+        us = max(0, int(seconds * 1_000_000))
+        shift = max(0, us.bit_length() - SUB_BITS)
+        self.counts[(shift << SUB_BITS) | (us >> shift)] += 1
+        if self.count == 0 or us < self.min:
+            self.min = us
+        if us > self.max:
+            self.max = us
+        self.count += 1
+        self.total += us
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        if other.count == 0:
+            return
+        self.min = other.min if self.count == 0 else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.counts.update(other.counts)
+        self.count += other.count
+        self.total += other.total
+
+    @staticmethod
+    def _upper(key: int) -> int:
+        """格的上界（微秒，含）"""
+        shift, sub = key >> SUB_BITS, key & ((1 << SUB_BITS) - 1)
+        return ((sub + 1) << shift) - 1
+
+    def percentile(self, p: float) -> int:
+        """第 p 百分位的延迟（微秒），不超过实际最大值"""
+        if self.count == 0:
+            return 0
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                return min(self._upper(key), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        """各分位数、最小 / 平均 / 最大值（毫秒）及非空的格 [[上界毫秒, 数量], ...]"""
+        summary = {"count": self.count}
+        if self.count:
+            summary["min_ms"] = self.min / 1000
+            summary["mean_ms"] = round(self.total / self.count / 1000, 3)
+            summary.update({f"p{p:g}_ms": self.percentile(p) / 1000 for p in PERCENTILES})
+            summary["max_ms"] = self.max / 1000
+        summary["buckets"] = [[self._upper(key) / 1000, self.counts[key]] for key in sorted(self.counts)]
+        return summary
+
+
+class LoadStep:
+    """一级压测的统计：按计划发出时间归属到级，晚到的响应也计入其所属的级
+
+    完成 / 成功的吞吐按本级响应陆续返回的时长计算（第一条计划时间 + 最小延迟到最后一个响应，不短于本级时长），
+    服务端跟不上、响应拖到本级结束之后时如实偏低。
+    """
+
+    def __init__(self, rate: float, duration: float) -> None:
+        self.rate = rate
+        self.duration = duration
+        self.start = 0.0
+        self.finished = 0.0
+        self.issued = 0
+        self.completed = 0
+        self.statuses: Counter[str] = Counter()
+        # 从计划发出时间算起的延迟
+        self.latency = LatencyHistogram()
+        self.max_lag = 0.0
+
+    def record(self, status: str, latency: float, done: float) -> None:
+        self.finished = max(self.finished, done)
+        self.completed += 1
+        self.statuses[status] += 1
+        self.latency.record(latency)
+
+    @property
+    def errors(self) -> int:
+        return self.completed - self.statuses["200"]
+
+    @property
+    def elapsed(self) -> float:
+        return max(self.duration, self.finished - self.start - self.latency.min / 1_000_000)
+
+    def to_dict(self) -> dict:
+        return {
+            "target_rate": self.rate,
+            "duration_seconds": self.duration,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "issued": self.issued,
+            "completed": self.completed,
+            "issued_rate": round(self.issued / self.duration, 1),
+            "achieved_rate": round(self.completed / self.elapsed, 1),
+            "success_rate": round(self.statuses["200"] / self.elapsed, 1),
+            "errors": self.errors,
+            "statuses": dict(self.statuses.most_common()),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "latency": self.latency.to_dict(),
+        }
+
+
+async def run_schedule(
+    sender: MessageSender, actions: AsyncIterator[str], rates: list[float], step_seconds: float
+) -> list[LoadStep]:
+    """按 rates 逐级开环发出请求，每级 step_seconds 秒，等待全部响应后返回各级统计"""
+    steps = [LoadStep(rate, step_seconds) for rate in rates]
+    tasks: set[asyncio.Task] = set()
+    perf_counter = time.perf_counter
+
+    async def send_one(step: LoadStep, scheduled: float, action: str) -> None:
+        try:
+            result = await sender.send(action)
+            status = str(result["status_code"])
+        except Exception as e:
+            # 异常类型名作为状态：TimeoutError、sender.ConnectionClosedError 以及 httpx / OSError 的公开异常类
+            status = type(e).__name__
+        done = perf_counter()
+        step.record(status, done - scheduled, done)
+
+    step_start = perf_counter()
+    for n, step in enumerate(steps, 1):
+        print(f"▶️  第 {n}/{len(steps)} 级: {step.rate:g} 条/s，持续 {step_seconds:g}s")
+        step.start = step_start
+        total = round(step.rate * step_seconds)
+        i = 0
+        while i < total:
+            # 发出所有计划时间已到的请求，再睡到下一条的计划时间
+            due = min(total, int((perf_counter() - step_start) * step.rate) + 1)
+            while i < due:
+                scheduled = step_start + i / step.rate
+                action = await anext(actions)
+                step.max_lag = max(step.max_lag, perf_counter() - scheduled)
+                task = asyncio.create_task(send_one(step, scheduled, action))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                step.issued += 1
+                i += 1
+            if i < total:
+                await asyncio.sleep(max(0.0, step_start + i / step.rate - perf_counter()))
+        # 下一级紧接着本级的计划结束时间开始，不受本级发出是否滞后影响
+        step_start += step_seconds
+        await asyncio.sleep(max(0.0, step_start - perf_counter()))
+        print(f"   已发出 {step.issued:,} 条，已完成 {step.completed:,} 条，在途 {len(tasks):,} 条")
+    if tasks:
+        print(f"⏳ 等待 {len(tasks):,} 个在途请求完成...")
+        await asyncio.gather(*tasks)
+    return steps
+
+
+def _ms(us: int) -> str:
+    return f"{us / 1000:.1f}ms" if us < 10_000_000 else f"{us / 1_000_000:.1f}s"
+
+
+def print_report(steps: list[LoadStep]) -> None:
+    """打印各级的吞吐、延迟分位数和状态分布"""
+    print("\n" + "=" * 50)
+    print("📊 压测结果（延迟从计划发出时间算起）:")
+    header = f"{'级':>3} {'目标/s':>8} {'发出/s':>9} {'完成/s':>9} {'成功/s':>9}"
+    header += "".join(f" {'p' + format(p, 'g'):>9}" for p in PERCENTILES) + f" {'max':>9} {'错误':>7}"
+    print(header)
+    for n, step in enumerate(steps, 1):
+        line = f"{n:>4} {step.rate:>9g} {step.issued / step.duration:>10,.1f} {step.completed / step.elapsed:>10,.1f}"
+        line += f" {step.statuses['200'] / step.elapsed:>10,.1f}"
+        line += "".join(f" {_ms(step.latency.percentile(p)):>9}" for p in PERCENTILES)
+        line += f" {_ms(step.latency.max):>9} {step.errors:>8,}"
+        print(line)
+    for n, step in enumerate(steps, 1):
+        statuses = ", ".join(f"{status}×{count:,}" for status, count in step.statuses.most_common())
+        print(f"   第 {n} 级状态: {statuses or '-'}")
+        if step.max_lag > LAG_WARNING:
+            print(f"   ⚠️  第 {n} 级发送端最多滞后计划 {step.max_lag * 1000:.1f}ms（CPU 不足），延迟仍从计划时间算起")
+
+
+def write_report(path: Path, steps: list[LoadStep], info: dict) -> None:
+    """写出 JSON 结果：info（地址、连接设置等）、各级统计与合计"""
+    total = LatencyHistogram()
+    for step in steps:
+        total.merge(step.latency)
+    statuses = sum((step.statuses for step in steps), Counter())
+    report = {
+        "tool": "send_message",
+        "mode": "load",
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        **info,
+        "steps": [step.to_dict() for step in steps],
+        "total": {
+            "issued": sum(step.issued for step in steps),
+            "completed": total.count,
+            "statuses": dict(statuses.most_common()),
+            "latency": total.to_dict(),
+        },
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write("\n")
@@ -3,40 +3,99 @@
 send_message - 从 data 文件夹读取 JSON 数据并发送消息的工具
 
 使用方法:
-    uv run main.py
+    uv run main.py [--data PATH] [--metrics-json FILE] [--profile cprofile|sample[:FILE]]
+    uv run main.py --load RATES [--step-duration SEC] [--load-output FILE] [--data PATH]
+
+--load 为开环压测模式：按固定（500）或分级（100,200,500）的速率循环发送 data 中的消息，
+报告各级的延迟分位数、吞吐与错误分布，并写入 JSON 结果文件（见 loadgen.py）。
+
+数据默认来自本目录下的 data 文件夹；data 中有选择清单 selection.json（filter --lazy 写出）时，
+或 --data 指向选择清单时，只按清单流式读取其中列出的分片范围。
 
 配置:
     通过 .env 文件或环境变量配置以下参数:
-    - EM_HOST: API 主机地址 (默认: a1.easemob.com)
+    - EM_HOST: API 主机地址，可带端口 (默认: a1.easemob.com)
+    - EM_SCHEME: https 或 http (默认: https，本地模拟服务端 mock_server.py 使用 http)
     - EM_ORG: 组织名 (默认: easemob)
     - EM_APP: 应用名 (默认: easeim)
     - EM_TOKEN: Bearer Token (必填)
     - EM_TARGET: 消息接收者 (默认: zuoyu2)
     - EM_FROM: 消息发送者 (默认: zuoyu1)
-    - EM_INTERVAL_MS: 发送间隔毫秒数 (默认: 1000)
+    - EM_INTERVAL_MS: 发送间隔毫秒数 (默认: 1000，设置了 EM_RATE 时不使用)
+    - EM_RATE: 每秒发送的消息数，0 表示不限速 (默认: 1000 / EM_INTERVAL_MS)
+    - EM_BURST: 令牌桶容量，即允许瞬时连发的消息数 (默认: 100ms 的发送量，至少 1)
+    - EM_CONCURRENCY: 同时在途的请求数 (默认: 1)
+    - EM_HTTP2: 为 1 时使用 HTTP/2 (默认: 0，需要 uv run --extra http2)
+    - EM_MAX_CONNECTIONS: 连接池最大连接数 (默认: 与 EM_CONCURRENCY 相同)
+    - EM_MAX_KEEPALIVE: 连接池保持的空闲连接数 (默认: 与 EM_MAX_CONNECTIONS 相同)
+    - EM_KEEPALIVE_EXPIRY: 空闲连接保持秒数 (默认: 30)
+    - EM_CONNECT_TIMEOUT: 建立连接超时秒数 (默认: 10)
+    - EM_TIMEOUT: 请求超时秒数 (默认: 30)
 """
 
+import asyncio
+import importlib.util
 import json
+import math
 import os
+import sys
 import time
+from collections import Counter
+from contextlib import nullcontext
 from pathlib import Path
+from urllib.parse import urlsplit
 
-import httpx
+from data_common import (
+    MANIFEST_FILENAME,
+    DecompressError,
+    ManifestError,
+    Metrics,
+    Profiler,
+    SelectionError,
+    find_selection,
+    get_data_files,
+    iter_batches,
+    load_manifest,
+    load_selection,
+    missing_packages,
+    strip_line,
+)
 from dotenv import load_dotenv
 
+from loadgen import print_report, run_schedule, write_report
+from sender import MessageSender, TokenBucket, env_proxy, iter_in_thread, message_url, send_all
+
+# 读取线程每批交给发送端的消息数
+SEND_BATCH = 256
+# 压测模式每级的默认持续时间（秒）
+DEFAULT_STEP_SECONDS = 30
+
 
 def load_config() -> dict:
     """加载配置，优先使用 .env 文件，否则使用默认值"""
     load_dotenv()
     
+    interval_ms = int(os.getenv("EM_INTERVAL_MS", "1000"))
+    rate = float(os.getenv("EM_RATE", str(1000 / interval_ms if interval_ms > 0 else 0)))
+    concurrency = int(os.getenv("EM_CONCURRENCY", "1"))
+    max_connections = int(os.getenv("EM_MAX_CONNECTIONS", str(concurrency)))
     return {
+        "scheme": os.getenv("EM_SCHEME", "https"),
         "host": os.getenv("EM_HOST", "a1.easemob.com"),
         "org": os.getenv("EM_ORG", "easemob"),
         "app": os.getenv("EM_APP", "easeim"),
         "token": os.getenv("EM_TOKEN", ""),
         "target": os.getenv("EM_TARGET", "zuoyu2"),
         "from_user": os.getenv("EM_FROM", "zuoyu1"),
-        "interval_ms": int(os.getenv("EM_INTERVAL_MS", "1000")),
+        "rate": rate,
+        "burst": int(os.environ["EM_BURST"]) if os.getenv("EM_BURST") else None,
+        "concurrency": concurrency,
+        "http2": os.getenv("EM_HTTP2", "0") == "1",
+        "max_connections": max_connections,
+        "max_keepalive": int(os.getenv("EM_MAX_KEEPALIVE", str(max_connections))),
+        "keepalive_expiry": float(os.getenv("EM_KEEPALIVE_EXPIRY", "30")),
+        "connect_timeout": float(os.getenv("EM_CONNECT_TIMEOUT", "10")),
+        "timeout": float(os.getenv("EM_TIMEOUT", "30")),
     }
 
 
@@ -54,101 +113,253 @@ def extract_action(data: dict) -> str | None:
         return None
 
 
-def send_message(config: dict, action: str) -> dict:
-    """发送消息到 Easemob API"""
-    url = f"https://{config['host']}/{config['org']}/{config['app']}/messages"
-    
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {config['token']}",
-    }
-    
-    payload = {
-        "target_type": "users",
-        "target": [config["target"]],
-        "msg": {
-            "type": "cmd",
-            "action": action,
-        },
-        "from": config["from_user"],
-        "appkey": f"{config['org']}#{config['app']}",
-        "sync_device": True,
-    }
-    
-    with httpx.Client(timeout=30.0) as client:
-        response = client.post(url, json=payload, headers=headers)
-        return {
-            "status_code": response.status_code,
-            "response": response.json() if response.status_code == 200 else response.text,
-        }
+def iter_file_lines(file_path: Path, start: int = 0, end: int | None = None):
+    """逐行产出 (行号, 去除首尾空白后的行)，行号从 start 所在的行开始计
+
+    压缩文件损坏时最后产出 (行号, DecompressError)，由调用方提示并跳过剩余部分
+    （在读取线程中运行，不直接打印，提示与其他输出一起按顺序打印）。
+    """
+    line_num = 0
+    try:
+        for _, lines in iter_batches(file_path, start, end):
+            for line in lines:
+                line_num += 1
+                yield line_num, strip_line(line)
+    except DecompressError as e:
+        yield line_num, e
+
+
+def load_record_counts(data_dir: Path, files: list[Path]) -> dict[Path, int] | None:
+    """data 目录是 sampler 切出的分片（带分片清单）时，返回各文件的记录数，不读取文件内容"""
+    if not (data_dir / MANIFEST_FILENAME).exists():
+        return None
+    try:
+        entries = load_manifest(data_dir, files)
+    except ManifestError as e:
+        print(f"⚠️  {e}，本次不使用清单")
+        return None
+    return {fp: entry["lines"] for fp, entry in entries.items()}
 
 
-def process_data_files(data_dir: Path, config: dict) -> None:
-    """流式读取 data 文件夹下的所有文件并发送消息"""
+def load_data_ranges(data_dir: Path) -> tuple[list[tuple[Path, int, int | None]], list[int | None]] | None:
+    """要发送的 (文件, 起始偏移, 结束偏移) 列表及各段记录数（未知时为 None），出错时返回 None
+
+    data_dir 为选择清单或含有 selection.json 的文件夹时按清单读取，否则为文件夹下的所有文件。
+    """
     if not data_dir.exists():
         print(f"❌ Data 目录不存在: {data_dir}")
-        return
-    
-    # 获取所有文件（不包括子文件夹）
-    files = [f for f in data_dir.iterdir() if f.is_file()]
-    
+        return None
+
+    selection_path = find_selection(data_dir)
+    if selection_path is not None:
+        try:
+            ranges, counts = load_selection(selection_path)
+        except SelectionError as e:
+            print(f"❌ {e}")
+            return None
+        if not ranges:
+            print(f"❌ 选择清单中没有分片: {selection_path}")
+            return None
+        print(f"📝 选择清单: {selection_path}（{len(ranges)} 段，直接读取原分片）")
+        return list(ranges), counts
+
+    # 获取所有文件（不包括子文件夹和隐藏文件）
+    files = get_data_files(data_dir)
     if not files:
         print(f"❌ Data 目录为空: {data_dir}")
+        return None
+    record_counts = load_record_counts(data_dir, files)
+    counts = [record_counts[fp] for fp in files] if record_counts is not None else [None] * len(files)
+    return [(fp, 0, None) for fp in files], counts
+
+
+def read_actions(ranges: list, counts: list[int | None], metrics: Metrics, stats: Counter):
+    """（在读取线程中运行）逐行解析并提取 action，按批产出 (行号, action)
+
+    文件标题和无法发送的行的提示以字符串放在批中，由发送端按顺序打印；跳过的行数和读取的字节数记入 stats。
+    """
+    batch = []
+    for (file_path, start, end), count in zip(ranges, counts):
+        size = file_path.stat().st_size
+        stats["bytes"] += (size if end is None else end) - start
+        # 只选了文件中的一段时标出字节范围，行号从该段开始计
+        label = file_path.name if (start, end) in ((0, None), (0, size)) else f"{file_path.name} [{start}, {end})"
+        if count is not None:
+            batch.append(f"\n📄 处理文件: {label}（{count:,} 条记录）")
+        else:
+            batch.append(f"\n📄 处理文件: {label}")
+        
+        # 流式读取文件（压缩文件边解压边读），逐行处理
+        for line_num, line in metrics.timed("read", iter_file_lines(file_path, start, end)):
+            if not line:
+                continue
+            if isinstance(line, DecompressError):
+                batch.append(f"  ❌ {line}，跳过该文件剩余部分")
+                break
+            
+            try:
+                with metrics.phase("parse"):
+                    data = json.loads(line)
+            except ValueError as e:  # JSON 格式错误或非 UTF-8 字节
+                batch.append(f"  ⚠️  行 {line_num}: JSON 解析错误 - {e}")
+                stats["skipped"] += 1
+                continue
+            
+            action = extract_action(data)
+            if not action:
+                batch.append(f"  ⚠️  行 {line_num}: 无法提取 action/msg")
+                stats["skipped"] += 1
+                continue
+            
+            batch.append((line_num, action))
+            if len(batch) >= SEND_BATCH:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def load_send_ranges(data_dir: Path) -> tuple[list, list[int | None], list[Path]] | None:
+    """load_data_ranges 并检查压缩文件所需的依赖，返回 (范围, 各段记录数, 文件列表)，出错时返回 None"""
+    loaded = load_data_ranges(data_dir)
+    if loaded is None:
+        return None
+    ranges, counts = loaded
+    files = list(dict.fromkeys(fp for fp, _, _ in ranges))
+
+    missing = missing_packages(files)
+    if missing:
+        print(f"❌ 读取压缩文件需要 {', '.join(missing)}，请使用: uv run --extra compressed main.py")
+        return None
+    return ranges, counts, files
+
+
+async def process_data_files(data_dir: Path, config: dict, metrics: Metrics) -> None:
+    """流式读取 data 文件夹下的所有文件（或选择清单中列出的范围）并按设定的速率与并发发送消息"""
+    loaded = load_send_ranges(data_dir)
+    if loaded is None:
         return
+    ranges, counts, files = loaded
     
+    rate = config["rate"]
+    limiter = TokenBucket(rate, config["burst"]) if rate > 0 else None
     print(f"📁 找到 {len(files)} 个数据文件")
+    if None not in counts:
+        total_records = sum(counts)
+        if rate > 0:
+            print(f"🧾 共 {total_records:,} 条记录（清单），按发送速率预计至少 {total_records / rate / 60:.1f} 分钟")
+        else:
+            print(f"🧾 共 {total_records:,} 条记录（清单）")
     print(f"🎯 发送目标: {config['target']} (从 {config['from_user']})")
-    print(f"⏱️  发送间隔: {config['interval_ms']}ms")
+    if limiter is not None:
+        print(f"⏱️  发送速率: {rate:g} 条/s（令牌桶容量 {limiter.burst}），并发 {config['concurrency']}")
+    else:
+        print(f"⏱️  发送速率: 不限速，并发 {config['concurrency']}")
     print("-" * 50)
     
-    total_sent = 0
-    total_failed = 0
-    total_skipped = 0
+    stats = Counter()
     
-    for file_path in files:
-        print(f"\n📄 处理文件: {file_path.name}")
-        
-        # 流式读取文件，逐行处理
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if not line:
-                    continue
-                
-                try:
-                    data = json.loads(line)
-                except json.JSONDecodeError as e:
-                    print(f"  ⚠️  行 {line_num}: JSON 解析错误 - {e}")
-                    total_skipped += 1
-                    continue
-                
-                action = extract_action(data)
-                if not action:
-                    print(f"  ⚠️  行 {line_num}: 无法提取 action/msg")
-                    total_skipped += 1
-                    continue
-                
-                # 发送消息
-                try:
-                    result = send_message(config, action)
-                    if result["status_code"] == 200:
-                        print(f"  ✅ 行 {line_num}: 发送成功 - {action[:50]}...")
-                        total_sent += 1
-                    else:
-                        print(f"  ❌ 行 {line_num}: 发送失败 ({result['status_code']}) - {result['response']}")
-                        total_failed += 1
-                except Exception as e:
-                    print(f"  ❌ 行 {line_num}: 请求异常 - {e}")
-                    total_failed += 1
-                
-                # 控制发送频率
-                time.sleep(config["interval_ms"] / 1000.0)
+    def on_result(line_num: int, action: str, result: dict | None, error: Exception | None, latency: float) -> None:
+        stats["latency"] += latency
+        if error is not None:
+            print(f"  ❌ 行 {line_num}: 请求异常 - {str(error) or type(error).__name__}")
+            stats["failed"] += 1
+        elif result["status_code"] == 200:
+            print(f"  ✅ 行 {line_num}: 发送成功 - {action[:50]}...")
+            stats["sent"] += 1
+        else:
+            print(f"  ❌ 行 {line_num}: 发送失败 ({result['status_code']}) - {result['response']}")
+            stats["failed"] += 1
+    
+    async with MessageSender(config) as sender:
+        t0 = time.perf_counter()
+        batches = iter_in_thread(read_actions(ranges, counts, metrics, stats))
+        with metrics.phase("send"):
+            await send_all(batches, sender, config["concurrency"], limiter, on_result)
+        elapsed = time.perf_counter() - t0
     
+    total_sent, total_failed, total_skipped = stats["sent"], stats["failed"], stats["skipped"]
+    requests = total_sent + total_failed
+    achieved = requests / elapsed if elapsed > 0 else 0.0
+    avg_latency = stats["latency"] / requests if requests else 0.0
+    metrics.add(requests + total_skipped, stats["bytes"])
+    metrics.extra.update(
+        sent=total_sent,
+        failed=total_failed,
+        skipped=total_skipped,
+        target_rate=rate,
+        achieved_rate=round(achieved, 1),
+        concurrency=config["concurrency"],
+        avg_latency_ms=round(avg_latency * 1000, 2),
+        http_versions=dict(sender.http_versions),
+    )
     print("\n" + "=" * 50)
     print(f"📊 发送统计:")
     print(f"   ✅ 成功: {total_sent}")
     print(f"   ❌ 失败: {total_failed}")
     print(f"   ⚠️  跳过: {total_skipped}")
+    if requests:
+        print(f"   🚀 实际速率: {achieved:,.1f} 条/s，平均延迟 {avg_latency * 1000:.1f}ms")
+        # 在途请求数 ≈ 速率 × 延迟，并发窗口装不下时达不到目标速率
+        if rate > 0 and elapsed >= 1 and achieved < rate * 0.9:
+            needed = math.ceil(rate * avg_latency)
+            if needed > config["concurrency"]:
+                print(f"   💡 未达到目标速率，受并发窗口限制，EM_CONCURRENCY 至少需要约 {needed}")
+
+
+async def cycle_actions(ranges: list, counts: list[int | None], metrics: Metrics):
+    """循环产出数据中可发送的 action（读完从头再来），压测时消息内容与真实数据一致"""
+    while True:
+        found = False
+        async for batch in iter_in_thread(read_actions(ranges, counts, metrics, Counter())):
+            for item in batch:
+                if not isinstance(item, str):  # 文件标题和跳过提示在压测时不打印
+                    found = True
+                    yield item[1]
+        if not found:
+            raise ValueError("数据中没有可发送的消息（无法提取 action/msg）")
+
+
+async def run_load_test(
+    data_dir: Path, config: dict, rates: list[float], step_seconds: float, output: Path, metrics: Metrics
+) -> None:
+    """开环压测：按 rates 逐级发送，打印并写出延迟分布、吞吐与错误统计"""
+    loaded = load_send_ranges(data_dir)
+    if loaded is None:
+        return
+    ranges, counts, files = loaded
+    
+    print(f"📁 找到 {len(files)} 个数据文件，循环发送其中的消息")
+    print(f"🎯 发送目标: {config['target']} (从 {config['from_user']})")
+    print(f"📈 开环压测: {' → '.join(f'{rate:g}' for rate in rates)} 条/s，每级 {step_seconds:g}s")
+    print("-" * 50)
+    
+    actions = cycle_actions(ranges, counts, metrics)
+    try:
+        async with MessageSender(config) as sender:
+            with metrics.phase("send"):
+                steps = await run_schedule(sender, actions, rates, step_seconds)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    finally:
+        await actions.aclose()
+    
+    print_report(steps)
+    info = {
+        "url": message_url(config),
+        "http_versions": dict(sender.http_versions),
+        "max_connections": config["max_connections"],
+        "timeout_seconds": config["timeout"],
+        "rates": rates,
+        "step_seconds": step_seconds,
+    }
+    write_report(output, steps, info)
+    print(f"📝 压测结果已写入: {output}")
+    
+    issued = sum(step.issued for step in steps)
+    metrics.add(issued)
+    metrics.extra.update(load_steps=len(steps), issued=issued)
 
 
 def main():
@@ -157,6 +368,58 @@ def main():
     print("🚀 send_message - Easemob 消息发送工具")
     print("=" * 50)
     
+    # 计量与剖析参数（其余配置见 .env）
+    args = sys.argv[1:]
+    # 数据目录（或选择清单），默认为本目录下的 data
+    data_dir = Path(__file__).parent / "data"
+    metrics_json = None
+    profiler = None
+    # 压测模式：各级速率、每级持续时间与结果文件
+    load_rates = None
+    step_seconds = DEFAULT_STEP_SECONDS
+    load_output = None
+    i = 0
+    while i < len(args):
+        if args[i] == "--data" and i + 1 < len(args):
+            data_dir = Path(args[i + 1])
+            i += 2
+        elif args[i] == "--load" and i + 1 < len(args):
+            try:
+                load_rates = [float(rate) for rate in args[i + 1].split(",")]
+            except ValueError:
+                load_rates = []
+            if not load_rates or min(load_rates) <= 0:
+                print(f"❌ --load 应为正数或以逗号分隔的多个正数: {args[i + 1]}")
+                return
+            i += 2
+        elif args[i] == "--step-duration" and i + 1 < len(args):
+            try:
+                step_seconds = float(args[i + 1])
+            except ValueError:
+                step_seconds = 0
+            if step_seconds <= 0:
+                print("❌ --step-duration 必须大于 0")
+                return
+            i += 2
+        elif args[i] == "--load-output" and i + 1 < len(args):
+            load_output = Path(args[i + 1])
+            i += 2
+        elif args[i] == "--metrics-json" and i + 1 < len(args):
+            metrics_json = Path(args[i + 1])
+            i += 2
+        elif args[i] == "--profile" and i + 1 < len(args):
+            try:
+                profiler = Profiler.parse(args[i + 1])
+            except ValueError as e:
+                print(f"❌ {e}")
+                return
+            i += 2
+        else:
+            print(f"❌ 未知参数: {args[i]}")
+            print("   用法: uv run main.py [--data PATH] [--metrics-json FILE] [--profile cprofile|sample[:FILE]]")
+            print("         uv run main.py --load RATES [--step-duration SEC] [--load-output FILE] [--data PATH]")
+            return
+    
     config = load_config()
     
     # 检查 token 是否配置
@@ -165,13 +428,38 @@ def main():
         print("   示例: EM_TOKEN=your_bearer_token_here")
         return
     
-    print(f"🌐 API 地址: https://{config['host']}/{config['org']}/{config['app']}/messages")
+    if config["concurrency"] < 1 or config["rate"] < 0:
+        print("❌ 错误: EM_CONCURRENCY 至少为 1，EM_RATE 不能为负数")
+        return
+
+    if config["scheme"] not in ("http", "https"):
+        print(f"❌ 错误: EM_SCHEME 应为 https 或 http: {config['scheme']}")
+        return
+
+    if config["http2"] and importlib.util.find_spec("h2") is None:
+        print("❌ EM_HTTP2=1 需要 h2，请使用: uv run --extra http2 main.py")
+        return
     
-    # 获取 data 目录路径
-    script_dir = Path(__file__).parent
-    data_dir = script_dir / "data"
+    print(f"🌐 API 地址: {message_url(config)}")
+    proxy = env_proxy(message_url(config))
+    if proxy is not None:
+        # 只显示代理地址，不打印其中可能带的用户名密码
+        proxy_parts = urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+        print(f"🛰️  代理: {proxy_parts.scheme}://{proxy_parts.netloc.rsplit('@', 1)[-1]}（经代理时使用 httpx 连接池）")
+    print(
+        f"🔌 连接池: {'HTTP/2' if config['http2'] else 'HTTP/1.1'}，最多 {config['max_connections']} 个连接，"
+        f"空闲连接保持 {config['keepalive_expiry']:g}s，超时 {config['timeout']:g}s（连接 {config['connect_timeout']:g}s）"
+    )
     
-    process_data_files(data_dir, config)
+    metrics = Metrics("send_message", enabled=metrics_json is not None)
+    with profiler or nullcontext():
+        if load_rates is not None:
+            if load_output is None:
+                load_output = Path(f"loadtest_{time.strftime('%Y%m%d_%H%M%S')}.json")
+            asyncio.run(run_load_test(data_dir, config, load_rates, step_seconds, load_output, metrics))
+        else:
+            asyncio.run(process_data_files(data_dir, config, metrics))
+    metrics.report(metrics_json)
     
     print("\n✨ 完成!")
 
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+mock_server - 本地模拟的 Easemob 发送消息 REST 接口，用于离线测试和压测 send_message
+
+使用方法:
+    uv run mock_server.py [--port N] [--token T] [--latency SPEC] [--error-rate R]
+                          [--throttle-rate R] [--rate-limit N] [--retry-after SEC] [--drop-rate R]
+                          [--log FILE] [--stats-interval SEC] [--workers N]
+
+    EM_SCHEME=http EM_HOST=127.0.0.1:8080 EM_TOKEN=test uv run main.py
+
+实现 POST /{org}/{app}/messages 的约定：校验 Authorization: Bearer <token>、target_type / target / from / msg，
+返回与 Easemob 相同结构的 JSON。可以模拟延迟分布、服务端错误、429 限流（带 Retry-After）和连接中断，
+并把收到的每条消息写入 JSONL 日志供核对。
+
+只实现 HTTP/1.1（keep-alive、pipelining），不支持 TLS 和 HTTP/2。直接在 asyncio.Protocol 上解析请求，
+单进程每秒可处理上万个请求；--workers 启动多个进程共用同一端口（SO_REUSEPORT，Linux / macOS），
+--rate-limit 为所有进程合计的速率，平均分给各进程（连接由内核分配到各进程，分配不均时合计速率只是近似）。
+
+延迟分布 SPEC（毫秒）:
+    20                  固定 20ms（默认 0）
+    uniform:10:50       10 ~ 50ms 均匀分布
+    exp:20              均值 20ms 的指数分布
+    normal:20:5         均值 20ms、标准差 5ms 的正态分布（小于 0 时取 0）
+    lognormal:20:0.5    中位数 20ms、sigma 0.5 的对数正态分布（长尾）
+"""
+
+import asyncio
+import itertools
+import json
+import multiprocessing
+import random
+import socket
+import sys
+import time
+from collections import Counter, deque
+from collections.abc import Callable
+from pathlib import Path
+
+DEFAULT_PORT = 8080
+DEFAULT_STATS_INTERVAL = 5.0
+# 请求头最大字节数，超过时返回 431 并关闭连接
+MAX_HEADER_BYTES = 64 * 1024
+# 单条消息最多的接收者数（与 Easemob 限制一致）
+MAX_TARGETS = 600
+TARGET_TYPES = ("users", "chatgroups", "chatrooms")
+MSG_TYPES = ("txt", "img", "loc", "audio", "video", "file", "cmd", "custom")
+# 日志缓冲的条数，写满或每个统计周期写出一次
+LOG_BUFFER = 4096
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    429: "Too Many Requests",
+    431: "Request Header Fields Too Large",
+    503: "Service Unavailable",
+}
+
+_encode_json = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+# 状态码和响应头相同的响应共用一份拼好的响应头（只差 Content-Length）
+_RESPONSE_HEADS: dict[tuple, bytes] = {}
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """把延迟分布 SPEC 解析为每次调用返回一个延迟（秒）的函数，格式错误时抛出 ValueError"""
+    kind, _, rest = spec.partition(":")
+    try:
+        args = [float(x) for x in rest.split(":")] if rest else [float(kind)]
+    except ValueError:
+        raise ValueError(f"无法识别的延迟分布: {spec}") from None
+    if any(x < 0 for x in args):
+        raise ValueError(f"延迟分布的参数不能为负数: {spec}")
+    if not rest:
+        fixed = args[0] / 1000
+        return lambda: fixed
+    if kind == "uniform" and len(args) == 2:
+        low, high = args[0] / 1000, args[1] / 1000
+        return lambda: random.uniform(low, high)
+    if kind == "exp" and len(args) == 1:
+        mean = args[0] / 1000
+        return lambda: random.expovariate(1 / mean) if mean > 0 else 0.0
+    if kind == "normal" and len(args) == 2:
+        mean, stddev = args[0] / 1000, args[1] / 1000
+        return lambda: max(0.0, random.gauss(mean, stddev))
+    if kind == "lognormal" and len(args) == 2:
+        median, sigma = args[0] / 1000, args[1]
+        return lambda: median * random.lognormvariate(0, sigma)
+    raise ValueError(f"无法识别的延迟分布: {spec}")
+
+
+class RateLimiter:
+    """服务端限流：令牌桶，每秒 rate 个令牌，最多积攒 1 秒的量（至少 1 个）"""
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self._capacity = max(1.0, rate)
+        self._tokens = self._capacity
+        self._last = time.monotonic()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+
+def _error_body(error: str, description: str) -> dict:
+    return {
+        "error": error,
+        "exception": "com.easemob.mock.MockServerException",
+        "timestamp": int(time.time() * 1000),
+        "duration": 0,
+        "error_description": description,
+    }
+
+
+def validate_message(payload) -> str | None:
+    """校验发送消息的请求体，返回错误说明，合法时返回 None"""
+    if not isinstance(payload, dict):
+        return "request body must be a JSON object"
+    if payload.get("target_type") not in TARGET_TYPES:
+        return f"target_type must be one of {', '.join(TARGET_TYPES)}"
+    target = payload.get("target")
+    if not isinstance(target, list) or not target:
+        return "target must be a non-empty array"
+    if len(target) > MAX_TARGETS:
+        return f"target can not exceed {MAX_TARGETS}"
+    if not all(isinstance(t, str) and t for t in target):
+        return "target must be an array of non-empty strings"
+    sender = payload.get("from", "admin")
+    if not isinstance(sender, str) or not sender:
+        return "from must be a non-empty string"
+    msg = payload.get("msg")
+    if not isinstance(msg, dict) or msg.get("type") not in MSG_TYPES:
+        return f"msg.type must be one of {', '.join(MSG_TYPES)}"
+    if msg["type"] == "cmd" and not isinstance(msg.get("action"), str):
+        return "cmd message requires msg.action"
+    if msg["type"] == "txt" and not isinstance(msg.get("msg"), str):
+        return "txt message requires msg.msg"
+    return None
+
+
+class MockServer:
+    """一个进程内的模拟服务端：请求处理规则、统计与请求日志"""
+
+    def __init__(self, options: dict, worker: int = 0) -> None:
+        self.token = options["token"].encode() if options["token"] is not None else None
+        self.latency = parse_latency(options["latency"])
+        self.error_rate = options["error_rate"]
+        self.throttle_rate = options["throttle_rate"]
+        # --rate-limit 是所有进程合计的速率，各进程的限流器各占一份（连接按 SO_REUSEPORT 分到各进程，合计近似）
+        rate_limit = options["rate_limit"] / options["workers"]
+        self.limiter = RateLimiter(rate_limit) if rate_limit > 0 else None
+        self.retry_after = options["retry_after"]
+        self.drop_rate = options["drop_rate"]
+        self.worker = worker
+        self.statuses: Counter[str] = Counter()
+        self.total = 0
+        self._msg_ids = itertools.count(1)
+        self._log_file = None
+        self._log_buffer: list[str] = []
+        if options["log"] is not None:
+            log_path = options["log"]
+            if options["workers"] > 1:
+                log_path = log_path.with_name(f"{log_path.stem}.{worker}{log_path.suffix}")
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            self._log_file = open(log_path, "a", encoding="utf-8")
+
+    def handle(self, method: bytes, path: bytes, headers: dict[bytes, bytes], body: bytes) -> tuple[int, dict, dict] | None:
+        """处理一个请求，返回 (状态码, 响应体, 额外的响应头)；模拟连接中断时返回 None"""
+        if self.drop_rate and random.random() < self.drop_rate:
+            self.count("dropped")
+            return None
+        parts = path.split(b"?", 1)[0].strip(b"/").split(b"/")
+        if len(parts) != 3 or parts[2] != b"messages":
+            return self._reply(404, _error_body("not_found", "Service resource not found"))
+        if method != b"POST":
+            return self._reply(405, _error_body("method_not_allowed", f"{method.decode('latin-1')} is not supported"))
+        authorization = headers.get(b"authorization", b"")
+        scheme, _, token = authorization.partition(b" ")
+        if scheme.lower() != b"bearer" or not token or (self.token is not None and token != self.token):
+            return self._reply(401, _error_body("unauthorized", "Unable to authenticate (OAuth)"))
+        if (self.limiter is not None and not self.limiter.allow()) or (
+            self.throttle_rate and random.random() < self.throttle_rate
+        ):
+            body_429 = _error_body("resource_limited", "You have exceeded the limit of the Easemob REST API")
+            return self._reply(429, body_429, {"Retry-After": str(self.retry_after)})
+        if self.error_rate and random.random() < self.error_rate:
+            return self._reply(503, _error_body("service_unavailable", "Service is unavailable, please retry"))
+        try:
+            payload = json.loads(body)
+        except ValueError as e:
+            return self._reply(400, _error_body("json_parse", f"Unexpected character: {e}"))
+        problem = validate_message(payload)
+        if problem is not None:
+            return self._reply(400, _error_body("illegal_argument", problem))
+
+        # 路径不一定是合法的 UTF-8，无法解码的字节替换为 U+FFFD
+        org, app = parts[0].decode("utf-8", "replace"), parts[1].decode("utf-8", "replace")
+        msg_id = f"{self.worker}{next(self._msg_ids):015d}"
+        if self._log_file is not None:
+            record = {
+                "ts": round(time.time(), 6),
+                "org": org,
+                "app": app,
+                "from": payload.get("from", "admin"),
+                "target_type": payload["target_type"],
+                "target": payload["target"],
+                "msg": payload["msg"],
+                "msg_id": msg_id,
+            }
+            self._log_buffer.append(json.dumps(record, ensure_ascii=False))
+            if len(self._log_buffer) >= LOG_BUFFER:
+                self.flush_log()
+        response = {
+            "path": "/messages",
+            "uri": f"http://localhost/{org}/{app}/messages",
+            "timestamp": int(time.time() * 1000),
+            "organization": org,
+            "application": "00000000-0000-0000-0000-000000000000",
+            "action": "post",
+            "data": {target: msg_id for target in payload["target"]},
+            "duration": 0,
+            "applicationName": app,
+        }
+        return self._reply(200, response)
+
+    def _reply(self, status: int, body: dict, headers: dict | None = None) -> tuple[int, dict, dict]:
+        self.count(str(status))
+        return status, body, headers or {}
+
+    def count(self, status: str) -> None:
+        """计入一个请求的结果（状态码或 dropped）"""
+        self.total += 1
+        self.statuses[status] += 1
+
+    def flush_log(self) -> None:
+        if self._log_file is not None and self._log_buffer:
+            self._log_file.write("\n".join(self._log_buffer) + "\n")
+            self._log_file.flush()
+            self._log_buffer.clear()
+
+    def close(self) -> None:
+        self.flush_log()
+        if self._log_file is not None:
+            self._log_file.close()
+
+
+def encode_response(status: int, body: dict, headers: dict, keep_alive: bool) -> bytes:
+    """拼出完整的 HTTP/1.1 响应（JSON 响应体）"""
+    content = _encode_json(body).encode("utf-8")
+    key = (status, tuple(headers.items()), keep_alive)
+    head = _RESPONSE_HEADS.get(key)
+    if head is None:
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", "Content-Type: application/json;charset=UTF-8"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        if not keep_alive:
+            lines.append("Connection: close")
+        head = _RESPONSE_HEADS[key] = ("\r\n".join(lines) + "\r\nContent-Length: ").encode("latin-1")
+    return head + str(len(content)).encode() + b"\r\n\r\n" + content
+
+
+class MockProtocol(asyncio.Protocol):
+    """一个客户端连接：解析 HTTP/1.1 请求（支持 pipelining），按请求顺序在模拟延迟之后写回响应"""
+
+    def __init__(self, server: MockServer) -> None:
+        self.server = server
+        self.loop = asyncio.get_running_loop()
+        self.transport: asyncio.Transport | None = None
+        self.buffer = bytearray()
+        # 待写出的响应 (计划写出时间, 响应或 None 表示断开, 是否保持连接)：同一连接上的响应不能乱序，
+        # 计划时间不早于前一个，由一个定时器按顺序写出（asyncio 对同一时刻的多个定时器不保证先后）
+        self.pending: deque[tuple[float, bytes | None, bool]] = deque()
+        self.timer: asyncio.TimerHandle | None = None
+        self.closing = False
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def connection_lost(self, exc) -> None:
+        self.transport = None
+        if self.timer is not None:
+            self.timer.cancel()
+
+    def data_received(self, data: bytes) -> None:
+        buffer = self.buffer
+        buffer += data
+        while not self.closing:
+            end = buffer.find(b"\r\n\r\n")
+            if end < 0:
+                if len(buffer) > MAX_HEADER_BYTES:
+                    self._reject(431, _error_body("header_too_large", "Request header is too large"))
+                return
+            request_line, *header_lines = bytes(buffer[:end]).split(b"\r\n")
+            headers = {}
+            for line in header_lines:
+                name, _, value = line.partition(b":")
+                headers[name.strip().lower()] = value.strip()
+            try:
+                method, path, version = request_line.split(b" ", 2)
+            except ValueError:
+                self._reject(400, _error_body("bad_request", "Malformed request line"))
+                return
+            if b"content-length" not in headers:
+                if headers.get(b"transfer-encoding"):
+                    self._reject(411, _error_body("length_required", "Content-Length is required"))
+                    return
+                length = 0
+            elif headers[b"content-length"].isdigit():
+                length = int(headers[b"content-length"])
+            else:
+                self._reject(400, _error_body("bad_request", "Invalid Content-Length"))
+                return
+            total = end + 4 + length
+            if len(buffer) < total:
+                return
+            body = bytes(buffer[end + 4 : total])
+            del buffer[:total]
+            keep_alive = version == b"HTTP/1.1" and headers.get(b"connection", b"").lower() != b"close"
+            self._handle(method, path, headers, body, keep_alive)
+
+    def _handle(self, method: bytes, path: bytes, headers: dict, body: bytes, keep_alive: bool) -> None:
+        result = self.server.handle(method, path, headers, body)
+        if result is None:
+            # 模拟连接中断：到响应时间时直接断开（RST），不写回任何内容
+            data, keep_alive = None, False
+        else:
+            data = encode_response(*result, keep_alive)
+        if not keep_alive:
+            self.closing = True
+        now = self.loop.time()
+        reply_at = now + self.server.latency()
+        if self.pending:
+            reply_at = max(reply_at, self.pending[-1][0])
+        elif reply_at <= now:
+            self._write(data, keep_alive)
+            return
+        self.pending.append((reply_at, data, keep_alive))
+        if self.timer is None:
+            self.timer = self.loop.call_at(reply_at, self._flush)
+
+    def _flush(self) -> None:
+        """写出所有已到计划时间的响应，再为下一个响应设定时器"""
+        self.timer = None
+        now = self.loop.time()
+        while self.pending and self.pending[0][0] <= now:
+            _, data, keep_alive = self.pending.popleft()
+            self._write(data, keep_alive)
+        if self.pending:
+            self.timer = self.loop.call_at(self.pending[0][0], self._flush)
+
+    def _write(self, data: bytes | None, keep_alive: bool) -> None:
+        if self.transport is None:
+            return
+        if data is None:
+            self.transport.abort()
+            return
+        self.transport.write(data)
+        if not keep_alive:
+            self.transport.close()
+
+    def _reject(self, status: int, body: dict) -> None:
+        """请求无法解析时不模拟延迟，排在已有的响应之后写回错误并关闭连接"""
+        self.server.count(str(status))
+        self.closing = True
+        data = encode_response(status, body, {}, keep_alive=False)
+        if self.pending:
+            self.pending.append((self.pending[-1][0], data, False))
+        else:
+            self._write(data, keep_alive=False)
+
+
+async def serve(options: dict, worker: int) -> None:
+    """在一个进程中运行服务端，每隔 stats_interval 秒打印一次本进程的请求统计"""
+    server = MockServer(options, worker)
+    loop = asyncio.get_running_loop()
+    listener = await loop.create_server(
+        lambda: MockProtocol(server),
+        options["host"],
+        options["port"],
+        reuse_port=options["workers"] > 1,
+        backlog=4096,
+    )
+    prefix = f"[{worker}] " if options["workers"] > 1 else ""
+    interval = options["stats_interval"]
+    try:
+        async with listener:
+            await listener.start_serving()
+            last_total, last_time = 0, time.perf_counter()
+            while True:
+                await asyncio.sleep(interval if interval > 0 else 3600)
+                server.flush_log()
+                if interval <= 0 or server.total == last_total:
+                    continue
+                now = time.perf_counter()
+                rps = (server.total - last_total) / (now - last_time)
+                statuses = ", ".join(f"{status}×{count:,}" for status, count in server.statuses.most_common())
+                print(f"{prefix}📊 {rps:,.0f} 请求/s，累计 {server.total:,}（{statuses}）", flush=True)
+                last_total, last_time = server.total, now
+    finally:
+        server.close()
+
+
+def run_worker(options: dict, worker: int) -> None:
+    try:
+        asyncio.run(serve(options, worker))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    """主函数"""
+    args = sys.argv[1:]
+    if args and args[0] in ("-h", "--help"):
+        print(__doc__.strip())
+        sys.exit(0)
+    options = {
+        "host": "127.0.0.1",
+        "port": DEFAULT_PORT,
+        "token": None,
+        "latency": "0",
+        "error_rate": 0.0,
+        "throttle_rate": 0.0,
+        "rate_limit": 0.0,
+        "retry_after": 1,
+        "drop_rate": 0.0,
+        "log": None,
+        "stats_interval": DEFAULT_STATS_INTERVAL,
+        "workers": 1,
+    }
+    # 参数名 -> (选项名, 类型)
+    flags = {
+        "--host": ("host", str),
+        "--port": ("port", int),
+        "--token": ("token", str),
+        "--latency": ("latency", str),
+        "--error-rate": ("error_rate", float),
+        "--throttle-rate": ("throttle_rate", float),
+        "--rate-limit": ("rate_limit", float),
+        "--retry-after": ("retry_after", int),
+        "--drop-rate": ("drop_rate", float),
+        "--log": ("log", Path),
+        "--stats-interval": ("stats_interval", float),
+        "--workers": ("workers", int),
+    }
+    i = 0
+    while i < len(args):
+        if args[i] in flags and i + 1 < len(args):
+            name, kind = flags[args[i]]
+            try:
+                options[name] = kind(args[i + 1])
+            except ValueError:
+                print(f"❌ {args[i]} 的值无效: {args[i + 1]}")
+                sys.exit(1)
+            i += 2
+        else:
+            print(f"❌ 未知参数: {args[i]}")
+            print("   用法: uv run mock_server.py [--port N] [--token T] [--latency SPEC] [--error-rate R] ...（-h 查看全部参数）")
+            sys.exit(1)
+
+    try:
+        parse_latency(options["latency"])
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    for name in ("error_rate", "throttle_rate", "drop_rate"):
+        if not 0 <= options[name] <= 1:
+            print(f"❌ --{name.replace('_', '-')} 应在 0 ~ 1 之间")
+            sys.exit(1)
+    if options["workers"] < 1:
+        print("❌ --workers 至少为 1")
+        sys.exit(1)
+
+    print("=" * 50)
+    print("🧪 mock_server - 模拟 Easemob 发送消息接口")
+    print("=" * 50)
+    print(f"🌐 地址: http://{options['host']}:{options['port']}/{{org}}/{{app}}/messages")
+    print(f"🔑 Token: {options['token'] if options['token'] is not None else '（任意非空）'}")
+    print(f"⏱️  延迟: {options['latency']}ms")
+    print(
+        f"💥 错误率 {options['error_rate']:g}，随机限流 {options['throttle_rate']:g}，"
+        f"断开连接 {options['drop_rate']:g}，限速 {options['rate_limit']:g} 请求/s"
+        f"（所有进程合计，0 为不限，429 时 Retry-After: {options['retry_after']}）"
+    )
+    if options["log"] is not None:
+        print(f"📝 请求日志: {options['log']}")
+    print(f"🧵 进程数: {options['workers']}（Ctrl+C 停止）")
+    print("-" * 50)
+
+    if options["workers"] == 1:
+        run_worker(options, 0)
+        return
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(options, worker), daemon=True)
+        for worker in range(options["workers"])
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
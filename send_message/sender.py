@@ -0,0 +1,366 @@
+"""
+异步发送引擎：连接池复用的 HTTP 客户端、令牌桶限速与并发窗口
+
+    读取线程 ──批──▶ iter_in_thread ──▶ send_all ──(并发窗口 + 令牌桶)──▶ MessageSender
+
+读取、解析在后台线程中进行，通过有界队列按批交给事件循环，始终提前准备好待发送的消息；
+send_all 每发出一条先占用并发窗口中的一个位置、再从令牌桶取一个令牌，
+因此发送速率由令牌桶决定，与单条请求的耗时无关（只要并发窗口足够容纳 速率 × 延迟 条在途请求）。
+
+HTTP/1.1 使用本模块中基于 asyncio streams 的精简连接池（KeepAlivePool）：httpx 的异步连接池
+每个请求的 CPU 开销约为其 20 倍，且连接数越多越慢，单核只能发出几百条/s；HTTP/2 仍使用 httpx，
+所有请求复用同一个连接多路传输。KeepAlivePool 不支持代理，环境变量中配置了代理（HTTPS_PROXY 等，
+且目标不在 NO_PROXY 中）时也改用 httpx，由它处理代理。
+"""
+
+import asyncio
+import json
+import ssl
+import threading
+import time
+import urllib.request
+from collections import Counter, deque
+from collections.abc import AsyncIterator, Callable, Iterable
+from urllib.parse import urlsplit
+
+import certifi
+import httpx
+
+# 读取线程最多提前准备好的批数
+QUEUE_BATCHES = 8
+# 令牌桶默认容量对应的时长（秒）：事件循环偶尔被读取线程占用几毫秒（GIL），积攒 100ms 的令牌，停顿后补发，平均速率不受影响
+BURST_SECONDS = 0.1
+
+
+def message_url(config: dict) -> str:
+    """Easemob 发送消息 API 的地址"""
+    return f"{config['scheme']}://{config['host']}/{config['org']}/{config['app']}/messages"
+
+
+def env_proxy(url: str) -> str | None:
+    """环境变量（HTTPS_PROXY / HTTP_PROXY / ALL_PROXY，及小写形式）中 url 应使用的代理，NO_PROXY 排除时为 None"""
+    proxies = urllib.request.getproxies_environment()
+    parts = urlsplit(url)
+    proxy = proxies.get(parts.scheme) or proxies.get("all")
+    if not proxy or urllib.request.proxy_bypass_environment(parts.netloc, proxies):
+        return None
+    return proxy
+
+
+class KeepAlivePool:
+    """HTTP/1.1 keep-alive 连接池，只实现发送消息所需的部分：固定地址的 POST，响应按 Content-Length 或 chunked 读取
+
+    最多同时打开 max_connections 个连接，请求完成后连接放回池中复用（最多保留 max_keepalive 个），
+    空闲超过 keepalive_expiry 秒或已被服务端关闭（写入请求前 reader 已读到 EOF）的连接不再使用，
+    换一个连接发送。请求写出后连接才断开时无法确定服务端是否已处理，不重发（POST 不是幂等的），
+    抛出 ConnectionClosedError。HTTPS 使用 certifi 的 CA 证书（与 httpx 相同）。不支持代理（见 env_proxy）。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: dict[str, str],
+        max_connections: int,
+        max_keepalive: int,
+        keepalive_expiry: float,
+        timeout: float,
+        connect_timeout: float,
+    ):
+        parts = urlsplit(url)
+        self._host = parts.hostname
+        self._port = parts.port or (443 if parts.scheme == "https" else 80)
+        self._ssl = ssl.create_default_context(cafile=certifi.where()) if parts.scheme == "https" else None
+        host_header = parts.netloc.rsplit("@", 1)[-1]
+        # 请求行与固定的请求头只拼接一次，每个请求只补上 Content-Length
+        lines = [f"POST {parts.path or '/'} HTTP/1.1", f"Host: {host_header}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        self._head = ("\r\n".join(lines) + "\r\nContent-Length: ").encode("latin-1")
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle: deque[tuple[asyncio.StreamReader, asyncio.StreamWriter, float]] = deque()
+        self._max_keepalive = max_keepalive
+        self._keepalive_expiry = keepalive_expiry
+        self._timeout = timeout
+        self._connect_timeout = connect_timeout
+
+    async def _connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """取一个空闲连接，没有可用的时新建"""
+        now = time.monotonic()
+        while self._idle:
+            reader, writer, last_used = self._idle.pop()
+            if now - last_used < self._keepalive_expiry and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        async with asyncio.timeout(self._connect_timeout):
+            reader, writer = await asyncio.open_connection(
+                self._host, self._port, ssl=self._ssl, server_hostname=self._host if self._ssl else None
+            )
+        return reader, writer
+
+    async def post(self, body: bytes) -> tuple[int, bytes]:
+        """发送请求，返回 (状态码, 响应体)；连接或读取失败、超时时抛出 ConnectionClosedError / OSError / TimeoutError 等异常
+
+        _connect 返回后直到写出请求之间没有 await，复用的连接在写入前确认过未读到 EOF。
+        """
+        request = self._head + str(len(body)).encode() + b"\r\n\r\n" + body
+        async with self._slots:
+            reader, writer = await self._connect()
+            try:
+                async with asyncio.timeout(self._timeout):
+                    writer.write(request)
+                    status, content, keep_alive = await _read_response(reader)
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive and len(self._idle) < self._max_keepalive:
+                self._idle.append((reader, writer, time.monotonic()))
+            else:
+                writer.close()
+            return status, content
+
+    async def aclose(self) -> None:
+        while self._idle:
+            _, writer, _ = self._idle.pop()
+            writer.close()
+
+
+class ConnectionClosedError(ConnectionError):
+    """请求已写出，但连接在收到任何响应字节之前被对方关闭；服务端可能已经处理了请求"""
+
+
+async def _read_response(reader: asyncio.StreamReader) -> tuple[int, bytes, bool]:
+    """读取一个 HTTP/1.1 响应，返回 (状态码, 响应体, 连接能否复用)"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise
+        raise ConnectionClosedError("连接已被对方关闭") from None
+    except ConnectionResetError:
+        raise ConnectionClosedError("连接已被对方重置") from None
+    while True:
+        status_line, *header_lines = head[:-4].split(b"\r\n")
+        version, status, *_ = status_line.split(b" ", 2)
+        status = int(status)
+        if not 100 <= status < 200:  # 跳过 1xx 临时响应
+            break
+        head = await reader.readuntil(b"\r\n\r\n")
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(b":")
+        headers[name.strip().lower()] = value.strip().lower()
+    keep_alive = version == b"HTTP/1.1" and headers.get(b"connection") != b"close"
+
+    if status in (204, 304):
+        return status, b"", keep_alive
+    if b"chunked" in headers.get(b"transfer-encoding", b""):
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";", 1)[0], 16)
+            if size == 0:
+                # 跳过 trailer，直到空行
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                return status, b"".join(chunks), keep_alive
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+    if b"content-length" in headers:
+        return status, await reader.readexactly(int(headers[b"content-length"])), keep_alive
+    # 没有长度时读到连接关闭为止
+    return status, await reader.read(), False
+
+
+class MessageSender:
+    """整个运行期间复用同一个连接池发送消息到 Easemob API
+
+    连接建立一次后保持（keep-alive），每条消息不再重新握手 TCP / TLS；连接断开时由连接池自动重连。
+    URL、请求头和消息体中固定的部分在创建时准备好，每条消息只序列化 action。
+    HTTP/1.1 使用 KeepAlivePool，HTTP/2 或需要经过代理（env_proxy）时使用 httpx。
+    """
+
+    def __init__(self, config: dict):
+        self.url = message_url(config)
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {config['token']}",
+        }
+        payload = {
+            "target_type": "users",
+            "target": [config["target"]],
+            "msg": {
+                "type": "cmd",
+                "action": "\0",
+            },
+            "from": config["from_user"],
+            "appkey": f"{config['org']}#{config['app']}",
+            "sync_device": True,
+        }
+        # 以占位的 action 序列化一次，切成前后两段，发送时在中间拼上 action
+        prefix, suffix = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).split('"\\u0000"')
+        self._prefix = prefix.encode("utf-8")
+        self._suffix = suffix.encode("utf-8")
+        self.proxy = env_proxy(self.url)
+        if config["http2"] or self.proxy is not None:
+            self._client = httpx.AsyncClient(
+                http2=config["http2"],
+                headers=headers,
+                limits=httpx.Limits(
+                    max_connections=config["max_connections"],
+                    max_keepalive_connections=config["max_keepalive"],
+                    keepalive_expiry=config["keepalive_expiry"],
+                ),
+                timeout=httpx.Timeout(config["timeout"], connect=config["connect_timeout"]),
+            )
+            self._pool = None
+        else:
+            self._client = None
+            self._pool = KeepAlivePool(
+                self.url,
+                headers,
+                config["max_connections"],
+                config["max_keepalive"],
+                config["keepalive_expiry"],
+                config["timeout"],
+                config["connect_timeout"],
+            )
+        # 各响应实际使用的协议版本（HTTP/2 需要服务端通过 ALPN 协商同意）
+        self.http_versions: Counter[str] = Counter()
+
+    async def send(self, action: str) -> dict:
+        """发送一条消息"""
+        content = self._prefix + json.dumps(action, ensure_ascii=False).encode("utf-8") + self._suffix
+        if self._pool is not None:
+            status, body = await self._pool.post(content)
+            http_version = "HTTP/1.1"
+        else:
+            response = await self._client.post(self.url, content=content)
+            status, body, http_version = response.status_code, response.content, response.http_version
+        self.http_versions[http_version] += 1
+        return {
+            "status_code": status,
+            "response": json.loads(body) if status == 200 else body.decode("utf-8", "replace"),
+        }
+
+    async def aclose(self) -> None:
+        if self._pool is not None:
+            await self._pool.aclose()
+        else:
+            await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+
+class TokenBucket:
+    """令牌桶限速：平均每秒产生 rate 个令牌，最多积攒 burst 个；只供单个协程取用"""
+
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate * BURST_SECONDS))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+
+    async def acquire(self) -> None:
+        """取一个令牌，没有时等待到下一个令牌产生"""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+async def iter_in_thread(iterable: Iterable, maxsize: int = QUEUE_BATCHES) -> AsyncIterator:
+    """在后台线程中迭代 iterable（读取、解析），经有界队列按顺序产出到事件循环
+
+    队列满时后台线程等待；调用方提前结束迭代时，后台线程随之退出。
+    """
+    loop = asyncio.get_running_loop()
+    items: asyncio.Queue = asyncio.Queue(maxsize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        future = asyncio.run_coroutine_threadsafe(items.put(item), loop)
+        while not stop.is_set():
+            try:
+                future.result(timeout=0.1)
+                return True
+            except TimeoutError:
+                pass
+        future.cancel()
+        return False
+
+    def worker() -> None:
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(done)
+
+    thread = threading.Thread(target=worker, name="reader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = await items.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # 后台线程最多 0.1s 内发现 stop 并退出，在线程池中等待，不阻塞事件循环
+        await asyncio.to_thread(thread.join)
+
+
+# 一条消息发送完成后的回调：(行号, action, 结果, 异常, 耗时秒数)，结果与异常恰有一个为 None
+ResultCallback = Callable[[int, str, dict | None, Exception | None, float], None]
+
+
+async def send_all(
+    batches: AsyncIterator[list[tuple[int, str] | str]],
+    sender: MessageSender,
+    concurrency: int,
+    limiter: TokenBucket | None,
+    on_result: ResultCallback,
+) -> None:
+    """按顺序发出各批中的 (行号, action)，同时在途的请求最多 concurrency 条，limiter 为 None 时不限速
+
+    批中的字符串（文件标题、跳过提示等）轮到时原样打印，与发送结果保持读取时的先后顺序。
+    """
+    window = asyncio.Semaphore(concurrency)
+    tasks: set[asyncio.Task] = set()
+
+    async def send_one(line_num: int, action: str) -> None:
+        t0 = time.perf_counter()
+        try:
+            result = await sender.send(action)
+        except Exception as e:
+            on_result(line_num, action, None, e, time.perf_counter() - t0)
+        else:
+            on_result(line_num, action, result, None, time.perf_counter() - t0)
+        finally:
+            window.release()
+
+    async for batch in batches:
+        for item in batch:
+            if isinstance(item, str):
+                print(item)
+                continue
+            line_num, action = item
+            await window.acquire()
+            if limiter is not None:
+                await limiter.acquire()
+            task = asyncio.create_task(send_one(line_num, action))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
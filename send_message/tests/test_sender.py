@@ -0,0 +1,216 @@
+"""
+KeepAlivePool 的 HTTP/1.1 解析与连接复用：在同一事件循环中启动 mock_server，
+以及返回固定字节的最小服务端（chunked、1xx、无长度等 mock_server 不会产生的响应）
+
+运行: uv run python -m unittest
+"""
+
+import asyncio
+import json
+import os
+import unittest
+from unittest import mock
+
+import mock_server
+from sender import ConnectionClosedError, KeepAlivePool, env_proxy
+
+TOKEN = "test-token"
+BODY = json.dumps(
+    {"target_type": "users", "target": ["u1"], "from": "admin", "msg": {"type": "cmd", "action": "ping"}}
+).encode()
+
+
+def mock_options(**overrides) -> dict:
+    options = {
+        "token": TOKEN,
+        "latency": "0",
+        "error_rate": 0.0,
+        "throttle_rate": 0.0,
+        "rate_limit": 0.0,
+        "retry_after": 1,
+        "drop_rate": 0.0,
+        "log": None,
+        "workers": 1,
+    }
+    options.update(overrides)
+    return options
+
+
+def make_pool(port: int, token: str = TOKEN) -> KeepAlivePool:
+    return KeepAlivePool(
+        f"http://127.0.0.1:{port}/org/app/messages",
+        {"Content-Type": "application/json", "Authorization": f"Bearer {token}"},
+        max_connections=4,
+        max_keepalive=4,
+        keepalive_expiry=30,
+        timeout=5,
+        connect_timeout=5,
+    )
+
+
+class MockServerTest(unittest.IsolatedAsyncioTestCase):
+    """对 mock_server 发送请求：正常响应、错误状态码、429 限流与连接中断"""
+
+    async def start(self, **overrides) -> KeepAlivePool:
+        self.server = mock_server.MockServer(mock_options(**overrides))
+        self.protocols: list[mock_server.MockProtocol] = []
+
+        def factory():
+            protocol = mock_server.MockProtocol(self.server)
+            self.protocols.append(protocol)
+            return protocol
+
+        listener = await asyncio.get_running_loop().create_server(factory, "127.0.0.1", 0)
+        self.addAsyncCleanup(listener.wait_closed)
+        self.addCleanup(listener.close)
+        pool = make_pool(listener.sockets[0].getsockname()[1])
+        self.addAsyncCleanup(pool.aclose)
+        return pool
+
+    async def test_success_reuses_connection(self):
+        pool = await self.start()
+        for _ in range(3):
+            status, content = await pool.post(BODY)
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(content)["data"], {"u1": mock.ANY})
+        self.assertEqual(len(self.protocols), 1)
+        self.assertEqual(self.server.statuses["200"], 3)
+
+    async def test_error_status_and_body(self):
+        pool = await self.start()
+        status, content = await pool.post(b"{}")
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(content)["error"], "illegal_argument")
+        # 400 之后连接仍可复用
+        status, _ = await pool.post(BODY)
+        self.assertEqual(status, 200)
+        self.assertEqual(len(self.protocols), 1)
+
+    async def test_unauthorized(self):
+        pool = await self.start(token="other")
+        status, content = await pool.post(BODY)
+        self.assertEqual(status, 401)
+        self.assertEqual(json.loads(content)["error"], "unauthorized")
+
+    async def test_rate_limited(self):
+        pool = await self.start(throttle_rate=1.0, retry_after=3)
+        status, content = await pool.post(BODY)
+        self.assertEqual(status, 429)
+        self.assertEqual(json.loads(content)["error"], "resource_limited")
+        self.assertEqual(self.server.statuses["429"], 1)
+
+    async def test_drop_is_not_resent(self):
+        pool = await self.start(drop_rate=1.0)
+        with self.assertRaises(ConnectionClosedError):
+            await pool.post(BODY)
+        self.assertEqual(self.server.total, 1)
+
+    async def test_drop_on_reused_connection_is_not_resent(self):
+        pool = await self.start()
+        status, _ = await pool.post(BODY)
+        self.assertEqual(status, 200)
+        # 连接已复用过一次之后，服务端在处理下一个请求时断开：请求已写出，不能重发
+        self.server.drop_rate = 1.0
+        with self.assertRaises(ConnectionClosedError):
+            await pool.post(BODY)
+        self.assertEqual(self.server.total, 2)
+        self.assertEqual(self.server.statuses["dropped"], 1)
+
+    async def test_non_utf8_path(self):
+        await self.start()
+        headers = {b"authorization": f"Bearer {TOKEN}".encode()}
+        status, body, _ = self.server.handle(b"POST", b"/\xff\xfe/app/messages", headers, BODY)
+        self.assertEqual((status, body["organization"]), (200, "\ufffd\ufffd"))
+
+    async def test_idle_connection_closed_by_server(self):
+        pool = await self.start()
+        await pool.post(BODY)
+        # 服务端关闭空闲连接，客户端读到 EOF 后再发送：请求尚未写出，换一个新连接
+        self.protocols[0].transport.close()
+        await asyncio.sleep(0.05)
+        status, _ = await pool.post(BODY)
+        self.assertEqual(status, 200)
+        self.assertEqual(len(self.protocols), 2)
+        self.assertEqual(self.server.total, 2)
+
+
+class RawResponseTest(unittest.IsolatedAsyncioTestCase):
+    """最小服务端读完请求后原样写回 response，用于覆盖 mock_server 不产生的响应格式"""
+
+    async def post(self, response: bytes, close: bool = False) -> tuple[int, bytes, int]:
+        """返回 (状态码, 响应体, 请求之后连接池中的空闲连接数)"""
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = next(
+                int(line.split(b":", 1)[1]) for line in head.split(b"\r\n") if line.lower().startswith(b"content-length:")
+            )
+            await reader.readexactly(length)
+            writer.write(response)
+            await writer.drain()
+            if not close:
+                # 保持连接，直到客户端（连接池 aclose）断开
+                await reader.read()
+            writer.close()
+
+        listener = await asyncio.start_server(handle, "127.0.0.1", 0)
+        self.addAsyncCleanup(listener.wait_closed)
+        self.addCleanup(listener.close)
+        pool = make_pool(listener.sockets[0].getsockname()[1])
+        self.addAsyncCleanup(pool.aclose)
+        status, content = await pool.post(BODY)
+        return status, content, len(pool._idle)
+
+    async def test_content_length(self):
+        response = b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 11\r\n\r\n{\"ok\":true}"
+        self.assertEqual(await self.post(response), (200, b'{"ok":true}', 1))
+
+    async def test_chunked_with_extension_and_trailer(self):
+        response = (
+            b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"5;ext=1\r\nhello\r\n"
+            b"6\r\n world\r\n"
+            b"0\r\nX-Trailer: 1\r\n\r\n"
+        )
+        self.assertEqual(await self.post(response), (200, b"hello world", 1))
+
+    async def test_informational_response_skipped(self):
+        response = b"HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 429 Too Many Requests\r\nRetry-After: 1\r\nContent-Length: 2\r\n\r\n{}"
+        self.assertEqual(await self.post(response), (429, b"{}", 1))
+
+    async def test_connection_close_not_pooled(self):
+        response = b"HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Length: 2\r\n\r\n{}"
+        self.assertEqual(await self.post(response, close=True), (200, b"{}", 0))
+
+    async def test_http10_not_pooled(self):
+        response = b"HTTP/1.0 200 OK\r\nContent-Length: 2\r\n\r\n{}"
+        self.assertEqual(await self.post(response, close=True), (200, b"{}", 0))
+
+    async def test_no_length_reads_until_close(self):
+        response = b"HTTP/1.1 200 OK\r\n\r\n{\"a\":1}"
+        self.assertEqual(await self.post(response, close=True), (200, b'{"a":1}', 0))
+
+    async def test_no_content(self):
+        response = b"HTTP/1.1 204 No Content\r\n\r\n"
+        self.assertEqual(await self.post(response), (204, b"", 1))
+
+
+class EnvProxyTest(unittest.TestCase):
+    URL = "https://a1.easemob.com/org/app/messages"
+
+    def test_https_proxy(self):
+        with mock.patch.dict(os.environ, {"HTTPS_PROXY": "http://proxy:3128"}, clear=True):
+            self.assertEqual(env_proxy(self.URL), "http://proxy:3128")
+
+    def test_no_proxy(self):
+        env = {"HTTPS_PROXY": "http://proxy:3128", "NO_PROXY": "easemob.com"}
+        with mock.patch.dict(os.environ, env, clear=True):
+            self.assertIsNone(env_proxy(self.URL))
+
+    def test_scheme_mismatch(self):
+        with mock.patch.dict(os.environ, {"HTTP_PROXY": "http://proxy:3128"}, clear=True):
+            self.assertIsNone(env_proxy(self.URL))
+
+
+if __name__ == "__main__":
+    unittest.main()